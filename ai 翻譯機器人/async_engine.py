@@ -0,0 +1,152 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+
+class AsyncBpmfEngine:
+    """ BpmfEngine 的非同步外觀：讀取走小型執行緒池，寫入由單一 writer 任務依序執行 """
+
+    def __init__(self, engine, readers=4):
+        self.engine = engine
+        self._readers = ThreadPoolExecutor(max_workers=readers, thread_name_prefix='bpmf-reader')
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='bpmf-writer')
+        self._queue = None
+        self._writer_task = None
+
+    async def start(self):
+        """ 啟動 writer 任務，需在事件迴圈內呼叫 """
+        if self._writer_task is None:
+            self._queue = asyncio.Queue()
+            self._writer_task = asyncio.create_task(self._writer_loop())
+
+    async def close(self, close_engine=True):
+        """ 等待排隊中的寫入完成後關閉 """
+        if self._writer_task is not None:
+            await self._queue.put(None)
+            await self._writer_task
+            self._writer_task = None
+        self._readers.shutdown(wait=True)
+        self._writer.shutdown(wait=True)
+        if close_engine:
+            self.engine.close()
+
+    async def _writer_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await self._queue.get()
+            if job is None:
+                break
+            func, future = job
+            try:
+                result = await loop.run_in_executor(self._writer, func)
+            except Exception as e:
+                if not future.cancelled():
+                    future.set_exception(e)
+            else:
+                if not future.cancelled():
+                    future.set_result(result)
+
+    async def _read(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._readers, partial(func, *args))
+
+    async def _write(self, func, *args):
+        if self._writer_task is None:
+            await self.start()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((partial(func, *args), future))
+        return await future
+
+    # --- 純記憶體操作，直接在事件迴圈上執行 ---
+    def segment(self, text):
+        return self.engine.segment(text)
+
+    def cache_stats(self):
+        stats = self.engine.cache_stats()
+        stats['writer_queue'] = self._queue.qsize() if self._queue is not None else 0
+        return stats
+
+    # --- 讀取 ---
+    async def convert(self, bopomofo_segs, guild_id=0):
+        return await self._read(self.engine.convert, bopomofo_segs, guild_id)
+
+    async def decode(self, bopomofo_segs, k=3, guild_id=0, session=None):
+        return await self._read(self.engine.decode, bopomofo_segs, k, guild_id, session)
+
+    async def convert_batch(self, segs_list, guild_id=0):
+        """ 一次翻譯一批，回傳 [(輸入位置, 翻譯)] """
+        return await self._read(self._convert_list, segs_list, guild_id)
+
+    def _convert_list(self, segs_list, guild_id):
+        return list(self.engine.convert_many(segs_list, guild_id))
+
+    async def convert_many(self, segs_list, guild_id=0, chunk_size=64):
+        """ 串流翻譯：每 chunk_size 筆送進讀取執行緒一次，大批次也不會長時間佔住執行緒池 """
+        for start in range(0, len(segs_list), chunk_size):
+            for i, text in await self.convert_batch(segs_list[start:start + chunk_size], guild_id):
+                yield start + i, text
+
+    async def get_candidates(self, bpmf, guild_id=0):
+        return await self._read(self.engine.get_candidates, bpmf, guild_id)
+
+    async def complete(self, prefix, limit=25, guild_id=0):
+        return await self._read(self.engine.complete, prefix, limit, guild_id)
+
+    async def is_ignored(self, content, guild_id=0):
+        return await self._read(self.engine.is_ignored, content, guild_id)
+
+    async def ignored_spans(self, content, guild_id=0):
+        return await self._read(self.engine.ignored_spans, content, guild_id)
+
+    async def list_ignore_patterns(self, guild_id=0):
+        return await self._read(self.engine.list_ignore_patterns, guild_id)
+
+    async def get_backfill_progress(self, channel_id):
+        return await self._read(self.engine.get_backfill_progress, channel_id)
+
+    # --- 寫入 ---
+    async def add_word(self, word, bpmf_list, guild_id=0):
+        return await self._write(self.engine.add_word, word, bpmf_list, guild_id)
+
+    async def delete_word(self, word, bpmf, guild_id=0):
+        return await self._write(self.engine.delete_word, word, bpmf, guild_id)
+
+    async def increase_weight(self, word, bpmf, guild_id=0):
+        return await self._write(self.engine.increase_weight, word, bpmf, guild_id)
+
+    async def decrease_weight(self, word, bpmf, guild_id=0):
+        return await self._write(self.engine.decrease_weight, word, bpmf, guild_id)
+
+    async def add_ignore_pattern(self, pattern, guild_id=0):
+        return await self._write(self.engine.add_ignore_pattern, pattern, guild_id)
+
+    async def remove_ignore_pattern(self, pattern, guild_id=0):
+        return await self._write(self.engine.remove_ignore_pattern, pattern, guild_id)
+
+    async def save_backfill_progress(self, channel_id, before_id, scanned, replied=()):
+        return await self._write(self.engine.save_backfill_progress, channel_id, before_id, scanned, replied)
+
+    # --- 定期維護：每次只交給寫入任務一小批，其他寫入可以插隊 ---
+    async def get_meta(self, key, default=0):
+        return await self._read(self.engine.get_meta, key, default)
+
+    async def set_meta(self, key, value):
+        return await self._write(self.engine.set_meta, key, value)
+
+    async def flush(self):
+        return await self._write(self.engine.flush)
+
+    async def decay_batch(self, after_rowid, factor, threshold, batch_size=2000):
+        return await self._write(self.engine.decay_batch, after_rowid, factor, threshold, batch_size)
+
+    async def decay_guild_batch(self, after_rowid, factor, threshold, batch_size=2000):
+        return await self._write(self.engine.decay_guild_batch, after_rowid, factor, threshold, batch_size)
+
+    async def trim_journal(self, batch_size=5000):
+        return await self._write(self.engine.trim_journal, batch_size)
+
+    async def incremental_vacuum(self, pages=200):
+        return await self._write(self.engine.incremental_vacuum, pages)
+
+    async def analyze(self, table, limit=1000):
+        return await self._write(self.engine.analyze, table, limit)
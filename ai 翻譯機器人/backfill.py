@@ -0,0 +1,85 @@
+"""
+頻道歷史回補：往前掃描頻道訊息，找出機器人沒有回覆到的亂碼 (例如機器人離線期間)
+
+只依賴 discord.py 訊息物件的屬性 (id、author、content、reference)，不直接 import discord。
+每頁掃描完就記錄進度 (連同還沒掃描到的回覆標記)，中斷後再執行會從上次停下的地方繼續往前。
+"""
+import asyncio
+
+from message_burst import MAX_DELAY
+from message_pipeline import detect_scramble, has_chinese
+
+PAGE_SIZE = 100     # Discord 歷史 API 每次最多 100 則
+PAGE_DELAY = 1.0    # 每頁之間的間隔 (秒)，避免和即時訊息搶 API 額度
+
+
+class _Before:
+    """ history(before=...) 只需要有 id 屬性的物件 """
+
+    def __init__(self, id):
+        self.id = id
+
+
+def burst_floor(message_id, span=MAX_DELAY):
+    """ 與 message_id 合併成同一則回覆的訊息最小可能的 id (Discord id 的高位是毫秒時間戳記) """
+    return max(0, (message_id >> 22) - int(span * 1000)) << 22
+
+
+async def backfill_channel(engine, classifier, channel, bot_user_id, guild_id=0, limit=1000,
+                           restart=False, page_size=PAGE_SIZE, page_delay=PAGE_DELAY):
+    """ 掃描最多 limit 則訊息，回傳 (漏翻的 [(message, 翻譯)], 本次掃描數, 是否已到頻道開頭) """
+    if restart:
+        await engine.save_backfill_progress(channel.id, None, 0)
+    progress = await engine.get_backfill_progress(channel.id)
+    before = _Before(progress[0]) if progress else None
+    total_scanned = progress[1] if progress else 0
+    markers = progress[2] if progress else []
+
+    # 機器人回覆過的訊息 id；回覆比原訊息新，由新往舊掃描時會先看到
+    replied = {message_id for message_id, author_id in markers if not author_id}
+    # 作者 id -> 合併訊息範圍的下限：回覆只指向合併的最後一則，同一作者稍早的幾則也算回覆過
+    bursts = {author_id: message_id for message_id, author_id in markers if author_id}
+    missed, scanned = [], 0
+    while scanned < limit:
+        page = [message async for message in channel.history(limit=min(page_size, limit - scanned), before=before)]
+        if not page:
+            return missed, scanned, True
+
+        candidates = []
+        for message in page:
+            if message.author.id == bot_user_id:
+                if message.reference is not None and message.reference.message_id:
+                    replied.add(message.reference.message_id)
+                continue
+            if message.author.bot:
+                continue
+            if message.id in replied:
+                bursts[message.author.id] = burst_floor(message.id)
+                continue
+            floor = bursts.get(message.author.id)
+            if floor is not None and message.id >= floor:
+                continue
+            # 中英混雜的訊息每個亂碼片段各一筆，翻譯後再依訊息接回
+            parts = await detect_scramble(engine, classifier, message.content.strip(), guild_id)
+            if parts:
+                candidates += [(message, segs) for segs in parts]
+
+        if candidates:
+            texts = [None] * len(candidates)
+            async for i, text in engine.convert_many([segs for _, segs in candidates], guild_id):
+                texts[i] = text
+            translated = {}
+            for (message, _), text in zip(candidates, texts):
+                if has_chinese(text):
+                    translated.setdefault(message.id, (message, []))[1].append(text)
+            missed += [(message, "".join(found)) for message, found in translated.values()]
+
+        scanned += len(page)
+        total_scanned += len(page)
+        before = page[-1]  # history 預設由新到舊，最後一則是這頁最舊的
+        # 只保留還沒掃描到的部分
+        markers = [(message_id, 0) for message_id in replied if message_id < before.id]
+        markers += [(floor, author_id) for author_id, floor in bursts.items() if floor < before.id]
+        await engine.save_backfill_progress(channel.id, before.id, total_scanned, markers)
+        await asyncio.sleep(page_delay)
+    return missed, scanned, False
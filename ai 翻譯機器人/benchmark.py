@@ -0,0 +1,225 @@
+"""
+離線效能測試 (不需要連線 Discord)
+
+以合成字典與合成亂碼測量切字、翻譯、忽略比對與 on_message 流程的吞吐量與延遲：
+    python benchmark.py --sizes 1000,100000,1000000 --messages 5000 --out bench.json
+加上 --service 會另外測量分片模式：on_message 經由 Unix socket 呼叫 engine_service。
+結果輸出為 JSON，可用來比較不同版本。
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import sqlite3
+import tempfile
+import time
+
+from async_engine import AsyncBpmfEngine
+from bpmf_classifier import ScrambleClassifier
+from bpmf_converter import bopomofo_to_ascii
+from bpmf_decoder import decode_lattice
+from bpmf_segmenter import segment_ascii
+from bpmf_syllables import SYLLABLES
+from engine_service import EngineClient, EngineServer
+from local_engine import BpmfEngine
+from message_pipeline import translate_message
+
+_SYLLABLES = sorted(SYLLABLES)
+_TONES = ("ˉ", "ˊ", "ˇ", "ˋ", "˙")
+# 詞長 (音節數) 分布：單字與雙字詞為主
+_WORD_LENGTHS = (1, 1, 1, 1, 2, 2, 2, 2, 3, 4)
+
+# 一般聊天訊息，用來測量過濾器在 on_message 中的效果
+_NOISE = [
+    "lol", "ok see you tomorrow", "https://example.com/watch?v=abc123",
+    "print(x + 1)", "2024-01-01 12:00", "gg", "i'm going home", "100%",
+]
+
+
+def make_lexicon(size, rng):
+    """ 產生 size 筆 (注音音節列表, 詞, 權重)，注音含聲調 """
+    lexicon, seen = [], set()
+    while len(lexicon) < size:
+        length = rng.choice(_WORD_LENGTHS)
+        syllables = [rng.choice(_SYLLABLES) + rng.choice(_TONES) for _ in range(length)]
+        word = "".join(chr(0x4e00 + rng.randrange(20000)) for _ in range(length))
+        key = ("".join(s.replace('ˉ', '') for s in syllables), word)
+        if key in seen:
+            continue
+        seen.add(key)
+        lexicon.append((syllables, word, rng.randrange(1, 1000000)))
+    return lexicon
+
+
+def make_corpus(lexicon, count, rng, noise_ratio=0.2):
+    """ 由字典詞條反推鍵盤輸入，組成 1~6 個詞的亂碼訊息 """
+    corpus = []
+    for _ in range(count):
+        if rng.random() < noise_ratio:
+            corpus.append(rng.choice(_NOISE))
+            continue
+        syllables = []
+        for _ in range(rng.randint(1, 6)):
+            syllables.extend(rng.choice(lexicon)[0])
+        corpus.append("".join(bopomofo_to_ascii(s) for s in syllables).strip())
+    return corpus
+
+
+def build_db(path, lexicon, ignore_count, rng):
+    conn = sqlite3.connect(path)
+    BpmfEngine.init_schema(conn)
+    conn.executemany(
+        "INSERT OR IGNORE INTO dictionary (bpmf, word, freq, is_custom) VALUES (?, ?, ?, 0)",
+        (("".join(s.replace('ˉ', '') for s in syllables), word, freq) for syllables, word, freq in lexicon)
+    )
+    patterns = set()
+    while len(patterns) < ignore_count:
+        name = "".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(rng.randint(3, 8)))
+        patterns.add(name + "*" if rng.random() < 0.2 else name)
+    conn.executemany("INSERT OR IGNORE INTO ignore_patterns (guild_id, pattern) VALUES (0, ?)", ((p,) for p in patterns))
+    conn.commit()
+    conn.close()
+
+
+def summarize(samples_ns):
+    """ 由每次呼叫的耗時 (ns) 計算吞吐量與 p50/p95/p99 (微秒) """
+    samples = sorted(samples_ns)
+    total = sum(samples)
+
+    def pct(p):
+        return samples[min(len(samples) - 1, int(len(samples) * p))] / 1000
+
+    return {
+        'count': len(samples),
+        'ops_per_sec': len(samples) / (total / 1e9) if total else 0.0,
+        'p50_us': pct(0.50),
+        'p95_us': pct(0.95),
+        'p99_us': pct(0.99),
+    }
+
+
+def measure(func, inputs):
+    timer = time.perf_counter_ns
+    samples = []
+    for item in inputs:
+        start = timer()
+        func(item)
+        samples.append(timer() - start)
+    return summarize(samples)
+
+
+class StubMessage:
+    """ 模擬 discord.Message，只記錄回覆次數 """
+
+    def __init__(self, content):
+        self.content = content
+        self.guild = None
+        self.replies = 0
+
+    async def reply(self, **kwargs):
+        self.replies += 1
+
+
+async def on_message(engine, classifier, message):
+    """ 與 bot.on_message 相同的流程，回覆改由 StubMessage 接收 """
+    content = message.content.strip()
+    translation = await translate_message(engine, classifier, content, 0)
+    if translation is not None:
+        await message.reply(content=translation[1])
+
+
+async def measure_on_message(engine, corpus, socket_path=None):
+    """ socket_path 有值時，on_message 改用 EngineClient 經字典服務查詢 (與分片行程相同) """
+    facade = AsyncBpmfEngine(engine)
+    await facade.start()
+    server = client = None
+    if socket_path:
+        server = EngineServer(facade, socket_path)
+        await server.start()
+        client = EngineClient(socket_path)
+        await client.start()
+    classifier = ScrambleClassifier()
+    timer = time.perf_counter_ns
+    samples, replies = [], 0
+    for content in corpus:
+        message = StubMessage(content)
+        start = timer()
+        await on_message(client or facade, classifier, message)
+        samples.append(timer() - start)
+        replies += message.replies
+    if server is not None:
+        await client.close()
+        await server.close()
+    await facade.close(close_engine=False)
+    result = summarize(samples)
+    result['replies'] = replies
+    result['rejection_rate'] = classifier.rejection_rate
+    return result
+
+
+def run_size(size, args, rng, workdir):
+    lexicon = make_lexicon(size, rng)
+    corpus = make_corpus(lexicon, args.messages, rng)
+    scrambles = [c for c in corpus if c not in _NOISE]
+    db_path = os.path.join(workdir, f"bench_{size}.db")
+    build_db(db_path, lexicon, args.ignores, rng)
+
+    start = time.perf_counter()
+    engine = BpmfEngine(db_path, flush_interval=3600)
+    load_seconds = time.perf_counter() - start
+
+    segments = [segment_ascii(c)[1] for c in scrambles]
+    results = {
+        'segment_ascii': measure(segment_ascii, scrambles),
+        'convert_uncached': measure(lambda segs: decode_lattice(engine.index, segs, 1, toneless=engine.toneless), segments),
+        'convert': measure(engine.convert, segments),
+        'is_ignored': measure(lambda c: engine.ignored_spans(c), corpus),
+        'on_message': asyncio.run(measure_on_message(engine, corpus)),
+    }
+    if args.service:
+        socket_path = os.path.join(workdir, 'engine.sock')
+        results['on_message_service'] = asyncio.run(measure_on_message(engine, corpus, socket_path))
+    engine.close()
+    return {'dict_size': size, 'load_seconds': load_seconds, 'results': results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="注音亂碼機器人離線效能測試")
+    parser.add_argument('--sizes', default='1000,10000,100000', help="字典大小，逗號分隔 (例: 1000,1000000)")
+    parser.add_argument('--messages', type=int, default=2000, help="每種大小的合成訊息數")
+    parser.add_argument('--ignores', type=int, default=1000, help="忽略模式數量")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--service', action='store_true', help="另外測量經由 engine_service 的 on_message")
+    parser.add_argument('--out', default='bench.json', help="JSON 結果輸出路徑")
+    args = parser.parse_args()
+
+    report = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'seed': args.seed,
+            'messages': args.messages,
+            'ignores': args.ignores,
+        },
+        'runs': [],
+    }
+    with tempfile.TemporaryDirectory() as workdir:
+        for size in (int(s) for s in args.sizes.split(',')):
+            rng = random.Random(args.seed)
+            run = run_size(size, args, rng, workdir)
+            report['runs'].append(run)
+            print(f"📊 字典 {size} 筆：載入 {run['load_seconds']:.2f}s")
+            for name, stats in run['results'].items():
+                print(f"   {name:<18} {stats['ops_per_sec']:>12.0f} ops/s  "
+                      f"p50 {stats['p50_us']:.1f}µs  p95 {stats['p95_us']:.1f}µs  p99 {stats['p99_us']:.1f}µs")
+
+    with open(args.out, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"✅ 結果已寫入 {args.out}")
+
+
+if __name__ == "__main__":
+    main()
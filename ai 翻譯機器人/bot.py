@@ -2,38 +2,141 @@ import discord
 from discord.ext import commands
 from discord import app_commands
 from discord.ui import Modal, TextInput, View, Button
-import re
+import asyncio
+import glob
+import os
+import signal
+import time
 from config import DISCORD_TOKEN
 from local_engine import BpmfEngine
-from bpmf_converter import is_bopomofo_scramble
-from bpmf_segmenter import segment_ascii
+from async_engine import AsyncBpmfEngine
+from engine_service import EngineClient
+from bpmf_classifier import ScrambleClassifier
+from translation_cache import LRUCache
+from message_pipeline import translate_message, prefilter, has_chinese
+from message_burst import Burst, BurstCoalescer, MAX_DELAY
+from ignore_matcher import unescape_pattern
+from bpmf_converter import ascii_to_bopomofo
+from bpmf_segmenter import key_to_ascii
+from metrics import metrics, serve_metrics, register_engine_gauges, SlowMessageSampler
+from backfill import backfill_channel
+from dict_maintenance import maintenance_loop
+
+try:
+    from config import SCRAMBLE_THRESHOLD
+except ImportError:
+    SCRAMBLE_THRESHOLD = 0.8  # 合法音節字元比例低於此值就不查字典
+try:
+    from config import METRICS_PORT
+except ImportError:
+    METRICS_PORT = None  # 設定後在 127.0.0.1 提供 Prometheus 計量 (分片 i 使用 METRICS_PORT + i)
+try:
+    from config import SLOW_MESSAGE_MS
+except ImportError:
+    SLOW_MESSAGE_MS = None  # 設定後取樣分析並印出處理超過此毫秒數的訊息
+try:
+    from config import BURST_WINDOW
+except ImportError:
+    BURST_WINDOW = 0.6  # 同一作者連續訊息的合併等待秒數 (0 = 不等待，同一輪事件迴圈內的才合併)
+
+# 分片模式由 engine_service.py --shards 以環境變數傳入，單一行程執行時三者皆未設定
+SHARD_ID = os.environ.get('BPMF_SHARD_ID')
+SHARD_COUNT = int(os.environ.get('BPMF_SHARD_COUNT', '1'))
+ENGINE_SOCKET = os.environ.get('BPMF_ENGINE_SOCKET')
+
+# 初始化 SQL 引擎 (所有查詢與寫入都不在事件迴圈上執行)
+if ENGINE_SOCKET:
+    engine = EngineClient(ENGINE_SOCKET)  # 分片行程共用 engine_service 的字典
+else:
+    engine = AsyncBpmfEngine(BpmfEngine('dictionary.db', snapshot_path='dictionary.snap'))
+classifier = ScrambleClassifier(SCRAMBLE_THRESHOLD)
+sampler = SlowMessageSampler(SLOW_MESSAGE_MS / 1000) if SLOW_MESSAGE_MS else None
+maintenance = None  # 字典定期維護任務 (分片模式由字典服務負責)
+bursts = LRUCache(4096)  # 訊息 id -> Burst，訊息被編輯時找回原本的回覆
+if SHARD_ID is not None:
+    bot = commands.Bot(command_prefix="!", intents=discord.Intents.all(),
+                       shard_id=int(SHARD_ID), shard_count=SHARD_COUNT)
+else:
+    bot = commands.Bot(command_prefix="!", intents=discord.Intents.all())
 
-# 初始化 SQL 引擎
-engine = BpmfEngine('dictionary.db')
-bot = commands.Bot(command_prefix="!", intents=discord.Intents.all())
+@bot.event
+async def setup_hook():
+    global maintenance
+    bot.add_dynamic_items(TranslationButton)
+    await engine.start()
+    if not ENGINE_SOCKET:
+        maintenance = asyncio.create_task(maintenance_loop(engine))
+    register_engine_gauges(engine)
+    if METRICS_PORT:
+        await serve_metrics(METRICS_PORT + int(SHARD_ID or 0))
+    if sampler is not None:
+        sampler.start()
 
 @bot.event
 async def on_ready():
-    print(f"✅ {bot.user} 已上線 (SQL 模式)")
+    if SHARD_ID is not None:
+        print(f"✅ {bot.user} 分片 {SHARD_ID}/{SHARD_COUNT} 已上線")
+    else:
+        print(f"✅ {bot.user} 已上線 (SQL 模式)")
 
 @bot.command()
 async def synccommands(ctx):
     await bot.tree.sync()
     await ctx.send("♻️ 指令同步完成")
 
+@bot.command()
+async def filterstats(ctx):
+    stats = classifier.stats()
+    await ctx.send(f"🧮 已檢查 {stats['checked']} 則，過濾 {stats['rejected']} 則 (過濾率 {stats['rejection_rate']:.1%})")
+
+# --- 自動完成：亂碼與中文參數的建議 (全部查記憶體索引) ---
+async def scramble_autocomplete(interaction: discord.Interaction, current: str):
+    prefix = ascii_to_bopomofo(current.strip())
+    if not prefix:
+        return []
+    suggestions = await engine.complete(prefix, 25, interaction.guild_id or 0)
+    choices = []
+    for bpmf, word, freq in suggestions:
+        scramble = key_to_ascii(bpmf)
+        choices.append(app_commands.Choice(name=f"{scramble} → {word} ({freq}分)"[:100], value=scramble[:100]))
+    return choices
+
+async def candidate_autocomplete(interaction: discord.Interaction, current: str):
+    """ /forget 的中文參數：列出已輸入亂碼目前的候選字 """
+    scramble = getattr(interaction.namespace, 'scramble', None)
+    if not scramble:
+        return []
+    _, bopomofo_segs = engine.segment(scramble)
+    candidates = await engine.get_candidates("".join(bopomofo_segs), interaction.guild_id or 0)
+    return [app_commands.Choice(name=f"{word} ({freq}分)", value=word)
+            for word, freq in candidates if word.startswith(current)]
+
+async def translation_autocomplete(interaction: discord.Interaction, current: str):
+    """ /add 的中文參數：列出已輸入亂碼目前的翻譯結果，方便在上面修改 """
+    scramble = getattr(interaction.namespace, 'scramble', None)
+    if not scramble:
+        return []
+    _, bopomofo_segs = engine.segment(scramble)
+    if not bopomofo_segs:
+        return []
+    results = await engine.decode(bopomofo_segs, 5, interaction.guild_id or 0)
+    return [app_commands.Choice(name=text, value=text)
+            for text, _, _ in results if has_chinese(text) and text.startswith(current)]
+
 @bot.tree.command(name="add", description="輸入亂碼與中文，自動進行單字分類")
 @app_commands.describe(scramble="亂碼 (例: ru8 cl3)", word="中文)")
+@app_commands.autocomplete(scramble=scramble_autocomplete, word=translation_autocomplete)
 async def add(interaction: discord.Interaction, scramble: str, word: str):
-    _, bopomofo_segs = segment_ascii(scramble)
+    _, bopomofo_segs = engine.segment(scramble)
 
     if not bopomofo_segs or len(bopomofo_segs) != len(word):
         await interaction.response.send_message(f"❌ 字數不符！亂碼拆出 {len(bopomofo_segs)} 個音，但你給了 {len(word)} 個字。")
         return
 
-    if engine.add_word(word, bopomofo_segs):
+    if await engine.add_word(word, bopomofo_segs, interaction.guild_id or 0):
         embed = discord.Embed(
             title="🧠 已學習新詞",
-            description=f"之後遇到 `{scramble}` 會翻譯成 {word}",
+            description=f"之後在這個伺服器遇到 `{scramble}` 會翻譯成 {word}",
             color=discord.Color.green()
         )
         embed.add_field(name="亂碼", value=scramble, inline=False)
@@ -47,43 +150,192 @@ async def on_message(message):
     if message.author == bot.user: return
     await bot.process_commands(message)
 
-    content = message.content.strip()
-    # 智慧過濾：只有真正的純英文單詞（不含數字）才不翻
-    if re.fullmatch(r'[A-Za-z\s]+', content) and not any(char.isdigit() for char in content):
+    # 同一作者在同一頻道的連續亂碼先等一下，合併成一次翻譯、一則回覆
+    key = (message.channel.id, message.author.id)
+    reason = prefilter(message.content.strip())
+    if reason is not None:
+        metrics.inc('bpmf_messages_total', result=reason)
+        coalescer.flush(key)  # 中間夾了一般訊息，前面的亂碼不再等待
         return
+    coalescer.submit(key, message)
 
-    # 檢查是否在忽略列表中
-    if engine.is_ignored(content.lower()):
-        return
+async def handle_burst(key, messages):
+    burst = Burst(messages)
+    for message in messages:
+        bursts.put(message.id, burst)
+    if len(messages) > 1:
+        metrics.inc('bpmf_burst_merged_total', len(messages) - 1)
+    await translate_burst(burst)
+
+coalescer = BurstCoalescer(handle_burst, BURST_WINDOW)
 
-    if is_bopomofo_scramble(content) and len(content) >= 1:
-        _, bopomofo_segs = segment_ascii(content)
-        final_text = engine.convert(bopomofo_segs)
+@bot.event
+async def on_message_edit(before, after):
+    # 嵌入預覽載入等內容沒變的編輯不處理
+    if after.author == bot.user or before.content == after.content:
+        return
+    key = (after.channel.id, after.author.id)
+    if coalescer.replace(key, after):
+        return  # 還在等待合併，翻譯時直接用新內容
+
+    burst = bursts.get(after.id)
+    if burst is None:
+        # 沒有處理紀錄：剛送出不久 (原本被過濾掉的訊息改成亂碼) 才當成新訊息，
+        # 更早的訊息 (太久以前、重新啟動過或原本就不需要翻譯) 不在編輯後突然冒出新回覆
+        age = (discord.utils.utcnow() - after.created_at).total_seconds()
+        if age <= MAX_DELAY and prefilter(after.content.strip()) is None:
+            await handle_burst(key, [after])
+        return
+    burst.replace(after)
+    metrics.inc('bpmf_edit_retranslations_total')
+    await translate_burst(burst)
+
+async def translate_burst(burst):
+    """ 翻譯一組訊息並回覆；已經回覆過就修改原本的回覆，不再需要翻譯時刪除回覆 """
+    async with burst.lock:
+        message = burst.messages[-1]
+        content = burst.content
+        guild_id = message.guild.id if message.guild else 0
+        start = time.perf_counter()
+        try:
+            translation = await translate_message(engine, classifier, content, guild_id, burst.session)
+            if translation is None:
+                if burst.reply is not None:
+                    with metrics.timer('bpmf_stage_seconds', stage='reply'):
+                        await burst.reply.delete()
+                    burst.reply = None
+                return
 
-        # 只要結果包含中文字就回覆
-        if any('\u4e00' <= char <= '\u9fff' for char in final_text):
             embed = discord.Embed(
                 title="🔍 翻譯結果",
                 color=discord.Color.blue()
             )
-            embed.add_field(name="誤輸入", value=content, inline=False)
-            embed.add_field(name="實際意思", value=final_text, inline=False)
+            # 按鈕從「誤輸入」與「實際意思」讀回狀態，混雜訊息只放亂碼片段
+            embed.add_field(name="誤輸入", value=translation.scramble, inline=False)
+            embed.add_field(name="實際意思", value=translation.text, inline=False)
+            if translation.sentence is not None:
+                embed.add_field(name="整句", value=translation.sentence, inline=False)
+            if translation.alternatives:
+                embed.add_field(name="其他可能", value="\n".join(translation.alternatives), inline=False)
+
+            view = TranslationView(message.author.id)
+            with metrics.timer('bpmf_stage_seconds', stage='reply'):
+                if burst.reply is not None:
+                    await burst.reply.edit(embed=embed, view=view)
+                else:
+                    burst.reply = await message.reply(embed=embed, view=view)
+        except discord.NotFound:
+            burst.reply = None  # 回覆或原訊息已被刪除
+        except Exception as e:
+            print(f"❌ 翻譯訊息 {message.id} 失敗: {type(e).__name__}: {e}")
+        finally:
+            end = time.perf_counter()
+            metrics.observe('bpmf_message_seconds', end - start)
+            if sampler is not None:
+                sampler.report(content, start, end)
+
+# --- 管理指令：效能統計 (/stats) ---
+@bot.tree.command(name="stats", description="查看翻譯流程的效能統計 (管理員)")
+@app_commands.default_permissions(administrator=True)
+async def stats(interaction: discord.Interaction):
+    embed = discord.Embed(title="📈 效能統計", color=discord.Color.blue())
+
+    results = {dict(labels)['result']: value
+               for labels, value in metrics.counter_values('bpmf_messages_total').items()}
+    total = sum(results.values())
+    embed.add_field(
+        name="訊息",
+        value="\n".join(f"{result}: {count}" for result, count in sorted(results.items())) or "尚無資料",
+        inline=False
+    )
+
+    stages_text = ""
+    for stage in ('filter', 'segment', 'spans', 'is_ignored', 'convert', 'reply'):
+        histogram = metrics.histogram('bpmf_stage_seconds', stage=stage)
+        if histogram is not None and histogram.count:
+            stages_text += (f"{stage}: {histogram.count} 次，平均 {histogram.sum / histogram.count * 1000:.2f}ms，"
+                            f"p95 ≤ {histogram.quantile(0.95) * 1000:g}ms\n")
+    embed.add_field(name="各階段耗時", value=stages_text or "尚無資料", inline=False)
+
+    cache = engine.cache_stats()
+    if ENGINE_SOCKET:
+        remote = await engine.remote_cache_stats()
+        cache.update({key: value for key, value in remote.items() if key != 'segment'})
+    cache_text = "\n".join(f"{name}: {cache[name]['hit_rate']:.1%} ({cache[name]['size']} 筆)"
+                           for name in ('segment', 'translation') if name in cache)
+    embed.add_field(name="快取命中率", value=cache_text or "尚無資料", inline=False)
+
+    sql = metrics.counter_value('bpmf_sql_statements_total')
+    embed.add_field(name="SQL", value=f"{sql} 次 (每則訊息 {sql / total if total else 0:.2f} 次)", inline=False)
+    embed.add_field(
+        name="寫入佇列",
+        value=f"待寫入 {cache.get('pending_writes', 0)} 筆，writer 排隊 {cache.get('writer_queue', 0)} 筆",
+        inline=False
+    )
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
+# --- 管理指令：回補頻道歷史中漏翻的亂碼 (/backfill) ---
+backfills = {}  # channel_id -> 背景執行中的回補任務
+
+@bot.tree.command(name="backfill", description="掃描頻道歷史訊息，找出漏翻的亂碼 (管理員)")
+@app_commands.default_permissions(administrator=True)
+@app_commands.describe(limit="這次最多掃描幾則訊息", restart="忽略上次的進度，從最新的訊息重新開始")
+async def backfill(interaction: discord.Interaction, limit: app_commands.Range[int, 1, 20000] = 1000,
+                   restart: bool = False):
+    channel = interaction.channel
+    task = backfills.get(channel.id)
+    if task is not None and not task.done():
+        await interaction.response.send_message("⏳ 這個頻道的回補還在進行中", ephemeral=True)
+        return
+
+    await interaction.response.send_message(f"⏳ 開始在背景掃描最多 {limit} 則訊息…", ephemeral=True)
+    backfills[channel.id] = asyncio.create_task(run_backfill(channel, interaction.guild_id or 0, limit, restart))
 
-            view = TranslationView(content, final_text, bopomofo_segs, message.author.id)
-            await message.reply(embed=embed, view=view)
+async def run_backfill(channel, guild_id, limit, restart):
+    # 獨立的分類器，不影響 /filterstats 的即時統計
+    backfill_classifier = ScrambleClassifier(SCRAMBLE_THRESHOLD)
+    try:
+        missed, scanned, finished = await backfill_channel(
+            engine, backfill_classifier, channel, bot.user.id, guild_id, limit, restart
+        )
+    except discord.HTTPException as e:
+        print(f"❌ 回補頻道 {channel.id} 失敗: {e}")
+        await channel.send(f"⚠️ 回補中斷 (進度已保存，可再執行 /backfill 繼續): {e}")
+        return
+
+    status = "已掃描到頻道開頭" if finished else "再執行一次 /backfill 會從這裡繼續往前掃描"
+    embed = discord.Embed(
+        title="📜 回補結果",
+        description=f"掃描 {scanned} 則，找到 {len(missed)} 則漏翻的亂碼。\n{status}",
+        color=discord.Color.blue()
+    )
+    await channel.send(embed=embed)
+
+    # 依時間順序列出，每個 Embed 描述上限 4096 字
+    lines = [f"[{message.content[:80]}]({message.jump_url}) → {text}"
+             for message, text in sorted(missed, key=lambda item: item[0].id)]
+    page = ""
+    for line in lines:
+        if len(page) + len(line) + 1 > 4000:
+            await channel.send(embed=discord.Embed(description=page, color=discord.Color.blue()))
+            page = ""
+        page += line + "\n"
+    if page:
+        await channel.send(embed=discord.Embed(description=page, color=discord.Color.blue()))
 
 # --- 查詢指令：查看某個亂碼底下的候選字 (/check) ---
 @bot.tree.command(name="check", description="查詢某個亂碼目前的候選字與權重")
 @app_commands.describe(scramble="想要查詢的亂碼 (例: ru8)")
+@app_commands.autocomplete(scramble=scramble_autocomplete)
 async def check(interaction: discord.Interaction, scramble: str):
     # 先將亂碼轉為注音
-    _, bopomofo_segs = segment_ascii(scramble)
+    _, bopomofo_segs = engine.segment(scramble)
     if not bopomofo_segs:
         await interaction.response.send_message(f"❌ 無法辨識亂碼 `{scramble}`")
         return
 
     bpmf_query = "".join(bopomofo_segs)
-    candidates = engine.get_candidates(bpmf_query)
+    candidates = await engine.get_candidates(bpmf_query, interaction.guild_id or 0)
 
     if not candidates:
         await interaction.response.send_message(f"🔍 字典中找不到關於 `{bpmf_query}` ({scramble}) 的記錄。")
@@ -107,19 +359,20 @@ async def check(interaction: discord.Interaction, scramble: str):
 # --- 刪除指令：忘記錯誤的學習 (/forget) ---
 @bot.tree.command(name="forget", description="刪除字典中錯誤的對應關係")
 @app_commands.describe(scramble="亂碼 (例: ru8)", word="想要刪除的中文 (例: 假)")
+@app_commands.autocomplete(scramble=scramble_autocomplete, word=candidate_autocomplete)
 async def forget(interaction: discord.Interaction, scramble: str, word: str):
-    _, bopomofo_segs = segment_ascii(scramble)
+    _, bopomofo_segs = engine.segment(scramble)
     if not bopomofo_segs:
         await interaction.response.send_message(f"❌ 無法辨識亂碼 `{scramble}`")
         return
 
     bpmf_target = "".join(bopomofo_segs)
-    success = engine.delete_word(word, bpmf_target)
+    success = await engine.delete_word(word, bpmf_target, interaction.guild_id or 0)
 
     if success:
         embed = discord.Embed(
             title="🗑️ 已刪除詞彙",
-            description=f"之後遇到 `{scramble}` 將不會翻譯成 {word}",
+            description=f"之後在這個伺服器遇到 `{scramble}` 將不會翻譯成 {word}",
             color=discord.Color.green()
         )
         embed.add_field(name="已移除", value=f"{scramble} → {word}", inline=False)
@@ -129,9 +382,9 @@ async def forget(interaction: discord.Interaction, scramble: str, word: str):
 
 # --- 忽略指令：設定不需要翻譯的亂碼 (/ignore) ---
 @bot.tree.command(name="ignore", description="設定不需要翻譯的亂碼模式（如人名）")
-@app_commands.describe(pattern="亂碼模式 (例: alice, tom, john)")
+@app_commands.describe(pattern="亂碼模式，可用 * 與 ? 萬用字元 (例: alice, tom*, j?hn)")
 async def ignore(interaction: discord.Interaction, pattern: str):
-    if engine.add_ignore_pattern(pattern):
+    if await engine.add_ignore_pattern(pattern, interaction.guild_id or 0):
         embed = discord.Embed(
             title="🚫 已新增忽略模式",
             description=f"之後遇到 `{pattern}` 將不會翻譯",
@@ -146,7 +399,12 @@ async def ignore(interaction: discord.Interaction, pattern: str):
 @bot.tree.command(name="unignore", description="取消忽略模式")
 @app_commands.describe(pattern="要取消忽略的亂碼模式")
 async def unignore(interaction: discord.Interaction, pattern: str):
-    if engine.remove_ignore_pattern(pattern):
+    guild_id = interaction.guild_id or 0
+    # 🚫 按鈕加入的模式經過跳脫，直接輸入 /ignores 顯示的原字也能取消
+    removed = await engine.remove_ignore_pattern(pattern, guild_id)
+    if not removed and glob.escape(pattern) != pattern:
+        removed = await engine.remove_ignore_pattern(glob.escape(pattern), guild_id)
+    if removed:
         embed = discord.Embed(
             title="✅ 已取消忽略模式",
             description=f"模式 `{pattern}` 已移除",
@@ -159,7 +417,7 @@ async def unignore(interaction: discord.Interaction, pattern: str):
 # --- 查看忽略列表：列出所有忽略模式 (/ignores) ---
 @bot.tree.command(name="ignores", description="列出所有不需要翻譯的亂碼模式")
 async def ignores(interaction: discord.Interaction):
-    patterns = engine.list_ignore_patterns()
+    patterns = await engine.list_ignore_patterns(interaction.guild_id or 0)
     if not patterns:
         embed = discord.Embed(
             title="📋 忽略模式列表",
@@ -174,7 +432,8 @@ async def ignores(interaction: discord.Interaction):
         )
         patterns_text = ""
         for pattern in patterns:
-            patterns_text += f"• {pattern}\n"
+            text = unescape_pattern(pattern)
+            patterns_text += f"• {text}\n" if text == pattern else f"• {text} (不含萬用字元)\n"
         embed.add_field(name="模式", value=patterns_text, inline=False)
         embed.add_field(name="總計", value=f"共 {len(patterns)} 個模式", inline=False)
         await interaction.response.send_message(embed=embed)
@@ -197,7 +456,7 @@ class FixTranslationModal(Modal, title='修正翻譯'):
 
     async def on_submit(self, interaction: discord.Interaction):
         word = self.correct_word.value
-        _, bopomofo_segs = segment_ascii(self.scramble)
+        _, bopomofo_segs = engine.segment(self.scramble)
 
         if not bopomofo_segs or len(bopomofo_segs) != len(word):
             await interaction.response.send_message(
@@ -206,7 +465,7 @@ class FixTranslationModal(Modal, title='修正翻譯'):
             )
             return
 
-        if engine.add_word(word, bopomofo_segs):
+        if await engine.add_word(word, bopomofo_segs, interaction.guild_id or 0):
             # 更新原始訊息並移除按鈕
             new_embed = discord.Embed(
                 title="🔍 翻譯結果",
@@ -221,51 +480,77 @@ class FixTranslationModal(Modal, title='修正翻譯'):
             await interaction.response.send_message("⚠️ 學習失敗。", ephemeral=True)
 
 
-# --- View 按鈕：翻譯結果的反饋按鈕 ---
-class TranslationView(View):
-    def __init__(self, scramble, word, bopomofo_segs, original_author_id):
-        super().__init__(timeout=None)
-        self.scramble = scramble
-        self.word = word
-        self.bopomofo_segs = bopomofo_segs
+# --- 持久化按鈕：翻譯結果的反饋按鈕 ---
+# 按鈕本身不保存狀態：custom_id 只記動作與輸入者，亂碼與翻譯從回覆的 Embed 讀回，
+# 因此記憶體用量與翻譯過的訊息數無關，重新啟動後舊訊息的按鈕也能繼續使用。
+def translation_fields(message):
+    """ 從翻譯結果 Embed 讀回 (亂碼, 翻譯)，找不到時回傳 (None, None) """
+    if message is None or not message.embeds:
+        return None, None
+    fields = {field.name: field.value for field in message.embeds[0].fields}
+    return fields.get("誤輸入"), fields.get("實際意思")
+
+class TranslationButton(discord.ui.DynamicItem[Button], template=r'bpmf:(?P<action>ok|fix|ignore):(?P<author_id>[0-9]+)'):
+    ACTIONS = {
+        'ok': ('✅ 正確', discord.ButtonStyle.green),
+        'fix': ('📝 修正翻譯', discord.ButtonStyle.primary),
+        'ignore': ('🚫 忽略此亂碼', discord.ButtonStyle.red),
+    }
+
+    def __init__(self, action, original_author_id):
+        label, style = self.ACTIONS[action]
+        super().__init__(Button(label=label, style=style, custom_id=f"bpmf:{action}:{original_author_id}"))
+        self.action = action
         self.original_author_id = original_author_id
 
-    @discord.ui.button(label='✅ 正確', style=discord.ButtonStyle.green)
-    async def correct_button(self, interaction: discord.Interaction, button: discord.ui.Button):
-        if interaction.user.id != self.original_author_id:
-            await interaction.response.send_message("❌ 只有輸入亂碼的人可以修改", ephemeral=True)
-            return
-
-        full_bpmf = "".join([s.replace('ˉ', '').strip() for s in self.bopomofo_segs])
-        if engine.increase_weight(self.word, full_bpmf):
-            await interaction.response.edit_message(view=None)
-            await interaction.followup.send("✅ 已記錄為正確翻譯", ephemeral=True)
-        else:
-            await interaction.response.send_message("⚠️ 操作失敗", ephemeral=True)
-
-    @discord.ui.button(label='📝 修正翻譯', style=discord.ButtonStyle.primary)
-    async def fix_button(self, interaction: discord.Interaction, button: discord.ui.Button):
-        if interaction.user.id != self.original_author_id:
-            await interaction.response.send_message("❌ 只有輸入亂碼的人可以修改", ephemeral=True)
-            return
-
-        modal = FixTranslationModal(self.scramble, self.bopomofo_segs, interaction.message)
-        await interaction.response.send_modal(modal)
+    @classmethod
+    async def from_custom_id(cls, interaction: discord.Interaction, item: Button, match):
+        return cls(match['action'], int(match['author_id']))
 
-    @discord.ui.button(label='🚫 忽略此亂碼', style=discord.ButtonStyle.red)
-    async def ignore_button(self, interaction: discord.Interaction, button: discord.ui.Button):
+    async def interaction_check(self, interaction: discord.Interaction):
         if interaction.user.id != self.original_author_id:
             await interaction.response.send_message("❌ 只有輸入亂碼的人可以修改", ephemeral=True)
+            return False
+        return True
+
+    @staticmethod
+    async def ignore_scramble(message, scramble, guild_id):
+        """ 把亂碼加入忽略模式：整則都是亂碼時為一個模式，中英混雜的訊息每個亂碼字各一個
+        (忽略模式只比對整則訊息或單一個字，多段合併的文字永遠比對不到) """
+        mixed = any(field.name == "整句" for field in message.embeds[0].fields)
+        patterns = scramble.split() if mixed else [scramble]
+        # 亂碼裡的 * ? [ 要跳脫，否則會變成萬用字元而忽略到其他訊息
+        added = [await engine.add_ignore_pattern(glob.escape(pattern), guild_id) for pattern in patterns]
+        return all(added)
+
+    async def callback(self, interaction: discord.Interaction):
+        scramble, word = translation_fields(interaction.message)
+        if scramble is None or word is None:
+            await interaction.response.send_message("⚠️ 找不到這則翻譯的內容", ephemeral=True)
             return
 
-        if engine.add_ignore_pattern(self.scramble):
+        if self.action == 'ok':
+            _, bopomofo_segs = engine.segment(scramble)
+            full_bpmf = "".join([s.replace('ˉ', '').strip() for s in bopomofo_segs])
+            if await engine.increase_weight(word, full_bpmf, interaction.guild_id or 0):
+                await interaction.response.edit_message(view=None)
+                await interaction.followup.send("✅ 已記錄為正確翻譯", ephemeral=True)
+            else:
+                await interaction.response.send_message("⚠️ 操作失敗", ephemeral=True)
+
+        elif self.action == 'fix':
+            _, bopomofo_segs = engine.segment(scramble)
+            modal = FixTranslationModal(scramble, bopomofo_segs, interaction.message)
+            await interaction.response.send_modal(modal)
+
+        elif await self.ignore_scramble(interaction.message, scramble, interaction.guild_id or 0):
             # 更新 Embed 顯示已忽略
             new_embed = discord.Embed(
                 title="🔍 翻譯結果",
                 color=discord.Color.blue()
             )
-            new_embed.add_field(name="誤輸入", value=self.scramble, inline=False)
-            new_embed.add_field(name="實際意思", value=f"~~{self.word}~~ (已忽略)", inline=False)
+            new_embed.add_field(name="誤輸入", value=scramble, inline=False)
+            new_embed.add_field(name="實際意思", value=f"~~{word}~~ (已忽略)", inline=False)
             new_embed.set_footer(text="🚫 已加入忽略列表")
 
             await interaction.response.edit_message(embed=new_embed, view=None)
@@ -273,4 +558,32 @@ class TranslationView(View):
             await interaction.response.send_message("⚠️ 操作失敗", ephemeral=True)
 
 
-bot.run(DISCORD_TOKEN)
\ No newline at end of file
+class TranslationView(View):
+    """ 只用來送出按鈕的 View
+
+    送出前先 stop()，discord.py 就不會替每則回覆在記憶體保留一個 View；
+    按下按鈕時由 setup_hook 註冊的 TranslationButton 依 custom_id 處理。
+    """
+    def __init__(self, original_author_id):
+        super().__init__(timeout=None)
+        for action in TranslationButton.ACTIONS:
+            self.add_item(TranslationButton(action, original_author_id))
+        self.stop()
+
+
+async def main():
+    # docker stop 送出 SIGTERM：先關閉機器人，再由 finally 寫完佇列中的回饋
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, lambda: asyncio.create_task(bot.close()))
+    async with bot:
+        try:
+            await bot.start(DISCORD_TOKEN)
+        finally:
+            if maintenance is not None:
+                maintenance.cancel()
+            await engine.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,127 @@
+import re
+
+from bpmf_syllables import SYLLABLES, TONED_SYLLABLES, strip_tone
+from bpmf_segmenter import segment_spans
+
+# 網址、提及 (<@id>、<#id>、自訂表情) 與行內程式碼不可能是亂碼，掃描時當成分隔
+_NOT_SCRAMBLE = re.compile(r'\w+://\S+|<[^<>\s]*>|`[^`]*`')
+# 明確的聲調鍵 (3、4、6、7)
+_TONE_KEYS = frozenset('3467')
+
+
+class ScrambleClassifier:
+    """ 快速判斷訊息是否像注音亂碼：計算切出的音節中合法國語音節所佔的字元比例 """
+
+    def __init__(self, threshold=0.8):
+        self.threshold = threshold
+        self.checked = 0
+        self.rejected = 0
+
+    def score(self, text, bopomofo_segs):
+        """ 合法音節涵蓋的字元數 / 訊息中非空白字元數 """
+        total = len(text) - text.count(' ')
+        if total <= 0:
+            return 0.0
+        # 對照表一對一轉換，注音音節長度即為原始輸入的字元數；一聲的空白不計入
+        valid = sum(len(seg) - seg.endswith('ˉ') for seg in bopomofo_segs if seg in TONED_SYLLABLES)
+        return valid / total
+
+    def accept(self, text, bopomofo_segs):
+        """ 比例達到門檻才進入字典查詢，並累計拒絕率 """
+        self.checked += 1
+        if not bopomofo_segs or self.score(text, bopomofo_segs) < self.threshold:
+            self.rejected += 1
+            return False
+        return True
+
+    @property
+    def rejection_rate(self):
+        return self.rejected / self.checked if self.checked else 0.0
+
+    def stats(self):
+        """ 回傳檢查數、拒絕數與拒絕率 """
+        return {
+            'checked': self.checked,
+            'rejected': self.rejected,
+            'rejection_rate': self.rejection_rate,
+        }
+
+
+def is_untoned_scramble(text):
+    """ 只有字母的訊息是否整則都能切成沒打聲調的合法音節 (例: sucl、su cl)
+
+    至少要有兩個音節，且每個音節至少兩個注音符號，避免把 i、in、go 這類剛好切得開的英文字當成亂碼。
+    """
+    spans = segment_spans(text)
+    if len(spans) < 2:
+        return False
+    for _, _, bpmf in spans:
+        syllable = strip_tone(bpmf)
+        if syllable not in SYLLABLES or len(syllable) < 2:
+            return False
+    return True
+
+
+def _has_key_symbol(chunk):
+    """ 含有字母以外的按鍵 (數字、標點) """
+    return any(not char.isalpha() and not char.isspace() for char in chunk)
+
+
+def scramble_spans(text, spans=None, ignored=()):
+    """ 在中英混雜的訊息中找出像亂碼的片段，回傳 [(start, end, 注音音節 list)]，text[start:end] 為原文
+
+    單次掃描 segment_spans：相鄰 (中間只有空白) 的合法音節連成一段，一段至少要有一個數字或標點按鍵，
+    因為純字母剛好拼成合法音節的英文字很多；頭尾只由字母組成、以空白隔開的字當成英文單字剔除。
+    只有一個音節的片段必須打了聲調鍵，全是數字的片段不算，避免把句中的數字當成亂碼。
+    ignored 為被忽略模式排除的範圍 [(start, end)]，與網址等一樣當成分隔。
+    """
+    if spans is None:
+        spans = segment_spans(text)
+    masked = [match.span() for match in _NOT_SCRAMBLE.finditer(text)]
+    if ignored:
+        masked = sorted(masked + list(ignored))
+    found, run, prev_end, m = [], [], None, 0
+    for span in spans:
+        start, end, bpmf = span
+        while m < len(masked) and masked[m][1] <= start:
+            m += 1
+        valid = bpmf in TONED_SYLLABLES and not (m < len(masked) and masked[m][0] < end)
+        if valid and run and (prev_end == start or text[prev_end:start].isspace()):
+            run.append(span)
+        else:
+            _close_run(text, run, found)
+            run = [span] if valid else []
+        prev_end = end
+    _close_run(text, run, found)
+    return found
+
+
+def _close_run(text, run, found):
+    evident = [i for i, (start, end, _) in enumerate(run) if _has_key_symbol(text[start:end])]
+    if not evident:
+        return
+
+    def boundary_after(j):
+        """ 第 j 個音節之後是否為字的分界 (一聲的空白或音節間的空白) """
+        end = run[j][1]
+        return text[end - 1] == ' ' or (j + 1 < len(run) and run[j + 1][0] > end)
+
+    # 第一個有按鍵符號的音節之前、最後一個之後，以空白隔開的純字母字剔除
+    lo = 0
+    for j in range(evident[0]):
+        if boundary_after(j):
+            lo = j + 1
+    hi = len(run)
+    for j in range(evident[-1], len(run) - 1):
+        if boundary_after(j):
+            hi = j + 1
+            break
+    kept = run[lo:hi]
+
+    start, end = kept[0][0], kept[-1][1]
+    chunk = text[start:end].replace(' ', '')
+    if chunk.isdigit():
+        return
+    if len(kept) == 1 and not any(char in _TONE_KEYS for char in chunk):
+        return
+    found.append((start, end, [bpmf for _, _, bpmf in kept]))
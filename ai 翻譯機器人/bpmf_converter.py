@@ -19,21 +19,31 @@ TONE_MARKS = {
     "7": "˙",  # 輕聲
 }
 
+# str.translate 對照表 (大小寫皆可)，每個字元一對一轉換，字元位置不變
+BPMF_TABLE = str.maketrans({
+    **ASCII_TO_BPMF,
+    **{k.upper(): v for k, v in ASCII_TO_BPMF.items() if k.isalpha()},
+    **TONE_MARKS,
+})
+
+# 反向對照表：注音 → 鍵盤按鍵 (用於產生測試用亂碼)
+BPMF_TO_ASCII = {v: k for k, v in ASCII_TO_BPMF.items()}
+BPMF_TO_ASCII.update({v: k for k, v in TONE_MARKS.items()})
+_ASCII_TABLE = str.maketrans(BPMF_TO_ASCII)
+
 def is_bopomofo_scramble(text):
     """檢測文本是否為注音亂碼"""
     return any(char.lower() in ASCII_TO_BPMF or char in TONE_MARKS for char in text)
 
 def ascii_to_bopomofo(text):
     """將 ASCII 鍵盤輸入轉換為注音符號"""
-    result = ""
-    for char in text.lower():
-        if char in TONE_MARKS:
-            result += TONE_MARKS[char]
-        else:
-            result += ASCII_TO_BPMF.get(char, char)
-    return result
+    return text.lower().translate(BPMF_TABLE)
 
 def extract_bopomofo_sequence(text):
     """提取注音序列用於 AI 模型"""
     bopomofo = ascii_to_bopomofo(text)
     return bopomofo
+
+def bopomofo_to_ascii(text):
+    """將注音符號轉回鍵盤按鍵 (ascii_to_bopomofo 的反函數)"""
+    return text.translate(_ASCII_TABLE)
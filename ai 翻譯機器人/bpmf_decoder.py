@@ -0,0 +1,159 @@
+import heapq
+import math
+
+from bpmf_toneless import toneless_key
+
+# 單一詞最多涵蓋的音節數
+MAX_WORD_LEN = 8
+# 查不到字的音節額外扣分 (自然對數)，確保任何字典詞都比原樣輸出好
+UNKNOWN_PENALTY = 10.0
+# 只在無聲調索引找到的詞額外扣分，聲調正確的詞一定優先
+TONELESS_PENALTY = 4.0
+
+
+def decode_lattice(index, bopomofo_segs, k=1, max_len=MAX_WORD_LEN, toneless=None):
+    """ 一次建立整句詞圖，以 N-best Viterbi 取出前 k 名 [(text, score, path)]
+
+    每個詞的分數為 log(freq / 總權重)，路徑分數為各詞相加；
+    每個起點只走訪字典樹一次，查詢次數與原本貪婪匹配相同 (最多 n·8)。
+    toneless (TonelessIndex) 有值時，每個起點再走訪一次無聲調索引，
+    找到的詞扣 TONELESS_PENALTY，讓沒打或打錯聲調的輸入也能翻譯。
+    path 為 [(起始音節, 結束音節, 字詞或 None)]，None 代表查無此音。
+    """
+    return decode_incremental(index, bopomofo_segs, None, k, max_len, toneless)[0]
+
+
+class LatticeState:
+    """ 上一次解碼保留的詞圖，訊息編輯後交給 decode_incremental 重用 """
+    __slots__ = ('segs', 'k', 'max_len', 'log_total', 'edges', 'lattice')
+
+    def __init__(self, segs, k, max_len, log_total, edges, lattice):
+        self.segs = segs            # 去掉一聲符號的音節 tuple
+        self.k = k
+        self.max_len = max_len
+        self.log_total = log_total
+        self.edges = edges          # edges[i] = 從第 i 個音節出發的 [(長度, 字詞, 分數)]，沒算過的為 None
+        self.lattice = lattice      # 已剪枝的 lattice[j]
+
+
+def decode_incremental(index, bopomofo_segs, previous=None, k=1, max_len=MAX_WORD_LEN, toneless=None):
+    """ 與 decode_lattice 相同，另外回傳 LatticeState；previous 是同一則訊息上次的狀態
+
+    結束於 j 的詞圖只取決於前 j 個音節，共同前綴的 lattice 可以直接沿用；
+    每個起點的出邊只取決於往後 max_len 個音節，前綴與後綴沒變的起點不必再查字典。
+    previous 必須來自同一份字典 (呼叫端以字典世代判斷)，否則結果可能過期。
+    """
+    clean_segs = tuple(s.replace('ˉ', '').strip() for s in bopomofo_segs)
+    n = len(clean_segs)
+    if n == 0:
+        return [("", 0.0, [])], None
+
+    log_total = math.log(max(index.total, 1))
+    if previous is not None and (previous.k, previous.max_len, previous.log_total) != (k, max_len, log_total):
+        previous = None
+
+    # 與上次相同的前綴長度，這一段的 lattice 可以沿用
+    prefix = 0
+    if previous is not None:
+        limit = min(n, len(previous.segs))
+        while prefix < limit and clean_segs[prefix] == previous.segs[prefix]:
+            prefix += 1
+
+    edges = [None] * n
+    if prefix >= max_len:
+        # 整個音節窗都在共同前綴裡的起點，出邊直接沿用 (上次沒算過的仍是 None)
+        edges[:prefix - max_len + 1] = previous.edges[:prefix - max_len + 1]
+    toneless_segs = None
+    lattice = [[] for _ in range(n + 1)]
+    lattice[0] = [(0.0, -1, -1, None)]
+
+    def _edges_at(i):
+        nonlocal toneless_segs
+        found = edges[i]
+        if found is not None:
+            return found
+        window = clean_segs[i:i + max_len]
+        if previous is not None:
+            # 前綴或後綴裡相同的音節窗，出邊與上次相同
+            for j in (i, i - n + len(previous.segs)):
+                if 0 <= j < len(previous.segs) and previous.edges[j] is not None \
+                        and previous.segs[j:j + max_len] == window:
+                    found = edges[i] = previous.edges[j]
+                    return found
+        if toneless is not None and toneless_segs is None:
+            toneless_segs = [toneless_key(s) for s in clean_segs]
+        found = edges[i] = _build_edges(index, toneless, clean_segs, toneless_segs, i, k, max_len, log_total)
+        return found
+
+    resume = 0
+    if prefix:
+        lattice[:prefix + 1] = previous.lattice[:prefix + 1]
+        resume = prefix
+        # 跨過前綴結尾的邊要重新推入 (不跨過的已經算在沿用的 lattice 裡)
+        for i in range(max(0, prefix - max_len), prefix):
+            for length, word, weight in _edges_at(i):
+                if i + length > prefix:
+                    target = lattice[i + length]
+                    for rank, entry in enumerate(lattice[i]):
+                        target.append((entry[0] + weight, i, rank, word))
+
+    for i in range(resume, n):
+        # 所有進入 i 的邊都來自更前面的位置，此時已可定案並剪枝
+        prev = lattice[i] = heapq.nlargest(k, lattice[i], key=lambda e: e[0])
+        for length, word, weight in _edges_at(i):
+            target = lattice[i + length]
+            for rank, entry in enumerate(prev):
+                target.append((entry[0] + weight, i, rank, word))
+
+    finals = heapq.nlargest(k, lattice[n], key=lambda e: e[0])
+    lattice[n] = finals
+
+    results, seen = [], set()
+    for rank in range(len(finals)):
+        path, pos, r = [], n, rank
+        score = finals[rank][0]
+        while pos > 0:
+            _, start, prev_rank, word = lattice[pos][r]
+            path.append((start, pos, word))
+            pos, r = start, prev_rank
+        path.reverse()
+
+        text = "".join(word if word is not None else f"({bopomofo_segs[start]})"
+                       for start, _, word in path)
+        if text in seen:
+            continue
+        seen.add(text)
+        results.append((text, score, path))
+    return results, LatticeState(clean_segs, k, max_len, log_total, edges, lattice)
+
+
+def _build_edges(index, toneless, clean_segs, toneless_segs, i, k, max_len, log_total):
+    """ 第 i 個音節出發的所有邊 [(長度, 字詞或 None, 分數)] """
+    edges = [(1, None, -log_total - UNKNOWN_PENALTY)]
+    for length, node in index.match(clean_segs, i, max_len):
+        for word, freq in node.top(k):
+            edges.append((length, word, math.log(max(freq, 1)) - log_total))
+    if toneless_segs is not None:
+        # 扣分後很少進入前 k 名，每個長度只取最高的一個詞，避免詞圖邊數倍增
+        exact = {(length, word) for length, word, _ in edges}
+        for length, node in toneless.match(toneless_segs, i, max_len):
+            word, freq = node.top(1)[0]
+            if (length, word) not in exact:
+                edges.append((length, word, math.log(max(freq, 1)) - log_total - TONELESS_PENALTY))
+    return edges
+
+
+class MemoIndex:
+    """ 批次解碼時包住索引：同一批訊息中相同的音節窗只走訪一次字典樹 """
+
+    def __init__(self, index):
+        self.index = index
+        self.total = getattr(index, 'total', 0)
+        self._matches = {}
+
+    def match(self, clean_segs, start, max_len=MAX_WORD_LEN):
+        window = tuple(clean_segs[start:start + max_len])
+        found = self._matches.get(window)
+        if found is None:
+            found = self._matches[window] = list(self.index.match(window, 0, max_len))
+        return found
@@ -0,0 +1,198 @@
+import heapq
+import itertools
+
+
+class TrieNode:
+    """ 字典樹節點：children 為下一個注音符號，words 為此注音對應的字詞與權重
+
+    peak 為整個子樹 (含自己) 的最高權重，前綴補全時用來先走權重高的分支。
+    """
+    __slots__ = ('children', 'words', 'peak', '_version', '_ranked')
+
+    def __init__(self, words=None):
+        self.children = {}
+        self.words = words
+        self.peak = max(words.values()) if words else None
+        self._version = 0
+        self._ranked = None  # (版本, 依權重排序的字詞)
+
+    def touch(self):
+        """ 字詞異動後 (已修改 words 之後) 呼叫，讓快取的排序結果失效 """
+        self._version += 1
+
+    def top(self, k):
+        """ 依權重由高到低取前 k 個 (word, freq) """
+        cached = self._ranked
+        if cached is not None and cached[0] == self._version:
+            return cached[1][:k]
+        # 先記下版本再複製 words：排序期間 writer 異動過的話，存下的舊版本結果不會被使用
+        version = self._version
+        ranked = sorted(tuple(self.words.items()), key=lambda kv: kv[1], reverse=True) if self.words else []
+        self._ranked = (version, ranked)
+        return ranked[:k]
+
+    def refresh_peak(self):
+        """ 由自己的字詞與子節點重新計算 peak """
+        peaks = [child.peak for child in self.children.values() if child.peak is not None]
+        if self.words:
+            peaks.append(max(self.words.values()))
+        self.peak = max(peaks) if peaks else None
+
+
+def complete_nodes(start, prefix, limit):
+    """ 從 start 節點以最佳優先搜尋，依權重由高到低產生 (注音, word, freq)，每個注音只取最高的一個字詞
+
+    堆積中子樹以 peak 排序、字詞以自己的權重排序；peak 不小於子樹內任何權重，
+    所以取出的順序就是權重順序，只會展開前 limit 名經過的分支。
+    """
+    if start is None or start.peak is None:
+        return []
+    tiebreak = itertools.count()
+    heap = [(-start.peak, next(tiebreak), prefix, start, None)]
+    results = []
+    while heap and len(results) < limit:
+        _, _, bpmf, node, entry = heapq.heappop(heap)
+        if entry is not None:
+            results.append((bpmf, entry[0], entry[1]))
+            continue
+        if node.words:
+            word, freq = node.top(1)[0]
+            heapq.heappush(heap, (-freq, next(tiebreak), bpmf, node, (word, freq)))
+        for char, child in tuple(node.children.items()):
+            if child.peak is not None:
+                heapq.heappush(heap, (-child.peak, next(tiebreak), bpmf + char, child, None))
+    return results
+
+
+class BpmfTrie:
+    """ 常駐記憶體的注音字典樹，以注音符號為鍵，每個節點保存該注音的所有字詞 """
+
+    def __init__(self):
+        self.root = TrieNode()
+        self.size = 0
+        self.total = 0  # 所有正權重總和，解碼時用來換算機率
+
+    def load(self, rows):
+        """ 從 (bpmf, word, freq) 資料列批次建立索引，peak 最後一次算完 """
+        for bpmf, word, freq in rows:
+            self._set(bpmf, word, freq)
+        self._refresh_all(self.root)
+
+    def _refresh_all(self, node):
+        """ 後序走訪整棵樹計算 peak，回傳 node 的 peak """
+        peak = max(node.words.values()) if node.words else None
+        for child in node.children.values():
+            child_peak = self._refresh_all(child)
+            if child_peak is not None and (peak is None or child_peak > peak):
+                peak = child_peak
+        node.peak = peak
+        return peak
+
+    def _path(self, bpmf):
+        """ 從根到 bpmf 節點 (含) 的所有節點，找不到時回傳 None """
+        path = [self.root]
+        for char in bpmf:
+            node = path[-1].children.get(char)
+            if node is None:
+                return None
+            path.append(node)
+        return path
+
+    def _refresh_path(self, bpmf):
+        """ 字詞異動後由下往上更新路徑上的 peak """
+        path = self._path(bpmf)
+        if path is not None:
+            for node in reversed(path):
+                node.refresh_peak()
+
+    def _find(self, bpmf):
+        node = self.root
+        for char in bpmf:
+            node = node.children.get(char)
+            if node is None:
+                return None
+        return node
+
+    def _ensure(self, bpmf):
+        node = self.root
+        for char in bpmf:
+            child = node.children.get(char)
+            if child is None:
+                child = node.children[char] = TrieNode()
+            node = child
+        return node
+
+    def get(self, bpmf, word):
+        """ 取得字詞權重，不存在時回傳 None """
+        node = self._find(bpmf)
+        if node is None or not node.words:
+            return None
+        return node.words.get(word)
+
+    def set(self, bpmf, word, freq):
+        """ 設定字詞權重 (不存在則新增) """
+        self._set(bpmf, word, freq)
+        self._refresh_path(bpmf)
+
+    def _set(self, bpmf, word, freq):
+        node = self._ensure(bpmf)
+        if node.words is None:
+            node.words = {}
+        old = node.words.get(word)
+        if old is None:
+            self.size += 1
+        else:
+            self.total -= max(old, 0)
+        node.words[word] = freq
+        self.total += max(freq, 0)
+        node.touch()
+
+    def add(self, bpmf, word, delta):
+        """ 調整既有字詞權重，回傳是否有找到該字詞 """
+        node = self._find(bpmf)
+        if node is None or not node.words or word not in node.words:
+            return False
+        old = node.words[word]
+        node.words[word] = old + delta
+        self.total += max(old + delta, 0) - max(old, 0)
+        node.touch()
+        self._refresh_path(bpmf)
+        return True
+
+    def remove(self, bpmf, word):
+        """ 移除字詞，回傳是否有刪除 """
+        node = self._find(bpmf)
+        if node is None or not node.words or word not in node.words:
+            return False
+        self.total -= max(node.words.pop(word), 0)
+        node.touch()
+        self.size -= 1
+        self._refresh_path(bpmf)
+        return True
+
+    def node(self, bpmf):
+        """ 取得某個注音的節點 (沒有任何字詞時回傳 None) """
+        node = self._find(bpmf)
+        return node if node is not None and node.words else None
+
+    def candidates(self, bpmf, limit=10):
+        """ 查詢某個注音的候選字，依權重由高到低 """
+        node = self._find(bpmf)
+        return node.top(limit) if node is not None else []
+
+    def complete(self, prefix, limit=25):
+        """ 前綴補全：以 prefix 開頭的注音中權重最高的 limit 個 [(注音, word, freq)] """
+        return complete_nodes(self._find(prefix), prefix, limit)
+
+    def match(self, clean_segs, start, max_len=8):
+        """ 從 start 開始逐音節走訪，依序產生 (音節數, 節點)，只走一次字典樹 """
+        node = self.root
+        for length in range(1, max_len + 1):
+            if start + length > len(clean_segs):
+                return
+            for char in clean_segs[start + length - 1]:
+                node = node.children.get(char)
+                if node is None:
+                    return
+            if node.words:
+                yield length, node
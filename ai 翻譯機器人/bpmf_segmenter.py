@@ -1,68 +1,77 @@
-from bpmf_converter import ascii_to_bopomofo, TONE_MARKS
+from bpmf_converter import bopomofo_to_ascii, BPMF_TABLE
 
 # 聲母集合
 INITIALS = {"ㄅ", "ㄆ", "ㄇ", "ㄈ", "ㄉ", "ㄊ", "ㄋ", "ㄌ", "ㄍ", "ㄎ", "ㄏ", 
-            "ㄐ", "ㄑ", "ㄒ", "ㄓ", "ㄔ", "ㄕ", "ㄖ", "ㄗ", "ㄘ"}
+            "ㄐ", "ㄑ", "ㄒ", "ㄓ", "ㄔ", "ㄕ", "ㄖ", "ㄗ", "ㄘ", "ㄙ"}
 
 # 韻母集合
 FINALS = {"ㄚ", "ㄛ", "ㄜ", "ㄝ", "ㄞ", "ㄟ", "ㄠ", "ㄡ", "ㄢ", "ㄣ", "ㄤ", "ㄥ", "ㄦ", 
           "ㄧ", "ㄨ", "ㄩ"}
 
-# 聲調集合
-TONES = {"ˇ", "ˋ", "ˆ", "ˊ", "ˉ"}
+# 聲調集合 (含 TONE_MARKS 產生的輕聲 ˙)
+TONES = {"ˇ", "ˋ", "ˆ", "ˊ", "ˉ", "˙"}
+
+# 字元類別表，掃描時一次查表決定狀態轉移
+_INITIAL, _FINAL, _TONE = 1, 2, 3
+_CHAR_CLASS = {
+    **{c: _INITIAL for c in INITIALS},
+    **{c: _FINAL for c in FINALS},
+    **{c: _TONE for c in TONES},
+}
+
+def _scan(bopomofo_text):
+    """ 音節狀態機：單次掃描產生 (start, end)，bopomofo_text[start:end] 即為一個字的注音 """
+    spans = []
+    start = -1  # 目前音節的起點，-1 代表不在音節中
+    char_class = _CHAR_CLASS.get
+
+    for i, char in enumerate(bopomofo_text):
+        kind = char_class(char)
+        if kind == _INITIAL:
+            # 聲母開始新的字，如果已經有字，先結束它
+            if start >= 0:
+                spans.append((start, i))
+            start = i
+        elif kind == _FINAL:
+            # 韻母加入當前字 (零聲母時由韻母開始)
+            if start < 0:
+                start = i
+        elif kind == _TONE:
+            # 聲調加入當前字並結束；沒有字時單獨的聲調直接略過
+            if start >= 0:
+                spans.append((start, i + 1))
+                start = -1
+        elif start >= 0:
+            # 其他字符 (如標點) 結束當前字
+            spans.append((start, i))
+            start = -1
+
+    if start >= 0:
+        spans.append((start, len(bopomofo_text)))
+    return spans
+
+def segment_spans(text):
+    """ 單次掃描切分亂碼 (或注音)，回傳 [(start, end, 注音)]，text[start:end] 為對應的原始輸入 """
+    # 對照表每個字元一對一轉換，因此注音字串的位置就是原文的位置
+    bopomofo = text.translate(BPMF_TABLE)
+    return [(start, end, bopomofo[start:end]) for start, end in _scan(bopomofo)]
 
 def segment_bopomofo(bopomofo_text):
     """將注音序列切分成單個字的注音"""
-    segments = []
-    current = ""
-    
-    i = 0
-    while i < len(bopomofo_text):
-        char = bopomofo_text[i]
-        
-        if char in INITIALS:
-            # 如果已經有字，先結束它
-            if current:
-                segments.append(current)
-            current = char
-        elif char in FINALS:
-            # 韻母加入當前字
-            current += char
-        elif char in TONES:
-            # 聲調加入當前字並結束
-            current += char
-            segments.append(current)
-            current = ""
-        else:
-            # 其他字符（如空格）
-            if current:
-                segments.append(current)
-                current = ""
-        
-        i += 1
-    
-    if current:
-        segments.append(current)
-    
-    return segments
+    return [bopomofo_text[start:end] for start, end in _scan(bopomofo_text)]
 
 def segment_ascii(ascii_text):
     """直接從 ASCII 亂碼切分出單個字"""
-    bopomofo = ascii_to_bopomofo(ascii_text)
-    bopomofo_segs = segment_bopomofo(bopomofo)
-    
-    # 將 ASCII 也對應切分
+    spans = segment_spans(ascii_text)
+    ascii_segments = [ascii_text[start:end] for start, end, _ in spans]
+    bopomofo_segs = [bopomofo for _, _, bopomofo in spans]
+    return ascii_segments, bopomofo_segs
+
+def key_to_ascii(bpmf_key):
+    """ 字典鍵 (一聲已省略的注音串) 轉回鍵盤輸入，一聲補回空白 """
     ascii_segments = []
-    ascii_pos = 0
-    
-    for bopomofo_seg in bopomofo_segs:
-        ascii_seg = ""
-        while ascii_pos < len(ascii_text):
-            ascii_seg += ascii_text[ascii_pos]
-            if ascii_to_bopomofo(ascii_seg) == bopomofo_seg:
-                ascii_pos += 1
-                break
-            ascii_pos += 1
-        ascii_segments.append(ascii_seg)
-    
-    return ascii_segments, bopomofo_segs
\ No newline at end of file
+    for syllable in segment_bopomofo(bpmf_key):
+        if _CHAR_CLASS.get(syllable[-1]) != _TONE:
+            syllable += 'ˉ'
+        ascii_segments.append(bopomofo_to_ascii(syllable))
+    return "".join(ascii_segments).rstrip()
@@ -0,0 +1,57 @@
+from bpmf_index import BpmfTrie
+
+# 所有聲調符號 (含一聲 ˉ 與輕聲 ˙)
+_TONE_TABLE = str.maketrans('', '', 'ˉˊˇˋˆ˙')
+
+
+def toneless_key(bpmf):
+    """ 去掉所有聲調的注音鍵，沒打聲調或聲調打錯的輸入都會對到同一個鍵 """
+    return bpmf.translate(_TONE_TABLE)
+
+
+class TonelessIndex:
+    """ 以無聲調注音為鍵的次要索引，與主索引一起更新
+
+    同一個詞不同聲調的權重相加 (例：ㄇㄚ → 媽 + 麻 + 馬…的各自讀音)，
+    只需知道異動前後的權重就能增減，不必回頭查其他聲調。
+    index 可以是 BpmfTrie，也可以是疊在唯讀快照上的 OverlayIndex。
+    """
+
+    def __init__(self, index=None):
+        self.index = index if index is not None else BpmfTrie()
+
+    def load(self, rows):
+        """ 從主字典的 (bpmf, word, freq) 建立索引 (僅用於空的 BpmfTrie) """
+        trie = self.index
+        for bpmf, word, freq in rows:
+            key = toneless_key(bpmf)
+            old = trie.get(key, word)
+            trie._set(key, word, freq if old is None else old + freq)
+        # 權重總和不大於 0 的詞與異動時的處理一致：不放進索引
+        for key, word in [(key, word) for key, word, freq in _walk(trie.root, '') if freq <= 0]:
+            trie.remove(key, word)
+        trie._refresh_all(trie.root)
+
+    def change(self, bpmf, word, old, new):
+        """ 主索引中 (bpmf, word) 的權重由 old 變成 new (None 代表不存在) """
+        delta = (new or 0) - (old or 0)
+        if not delta and (old is None) == (new is None):
+            return
+        key = toneless_key(bpmf)
+        current = self.index.get(key, word)
+        total = (current or 0) + delta
+        if total > 0:
+            self.index.set(key, word, total)
+        elif current is not None:
+            self.index.remove(key, word)
+
+    def match(self, toneless_segs, start, max_len=8):
+        return self.index.match(toneless_segs, start, max_len)
+
+
+def _walk(node, prefix):
+    if node.words:
+        for word, freq in node.words.items():
+            yield prefix, word, freq
+    for char, child in node.children.items():
+        yield from _walk(child, prefix + char)
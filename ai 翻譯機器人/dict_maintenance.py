@@ -0,0 +1,91 @@
+"""
+字典定期維護：權重衰減、清除失效詞、整理資料庫
+
+    maintenance_loop(engine)   # 在機器人 (或字典服務) 的事件迴圈中常駐
+
+每一步只處理一小批並經由 AsyncBpmfEngine 的寫入任務執行，批次之間讓出事件迴圈，
+翻譯與回饋寫入不會被整個字典的掃描擋住。
+"""
+import asyncio
+import time
+
+# 手動學習的權重 (伺服器異動為與共用字典的差距) 每 HALF_LIFE_DAYS 天減半，讓舊的回饋逐漸讓位給新的
+HALF_LIFE_DAYS = 180
+# 累積的衰減至少要讓權重降到這個比例以下才套用，避免整數權重每次只被捨去誤差磨掉
+MIN_DECAY_FACTOR = 0.9
+# 手動學習的詞權重低於此值 (例如被 decrease_weight 扣到 0 以下) 直接刪除，匯入的詞庫不受影響
+PRUNE_BELOW = 1
+BATCH_SIZE = 2000
+VACUUM_PAGES = 200
+ANALYZE_TABLES = ('dictionary', 'dictionary_changes', 'guild_dictionary')
+# 兩批之間的間隔 (秒)
+PAUSE = 0.05
+# 兩次完整維護之間的間隔 (秒)
+INTERVAL = 6 * 3600
+
+
+def decay_factor(decayed_at, now, half_life_days=HALF_LIFE_DAYS):
+    """ 距離上次衰減經過的時間換算成權重倍率，還不到 MIN_DECAY_FACTOR 時回傳 None """
+    if not decayed_at:
+        return None
+    factor = 0.5 ** ((now - decayed_at) / (half_life_days * 86400))
+    return factor if factor <= MIN_DECAY_FACTOR else None
+
+
+async def run_maintenance(engine, threshold=PRUNE_BELOW, half_life_days=HALF_LIFE_DAYS,
+                          batch_size=BATCH_SIZE, pause=PAUSE):
+    """ 執行一次完整維護，回傳統計 {decayed, pruned, journal, free_pages} """
+    stats = {'decayed': 0, 'pruned': 0, 'journal': 0, 'free_pages': None}
+    now = int(time.time())
+    decayed_at = await engine.get_meta('decayed_at')
+    factor = decay_factor(decayed_at, now, half_life_days)
+
+    # 1. 衰減與清除 (共用字典與各伺服器的異動，依 rowid 分批)；先寫入延遲佇列，剛學到的詞也在掃描範圍內
+    await engine.flush()
+    for decay_batch in (engine.decay_batch, engine.decay_guild_batch):
+        rowid = 0
+        while True:
+            rowid, decayed, pruned = await decay_batch(rowid, factor, threshold, batch_size)
+            if rowid is None:
+                break
+            stats['decayed'] += decayed
+            stats['pruned'] += pruned
+            await asyncio.sleep(pause)
+    if factor is not None or not decayed_at:
+        await engine.set_meta('decayed_at', now)
+
+    # 2. 清掉用不到的變更記錄
+    while True:
+        deleted = await engine.trim_journal(batch_size)
+        if not deleted:
+            break
+        stats['journal'] += deleted
+        await asyncio.sleep(pause)
+
+    # 3. 分批歸還空白頁 (舊資料庫需先以 dict_tool.py vacuum 切換成 incremental 模式)
+    while True:
+        free = await engine.incremental_vacuum(VACUUM_PAGES)
+        stats['free_pages'] = free
+        if not free:
+            break
+        await asyncio.sleep(pause)
+
+    # 4. 抽樣更新查詢統計，一次一個資料表
+    for table in ANALYZE_TABLES:
+        await engine.analyze(table)
+        await asyncio.sleep(pause)
+    return stats
+
+
+async def maintenance_loop(engine, interval=INTERVAL, **options):
+    """ 每 interval 秒執行一次 run_maintenance，直到被取消 """
+    while True:
+        await asyncio.sleep(interval)
+        start = time.perf_counter()
+        try:
+            stats = await run_maintenance(engine, **options)
+        except Exception as e:
+            print(f"❌ 字典維護失敗: {e}")
+            continue
+        print(f"🧹 字典維護完成 ({time.perf_counter() - start:.1f}s)：衰減 {stats['decayed']} 筆、"
+              f"清除 {stats['pruned']} 筆、變更記錄 {stats['journal']} 筆")
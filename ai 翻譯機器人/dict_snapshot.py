@@ -0,0 +1,363 @@
+import heapq
+import itertools
+import mmap
+import os
+import struct
+from array import array
+
+from bpmf_index import BpmfTrie, TrieNode
+from bpmf_toneless import toneless_key
+
+# 快照檔格式 (小端序)：
+#   header  magic, 注音數 K, 詞數 E, 權重總和, 變更記錄位置 mark, 字典世代 epoch
+#   key_offsets   uint32 × (K+1)  注音 UTF-8 在 key_blob 中的位置 (依位元組排序)
+#   entry_starts  uint32 × (K+1)  每個注音在詞陣列中的範圍
+#   freqs         int64  × E      權重 (同一注音內由高到低)
+#   word_offsets  uint32 × (E+1)  詞 UTF-8 在 word_blob 中的位置
+#   peaks         int64  × 2L     每個注音最高權重的線段樹 (L 為不小於 K 的 2 的冪次)，前綴補全用
+#   key_blob / word_blob
+MAGIC = b'BPMFSNP2'
+HEADER = struct.Struct('<8sIIqqq')
+_NO_PEAK = -(1 << 63)
+
+
+def _align(n):
+    return (n + 7) & ~7
+
+
+def _leaf_count(key_count):
+    return 1 << max(0, key_count - 1).bit_length()
+
+
+def _build_peaks(freqs, entry_starts, key_count):
+    """ 葉節點為各注音的最高權重 (同一注音內已由高到低排序，取第一個)，內部節點取子節點最大值 """
+    leaves = _leaf_count(key_count)
+    peaks = array('q', [_NO_PEAK]) * (2 * leaves)
+    for i in range(key_count):
+        peaks[leaves + i] = freqs[entry_starts[i]]
+    for i in range(leaves - 1, 0, -1):
+        peaks[i] = max(peaks[2 * i], peaks[2 * i + 1])
+    return peaks
+
+
+def toneless_path(path):
+    """ 無聲調索引快照與主快照放在一起 """
+    return path + '.toneless'
+
+
+def build_snapshot(conn, path):
+    """ 將 dictionary 資料表編譯成唯讀快照 (另附無聲調索引快照)，回傳 (注音數, 詞數) """
+    cursor = conn.cursor()
+    mark = cursor.execute("SELECT COALESCE(MAX(id), 0) FROM dictionary_changes").fetchone()[0]
+    epoch = read_meta(conn, 'epoch')
+
+    # SQLite 以 BINARY 比較 TEXT，等同 UTF-8 位元組順序，正好符合二分搜尋需要的排序
+    counts = _write_snapshot(path, cursor.execute(
+        "SELECT bpmf, word, freq FROM dictionary ORDER BY bpmf, freq DESC"
+    ), mark, epoch)
+    # 無聲調索引：同一個詞各聲調的權重相加 (與 TonelessIndex 相同)
+    conn.create_function('toneless', 1, toneless_key, deterministic=True)
+    _write_snapshot(toneless_path(path), cursor.execute('''
+        SELECT toneless(bpmf) AS key, word, SUM(freq) AS total FROM dictionary
+        GROUP BY key, word HAVING total > 0 ORDER BY key, total DESC
+    '''), mark, epoch)
+
+    # 快照已包含的變更記錄可以清掉，並記下清到哪裡，較舊的快照啟動時便知道自己過期
+    cursor.execute("DELETE FROM dictionary_changes WHERE id <= ?", (mark,))
+    write_meta(conn, 'pruned_through', mark)
+    conn.commit()
+    return counts
+
+
+def _write_snapshot(path, rows, mark, epoch):
+    """ 寫入依 (注音, 權重由高到低) 排序的 (bpmf, word, freq)，回傳 (注音數, 詞數) """
+    key_offsets, entry_starts = array('I', [0]), array('I', [0])
+    freqs, word_offsets = array('q'), array('I', [0])
+    key_blob, word_blob = bytearray(), bytearray()
+    total, last_key = 0, None
+
+    for bpmf, word, freq in rows:
+        if bpmf != last_key:
+            if last_key is not None:
+                entry_starts.append(len(freqs))
+            key_blob += bpmf.encode('utf-8')
+            key_offsets.append(len(key_blob))
+            last_key = bpmf
+        freqs.append(freq)
+        word_blob += word.encode('utf-8')
+        word_offsets.append(len(word_blob))
+        total += max(freq, 0)
+    if last_key is not None:
+        entry_starts.append(len(freqs))
+
+    key_count = len(key_offsets) - 1
+    peaks = _build_peaks(freqs, entry_starts, key_count)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, key_count, len(freqs), total, mark, epoch))
+        for section in (key_offsets, entry_starts, freqs, word_offsets, peaks, key_blob, word_blob):
+            f.write(b'\0' * (_align(f.tell()) - f.tell()))
+            f.write(section.tobytes() if isinstance(section, array) else section)
+    os.replace(tmp_path, path)
+    return key_count, len(freqs)
+
+
+def read_meta(conn, key, default=0):
+    row = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else default
+
+
+def write_meta(conn, key, value):
+    conn.execute(
+        "INSERT INTO meta (key, value) VALUES (?, ?) ON CONFLICT (key) DO UPDATE SET value = excluded.value",
+        (key, value)
+    )
+
+
+class SnapshotNode:
+    """ 快照中某個注音的所有字詞，介面與 TrieNode 相同 """
+    __slots__ = ('_snapshot', '_start', '_end', '_words')
+
+    def __init__(self, snapshot, start, end):
+        self._snapshot = snapshot
+        self._start = start
+        self._end = end
+        self._words = None
+
+    @property
+    def words(self):
+        if self._words is None:
+            self._words = dict(self.top(self._end - self._start))
+        return self._words
+
+    def top(self, k):
+        """ 快照內已依權重排序，直接取前 k 個 """
+        snap = self._snapshot
+        return [(snap.word(i), snap.freqs[i]) for i in range(self._start, min(self._end, self._start + k))]
+
+
+class SnapshotIndex:
+    """ 以 mmap 開啟的唯讀字典快照，多個行程可共用同一份分頁快取 """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, key_count, entry_count, self.total, self.mark, self.epoch = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"不是有效的字典快照: {path}")
+        self.key_count = key_count
+        self.size = entry_count
+
+        view = memoryview(self._mm)
+        pos = HEADER.size
+
+        def section(count, fmt, itemsize):
+            nonlocal pos
+            pos = _align(pos)
+            part = view[pos:pos + count * itemsize].cast(fmt)
+            pos += count * itemsize
+            return part
+
+        self.key_offsets = section(key_count + 1, 'I', 4)
+        self.entry_starts = section(key_count + 1, 'I', 4)
+        self.freqs = section(entry_count, 'q', 8)
+        self.word_offsets = section(entry_count + 1, 'I', 4)
+        self._leaves = _leaf_count(key_count)
+        self.peaks = section(2 * self._leaves, 'q', 8)
+        pos = _align(pos)
+        self._key_base = pos
+        self._word_base = _align(pos + self.key_offsets[key_count])
+
+    def key(self, i):
+        return self._mm[self._key_base + self.key_offsets[i]:self._key_base + self.key_offsets[i + 1]]
+
+    def word(self, i):
+        return self._mm[self._word_base + self.word_offsets[i]:self._word_base + self.word_offsets[i + 1]].decode('utf-8')
+
+    def _lower_bound(self, key, lo=0):
+        hi = self.key_count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.key(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _node_at(self, i):
+        return SnapshotNode(self, self.entry_starts[i], self.entry_starts[i + 1])
+
+    def node(self, bpmf):
+        key = bpmf.encode('utf-8')
+        i = self._lower_bound(key)
+        if i < self.key_count and self.key(i) == key:
+            return self._node_at(i)
+        return None
+
+    def get(self, bpmf, word):
+        node = self.node(bpmf)
+        return node.words.get(word) if node is not None else None
+
+    def candidates(self, bpmf, limit=10):
+        node = self.node(bpmf)
+        return node.top(limit) if node is not None else []
+
+    def complete(self, prefix, limit=25):
+        """ 與 BpmfTrie.complete 相同：以 prefix 開頭的注音在排序後是連續區間，
+        用線段樹依最高權重逐步展開，只讀取前 limit 名經過的節點 """
+        key = prefix.encode('utf-8')
+        lo = self._lower_bound(key)
+        hi = self._lower_bound(key + b'\xff', lo)  # UTF-8 不會出現 0xff，可當作前綴的上界
+        if lo >= hi:
+            return []
+
+        peaks, leaves = self.peaks, self._leaves
+        tiebreak = itertools.count()
+        heap = []
+        left, right = lo + leaves, hi + leaves
+        while left < right:
+            if left & 1:
+                heap.append((-peaks[left], next(tiebreak), left))
+                left += 1
+            if right & 1:
+                right -= 1
+                heap.append((-peaks[right], next(tiebreak), right))
+            left >>= 1
+            right >>= 1
+        heapq.heapify(heap)
+
+        results = []
+        while heap and len(results) < limit:
+            _, _, i = heapq.heappop(heap)
+            if i >= leaves:
+                entry = self.entry_starts[i - leaves]
+                results.append((self.key(i - leaves).decode('utf-8'), self.word(entry), self.freqs[entry]))
+            else:
+                for child in (2 * i, 2 * i + 1):
+                    heapq.heappush(heap, (-peaks[child], next(tiebreak), child))
+        return results
+
+    def match(self, clean_segs, start, max_len=8):
+        """ 與 BpmfTrie.match 相同：逐音節延長鍵值，找不到任何以此為前綴的注音就停止 """
+        key, lo = b'', 0
+        for length in range(1, max_len + 1):
+            if start + length > len(clean_segs):
+                return
+            key += clean_segs[start + length - 1].encode('utf-8')
+            # 更長的鍵排序一定不小於較短的前綴，可從上次的位置繼續搜尋
+            lo = self._lower_bound(key, lo)
+            if lo >= self.key_count:
+                return
+            found = self.key(lo)
+            if not found.startswith(key):
+                return
+            if found == key:
+                yield length, self._node_at(lo)
+
+
+class OverlayIndex:
+    """ 底層索引 (快照或共用字典) 加上記憶體中的異動層：新增與調整存絕對權重，刪除另外記錄
+
+    異動層只佔用與異動筆數成正比的記憶體，底層可以被多個 OverlayIndex 共用。
+    """
+
+    def __init__(self, base):
+        self.base = base
+        self.overlay = BpmfTrie()
+        self.deleted = {}  # bpmf -> 已刪除的底層字詞集合
+        # 只記錄與底層的差距，底層本身仍可變動 (例如各伺服器共用的字典)；
+        # 底層之後再調整同一個詞時總和會略有誤差，只影響分數的正規化
+        self._total_delta = 0
+        self._size_delta = 0
+
+    @property
+    def total(self):
+        return self.base.total + self._total_delta
+
+    @property
+    def size(self):
+        return self.base.size + self._size_delta
+
+    def get(self, bpmf, word):
+        if word in self.deleted.get(bpmf, ()):
+            return None
+        freq = self.overlay.get(bpmf, word)
+        return freq if freq is not None else self.base.get(bpmf, word)
+
+    def set(self, bpmf, word, freq):
+        old = self.get(bpmf, word)
+        if old is None:
+            self._size_delta += 1
+        else:
+            self._total_delta -= max(old, 0)
+        self._total_delta += max(freq, 0)
+        deleted = self.deleted.get(bpmf)
+        if deleted:
+            deleted.discard(word)
+        self.overlay.set(bpmf, word, freq)
+
+    def add(self, bpmf, word, delta):
+        old = self.get(bpmf, word)
+        if old is None:
+            return False
+        self.set(bpmf, word, old + delta)
+        return True
+
+    def remove(self, bpmf, word):
+        old = self.get(bpmf, word)
+        if old is None:
+            return False
+        self.overlay.remove(bpmf, word)
+        if self.base.get(bpmf, word) is not None:
+            self.deleted.setdefault(bpmf, set()).add(word)
+        self._total_delta -= max(old, 0)
+        self._size_delta -= 1
+        return True
+
+    def _merge(self, bpmf, base_node, overlay_node):
+        """ 沒有異動的注音直接回傳底層節點，否則合併成新的節點 """
+        deleted = self.deleted.get(bpmf)
+        if overlay_node is None and not deleted:
+            return base_node
+        words = dict(base_node.words) if base_node is not None else {}
+        if deleted:
+            for word in deleted:
+                words.pop(word, None)
+        if overlay_node is not None:
+            words.update(overlay_node.words)
+        return TrieNode(words) if words else None
+
+    def node(self, bpmf):
+        return self._merge(bpmf, self.base.node(bpmf), self.overlay.node(bpmf))
+
+    def candidates(self, bpmf, limit=10):
+        node = self.node(bpmf)
+        return node.top(limit) if node is not None else []
+
+    def complete(self, prefix, limit=25):
+        if not self.overlay.size and not self.deleted:
+            return self.base.complete(prefix, limit)
+        # 底層結果可能已被覆蓋或刪除，多取一些再以合併後的節點重新排序
+        keys = {bpmf for bpmf, _, _ in self.base.complete(prefix, limit * 2)}
+        keys.update(bpmf for bpmf, _, _ in self.overlay.complete(prefix, limit))
+        results = []
+        for bpmf in keys:
+            node = self.node(bpmf)
+            if node is not None:
+                word, freq = node.top(1)[0]
+                results.append((bpmf, word, freq))
+        results.sort(key=lambda item: item[2], reverse=True)
+        return results[:limit]
+
+    def match(self, clean_segs, start, max_len=8):
+        if not self.overlay.size and not self.deleted:
+            yield from self.base.match(clean_segs, start, max_len)
+            return
+        base = dict(self.base.match(clean_segs, start, max_len))
+        overlay = dict(self.overlay.match(clean_segs, start, max_len))
+        for length in sorted(base.keys() | overlay.keys()):
+            bpmf = "".join(clean_segs[start:start + length])
+            node = self._merge(bpmf, base.get(length), overlay.get(length))
+            if node is not None:
+                yield length, node
@@ -0,0 +1,295 @@
+"""
+字典匯入 / 匯出工具 (請在機器人停止時執行)
+
+匯入 (串流讀檔、分批寫入)：
+    python dict_tool.py import lexicon.tsv
+    python dict_tool.py import tsi.src --format chewing
+    python dict_tool.py import data.txt --format mcbopomofo
+    python dict_tool.py import words.json --on-conflict add
+匯出：
+    python dict_tool.py export backup.tsv
+    python dict_tool.py export backup.jsonl
+編譯唯讀快照 (機器人以 mmap 開啟，啟動不必重建索引)：
+    python dict_tool.py snapshot dictionary.snap
+整理資料庫 (切換成 incremental auto_vacuum，之後由機器人的定期維護分批歸還空間)：
+    python dict_tool.py vacuum
+
+支援格式：
+    tsv         注音<TAB>詞<TAB>權重 (權重可省略)
+    json/jsonl  [{"bpmf": ..., "word": ..., "freq": ...}, ...]，或 {注音: {詞: 權重}}
+    chewing     libchewing tsi.src：詞 權重 注音1 注音2 ...
+    mcbopomofo  McBopomofo data.txt：注音1-注音2 詞 分數 (log10 機率)
+"""
+import argparse
+import json
+import sqlite3
+import sys
+import time
+
+from local_engine import BpmfEngine
+from dict_snapshot import build_snapshot, read_meta, write_meta
+
+CHUNK_SIZE = 50000
+DEFAULT_FREQ = 1000
+
+# 匯入時遇到已存在的 (注音, 詞) 的處理方式
+CONFLICT_SQL = {
+    'replace': "ON CONFLICT (bpmf, word) DO UPDATE SET freq = excluded.freq",
+    'keep': "ON CONFLICT (bpmf, word) DO NOTHING",
+    'add': "ON CONFLICT (bpmf, word) DO UPDATE SET freq = freq + excluded.freq",
+    'max': "ON CONFLICT (bpmf, word) DO UPDATE SET freq = max(freq, excluded.freq)",
+}
+
+_FORMATS_BY_EXT = {
+    'tsv': 'tsv', 'txt': 'tsv', 'json': 'json', 'jsonl': 'jsonl',
+    'src': 'chewing',
+}
+
+
+def clean_key(syllables):
+    """ 與 BpmfEngine 相同的字典鍵：去掉一聲符號與分隔符號後串接 """
+    return "".join(s.replace('ˉ', '').strip() for s in syllables)
+
+
+def _split_syllables(bpmf):
+    return bpmf.replace('-', ' ').replace(',', ' ').split()
+
+
+def read_tsv(f):
+    for line in f:
+        line = line.rstrip('\n')
+        if not line or line.startswith('#'):
+            continue
+        parts = line.split('\t')
+        if len(parts) < 2:
+            continue
+        freq = int(float(parts[2])) if len(parts) > 2 and parts[2] else DEFAULT_FREQ
+        yield clean_key(_split_syllables(parts[0])), parts[1], freq
+
+
+def read_chewing(f):
+    for line in f:
+        parts = line.split()
+        if len(parts) < 3 or parts[0].startswith('#'):
+            continue
+        yield clean_key(parts[2:]), parts[0], int(parts[1])
+
+
+def mcbopomofo_freq(score):
+    """ McBopomofo 分數為 log10 機率 (負數)，換算成與本字典相近量級的整數權重 """
+    return max(1, int(round(10 ** (score + 7))))
+
+
+def read_mcbopomofo(f):
+    for line in f:
+        parts = line.split()
+        if len(parts) < 3 or parts[0].startswith('#') or parts[0].startswith('_'):
+            continue
+        try:
+            score = float(parts[2])
+        except ValueError:
+            continue
+        yield clean_key(parts[0].split('-')), parts[1], mcbopomofo_freq(score)
+
+
+def _entry_row(item):
+    bpmf = item['bpmf']
+    if isinstance(bpmf, list):
+        bpmf = clean_key(bpmf)
+    else:
+        bpmf = clean_key(_split_syllables(bpmf))
+    # 匯出的 json/jsonl 帶有 is_custom，還原備份時手動學習的詞仍會參與權重衰減
+    return bpmf, item['word'], int(item.get('freq', DEFAULT_FREQ)), int(item.get('is_custom', 0))
+
+
+def read_jsonl(f):
+    for line in f:
+        line = line.strip()
+        if line:
+            yield _entry_row(json.loads(line))
+
+
+def _iter_json_array(f, decoder, buffer):
+    """ 以 raw_decode 逐一解析最外層陣列的元素，不需把整個檔案讀進記憶體 """
+    pos = 1  # 跳過 '['
+    while True:
+        while True:
+            while pos < len(buffer) and buffer[pos] in ' \t\r\n,':
+                pos += 1
+            if pos < len(buffer):
+                break
+            chunk = f.read(1 << 20)
+            if not chunk:
+                return
+            buffer, pos = buffer[pos:] + chunk, 0
+        if buffer[pos] == ']':
+            return
+        while True:
+            try:
+                item, end = decoder.raw_decode(buffer, pos)
+                break
+            except json.JSONDecodeError:
+                chunk = f.read(1 << 20)
+                if not chunk:
+                    raise
+                buffer, pos = buffer[pos:] + chunk, 0
+        yield item
+        pos = end
+
+
+def read_json(f):
+    head = f.read(1 << 20).lstrip()
+    if head.startswith('['):
+        for item in _iter_json_array(f, json.JSONDecoder(), head):
+            yield _entry_row(item)
+        return
+
+    # {注音: {詞: 權重}} 或 {注音: [詞, ...]} 只能整份載入
+    data = json.loads(head + f.read())
+    for bpmf, words in data.items():
+        key = clean_key(_split_syllables(bpmf))
+        if isinstance(words, dict):
+            for word, freq in words.items():
+                yield key, word, int(freq)
+        else:
+            for word in words:
+                yield key, word, DEFAULT_FREQ
+
+
+READERS = {
+    'tsv': read_tsv,
+    'json': read_json,
+    'jsonl': read_jsonl,
+    'chewing': read_chewing,
+    'mcbopomofo': read_mcbopomofo,
+}
+
+
+def _chunks(rows, size):
+    chunk = []
+    for row in rows:
+        if row[0] and row[1]:
+            chunk.append(row if len(row) == 4 else (*row, 0))
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def import_rows(conn, rows, on_conflict='max', chunk_size=CHUNK_SIZE):
+    """ 分批寫入字典：先移除 idx_bpmf，每批一個交易，全部寫完後再重建索引
+
+    rows 為 (注音, 詞, 權重) 或 (注音, 詞, 權重, is_custom)，前者視為匯入的詞庫 (is_custom = 0)。
+    """
+    BpmfEngine.init_schema(conn)
+    cursor = conn.cursor()
+    # 大量載入專用設定，結束後恢復 WAL
+    cursor.execute('PRAGMA journal_mode=MEMORY')
+    cursor.execute('PRAGMA synchronous=OFF')
+    cursor.execute('PRAGMA temp_store=MEMORY')
+    cursor.execute('PRAGMA cache_size=-200000')
+    cursor.execute('DROP INDEX IF EXISTS idx_bpmf')
+
+    sql = f'''
+        INSERT INTO dictionary (bpmf, word, freq, is_custom)
+        VALUES (?, ?, ?, ?)
+        {CONFLICT_SQL[on_conflict]}
+    '''
+    total = 0
+    try:
+        for chunk in _chunks(rows, chunk_size):
+            cursor.execute('BEGIN')
+            cursor.executemany(sql, chunk)
+            cursor.execute('COMMIT')
+            total += len(chunk)
+            print(f"… 已匯入 {total} 筆", file=sys.stderr)
+    finally:
+        if conn.in_transaction:
+            conn.rollback()
+        # 大量匯入不寫變更記錄，讓既有的快照失效
+        write_meta(conn, 'epoch', read_meta(conn, 'epoch') + 1)
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_bpmf ON dictionary (bpmf)')
+        cursor.execute('ANALYZE dictionary')
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+    return total
+
+
+def export_rows(conn, f, fmt):
+    """ 依注音排序串流輸出整個字典 """
+    cursor = conn.execute("SELECT bpmf, word, freq, is_custom FROM dictionary ORDER BY bpmf, freq DESC")
+    count = 0
+    if fmt == 'json':
+        f.write('[\n')
+    for bpmf, word, freq, is_custom in cursor:
+        if fmt == 'tsv':
+            f.write(f"{bpmf}\t{word}\t{freq}\n")
+        else:
+            line = json.dumps({'bpmf': bpmf, 'word': word, 'freq': freq, 'is_custom': is_custom}, ensure_ascii=False)
+            if fmt == 'json':
+                f.write((',\n' if count else '') + line)
+            else:
+                f.write(line + '\n')
+        count += 1
+    if fmt == 'json':
+        f.write('\n]\n')
+    return count
+
+
+def _guess_format(path, fmt):
+    if fmt:
+        return fmt
+    return _FORMATS_BY_EXT.get(path.rsplit('.', 1)[-1].lower(), 'tsv')
+
+
+def main():
+    parser = argparse.ArgumentParser(description="注音字典匯入 / 匯出工具")
+    parser.add_argument('--db', default='dictionary.db', help="字典資料庫路徑")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p_import = sub.add_parser('import', help="匯入詞庫")
+    p_import.add_argument('path')
+    p_import.add_argument('--format', choices=sorted(READERS), help="預設依副檔名判斷")
+    p_import.add_argument('--on-conflict', choices=sorted(CONFLICT_SQL), default='max',
+                          help="詞已存在時：replace 覆蓋、keep 保留、add 相加、max 取大 (預設)")
+    p_import.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+
+    p_export = sub.add_parser('export', help="匯出字典")
+    p_export.add_argument('path')
+    p_export.add_argument('--format', choices=['tsv', 'json', 'jsonl'], help="預設依副檔名判斷")
+
+    p_snapshot = sub.add_parser('snapshot', help="編譯唯讀字典快照")
+    p_snapshot.add_argument('path', nargs='?', default='dictionary.snap')
+
+    sub.add_parser('vacuum', help="完整整理資料庫並切換成 incremental auto_vacuum")
+
+    args = parser.parse_args()
+    conn = sqlite3.connect(args.db, isolation_level=None)
+    start = time.perf_counter()
+
+    if args.command == 'import':
+        fmt = _guess_format(args.path, args.format)
+        with open(args.path, encoding='utf-8') as f:
+            total = import_rows(conn, READERS[fmt](f), args.on_conflict, args.chunk_size)
+        print(f"✅ 已匯入 {total} 筆 ({time.perf_counter() - start:.1f}s)")
+    elif args.command == 'export':
+        fmt = _guess_format(args.path, args.format)
+        with open(args.path, 'w', encoding='utf-8') as f:
+            total = export_rows(conn, f, fmt)
+        print(f"✅ 已匯出 {total} 筆 ({time.perf_counter() - start:.1f}s)")
+    elif args.command == 'vacuum':
+        BpmfEngine.init_schema(conn)
+        conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+        conn.execute('VACUUM')
+        conn.execute('ANALYZE')
+        print(f"✅ 資料庫整理完成 ({time.perf_counter() - start:.1f}s)")
+    else:
+        BpmfEngine.init_schema(conn)
+        keys, total = build_snapshot(conn, args.path)
+        print(f"✅ 已建立快照 {args.path}：{keys} 個注音、{total} 筆 ({time.perf_counter() - start:.1f}s)")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,345 @@
+"""
+本機字典服務：多個分片 (shard) 行程透過 Unix socket 共用同一個 BpmfEngine
+
+    python engine_service.py --shards 4              # 字典服務 + 4 個 bot.py 分片行程
+    python engine_service.py --socket /tmp/bpmf-engine.sock   # 只啟動字典服務
+
+通訊格式為「4 位元組長度 + JSON」的訊框，每個訊框是一批請求 [{id, method, args}]，
+回應同樣是一批 [{id, result} 或 {id, error}]。客戶端會把同一輪事件迴圈內的呼叫合併成一個訊框。
+
+分片之間分攤的是 Discord 連線與訊息處理；字典查詢與解碼都在這個服務行程中執行，只用到一個核心。
+"""
+import argparse
+import asyncio
+import inspect
+import json
+import os
+import signal
+import struct
+import subprocess
+import sys
+
+from async_engine import AsyncBpmfEngine
+from bpmf_segmenter import segment_ascii
+from local_engine import BpmfEngine
+from dict_maintenance import maintenance_loop
+from metrics import register_engine_gauges, serve_metrics
+from translation_cache import LRUCache
+
+_LENGTH = struct.Struct('>I')
+
+# 允許遠端呼叫的 AsyncBpmfEngine 方法
+METHODS = {
+    'convert', 'convert_batch', 'decode', 'get_candidates', 'complete', 'is_ignored', 'ignored_spans',
+    'list_ignore_patterns', 'get_backfill_progress', 'cache_stats',
+    'add_word', 'delete_word', 'increase_weight', 'decrease_weight',
+    'add_ignore_pattern', 'remove_ignore_pattern', 'save_backfill_progress',
+}
+
+
+def write_frame(writer, payload):
+    data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+    writer.write(_LENGTH.pack(len(data)) + data)
+
+
+async def read_frame(reader):
+    """ 讀取一個訊框，連線結束時回傳 None """
+    try:
+        header = await reader.readexactly(_LENGTH.size)
+        data = await reader.readexactly(_LENGTH.unpack(header)[0])
+    except (asyncio.IncompleteReadError, ConnectionError):
+        return None
+    return json.loads(data)
+
+
+class EngineServer:
+    """ 在 Unix socket 上提供 AsyncBpmfEngine，每批請求並行處理後一次回覆 """
+
+    def __init__(self, engine, path):
+        self.engine = engine
+        self.path = path
+        self._server = None
+        self._writers = set()
+
+    async def start(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)  # 上次異常結束留下的 socket 檔
+        self._server = await asyncio.start_unix_server(self._handle, path=self.path)
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            # 仍連線中的客戶端也一併斷線，它們下次呼叫時會重新連線
+            for writer in tuple(self._writers):
+                writer.close()
+            await self._server.wait_closed()
+            self._server = None
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+    async def _handle(self, reader, writer):
+        lock = asyncio.Lock()
+        tasks = set()
+        self._writers.add(writer)
+        try:
+            while True:
+                batch = await read_frame(reader)
+                if batch is None:
+                    break
+                task = asyncio.create_task(self._serve_batch(batch, writer, lock))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+    async def _serve_batch(self, batch, writer, lock):
+        responses = await asyncio.gather(*(self._call(request) for request in batch))
+        async with lock:
+            write_frame(writer, responses)
+            await writer.drain()
+
+    async def _call(self, request):
+        method = request.get('method')
+        if method not in METHODS:
+            return {'id': request.get('id'), 'error': f"不支援的方法: {method}"}
+        try:
+            result = getattr(self.engine, method)(*request.get('args', ()))
+            if inspect.isawaitable(result):
+                result = await result
+            return {'id': request['id'], 'result': result}
+        except Exception as e:
+            return {'id': request['id'], 'error': f"{type(e).__name__}: {e}"}
+
+
+class EngineClient:
+    """ 與 AsyncBpmfEngine 介面相同的遠端客戶端，供分片行程使用 """
+
+    def __init__(self, path, cache_size=4096, connect_timeout=30.0):
+        self.path = path
+        self.connect_timeout = connect_timeout
+        self.segment_cache = LRUCache(cache_size)  # 切字不需要字典，在本行程處理
+        self._reader = None
+        self._writer = None
+        self._reader_task = None
+        self._futures = {}
+        self._outgoing = []
+        self._next_id = 0
+        self._connect_lock = asyncio.Lock()
+
+    @property
+    def connected(self):
+        return self._reader_task is not None and not self._reader_task.done()
+
+    async def start(self):
+        """ 連線到字典服務 (服務尚未啟動或重新啟動中時會等待) """
+        async with self._connect_lock:
+            if self.connected:
+                return
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + self.connect_timeout
+            while True:
+                try:
+                    self._reader, self._writer = await asyncio.open_unix_connection(self.path)
+                    break
+                except (FileNotFoundError, ConnectionRefusedError):
+                    if loop.time() > deadline:
+                        raise
+                    await asyncio.sleep(0.2)
+            self._reader_task = asyncio.create_task(self._read_loop())
+
+    async def close(self, close_engine=True):
+        """ 只關閉連線，字典服務由它自己的行程負責關閉 """
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        if self._reader_task is not None:
+            await self._reader_task
+            self._reader_task = None
+
+    async def _read_loop(self):
+        reader, writer = self._reader, self._writer
+        try:
+            while True:
+                batch = await read_frame(reader)
+                if batch is None:
+                    break
+                for response in batch:
+                    future = self._futures.pop(response['id'], None)
+                    if future is None or future.done():
+                        continue
+                    if 'error' in response:
+                        future.set_exception(RuntimeError(response['error']))
+                    else:
+                        future.set_result(response['result'])
+        finally:
+            # 之後的呼叫由 _call 重新連線
+            writer.close()
+            error = ConnectionError("字典服務連線中斷")
+            for future in self._futures.values():
+                if not future.done():
+                    future.set_exception(error)
+            self._futures.clear()
+
+    def _flush(self):
+        batch, self._outgoing = self._outgoing, []
+        if batch and self._writer is not None:
+            write_frame(self._writer, batch)
+
+    async def _call(self, method, *args):
+        if not self.connected:
+            await self.start()
+        loop = asyncio.get_running_loop()
+        self._next_id += 1
+        future = loop.create_future()
+        self._futures[self._next_id] = future
+        # 同一輪事件迴圈內的請求合併成一個訊框送出
+        if not self._outgoing:
+            loop.call_soon(self._flush)
+        self._outgoing.append({'id': self._next_id, 'method': method, 'args': args})
+        return await future
+
+    # --- 純記憶體操作 ---
+    def segment(self, text):
+        segments = self.segment_cache.get(text)
+        if segments is None:
+            ascii_segs, bopomofo_segs = segment_ascii(text)
+            segments = (tuple(ascii_segs), tuple(bopomofo_segs))
+            self.segment_cache.put(text, segments)
+        return segments
+
+    def cache_stats(self):
+        return {'segment': self.segment_cache.stats()}
+
+    # --- 遠端呼叫 ---
+    async def remote_cache_stats(self):
+        return await self._call('cache_stats')
+
+    async def convert(self, bopomofo_segs, guild_id=0):
+        return await self._call('convert', list(bopomofo_segs), guild_id)
+
+    async def convert_batch(self, segs_list, guild_id=0):
+        return await self._call('convert_batch', [list(segs) for segs in segs_list], guild_id)
+
+    async def convert_many(self, segs_list, guild_id=0, chunk_size=64):
+        for start in range(0, len(segs_list), chunk_size):
+            for i, text in await self.convert_batch(segs_list[start:start + chunk_size], guild_id):
+                yield start + i, text
+
+    async def decode(self, bopomofo_segs, k=3, guild_id=0, session=None):
+        return await self._call('decode', list(bopomofo_segs), k, guild_id, session)
+
+    async def get_candidates(self, bpmf, guild_id=0):
+        return await self._call('get_candidates', bpmf, guild_id)
+
+    async def complete(self, prefix, limit=25, guild_id=0):
+        return await self._call('complete', prefix, limit, guild_id)
+
+    async def is_ignored(self, content, guild_id=0):
+        return await self._call('is_ignored', content, guild_id)
+
+    async def ignored_spans(self, content, guild_id=0):
+        return [tuple(span) for span in await self._call('ignored_spans', content, guild_id)]
+
+    async def list_ignore_patterns(self, guild_id=0):
+        return await self._call('list_ignore_patterns', guild_id)
+
+    async def get_backfill_progress(self, channel_id):
+        progress = await self._call('get_backfill_progress', channel_id)
+        if progress is None:
+            return None
+        before_id, scanned, replied = progress
+        return before_id, scanned, [tuple(marker) for marker in replied]
+
+    async def save_backfill_progress(self, channel_id, before_id, scanned, replied=()):
+        return await self._call('save_backfill_progress', channel_id, before_id, scanned, list(replied))
+
+    async def add_word(self, word, bpmf_list, guild_id=0):
+        return await self._call('add_word', word, list(bpmf_list), guild_id)
+
+    async def delete_word(self, word, bpmf, guild_id=0):
+        return await self._call('delete_word', word, bpmf, guild_id)
+
+    async def increase_weight(self, word, bpmf, guild_id=0):
+        return await self._call('increase_weight', word, bpmf, guild_id)
+
+    async def decrease_weight(self, word, bpmf, guild_id=0):
+        return await self._call('decrease_weight', word, bpmf, guild_id)
+
+    async def add_ignore_pattern(self, pattern, guild_id=0):
+        return await self._call('add_ignore_pattern', pattern, guild_id)
+
+    async def remove_ignore_pattern(self, pattern, guild_id=0):
+        return await self._call('remove_ignore_pattern', pattern, guild_id)
+
+
+def spawn_shards(shard_count, socket_path):
+    """ 以 bot.py 啟動 shard_count 個分片行程，透過環境變數告知分片編號與字典服務位置 """
+    bot_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bot.py')
+    shards = []
+    for shard_id in range(shard_count):
+        env = dict(os.environ, BPMF_SHARD_ID=str(shard_id), BPMF_SHARD_COUNT=str(shard_count),
+                   BPMF_ENGINE_SOCKET=socket_path)
+        shards.append(subprocess.Popen([sys.executable, bot_path], env=env))
+    return shards
+
+
+async def _wait_shards(shards):
+    """ 任一分片行程結束就回傳 """
+    while all(p.poll() is None for p in shards):
+        await asyncio.sleep(1)
+
+
+async def serve(socket_path, db_path='dictionary.db', snapshot_path='dictionary.snap', shard_count=0,
+                metrics_port=None):
+    """ 啟動字典服務 (與分片)，收到 SIGINT/SIGTERM 或任一分片結束後寫完剩餘回饋再結束 """
+    engine = AsyncBpmfEngine(BpmfEngine(db_path, snapshot_path=snapshot_path))
+    await engine.start()
+    register_engine_gauges(engine)
+    if metrics_port:
+        await serve_metrics(metrics_port)
+    server = EngineServer(engine, socket_path)
+    await server.start()
+    maintenance = asyncio.create_task(maintenance_loop(engine))
+    print(f"✅ 字典服務已啟動: {socket_path}")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    shards = spawn_shards(shard_count, socket_path) if shard_count else []
+    waiters = [asyncio.create_task(stop.wait())]
+    if shards:
+        waiters.append(asyncio.create_task(_wait_shards(shards)))
+    await asyncio.wait(waiters, return_when=asyncio.FIRST_COMPLETED)
+    for task in waiters:
+        task.cancel()
+
+    # 先關分片，最後關字典服務
+    for p in shards:
+        if p.poll() is None:
+            p.terminate()
+    for p in shards:
+        await loop.run_in_executor(None, p.wait)
+    maintenance.cancel()
+    await server.close()
+    await engine.close()
+    print("👋 字典服務已關閉")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本機共用字典服務")
+    parser.add_argument('--socket', default='/tmp/bpmf-engine.sock')
+    parser.add_argument('--db', default='dictionary.db')
+    parser.add_argument('--snapshot', default='dictionary.snap')
+    parser.add_argument('--shards', type=int, default=0, help="同時啟動的 bot.py 分片行程數 (0 = 只啟動字典服務)")
+    parser.add_argument('--metrics-port', type=int, help="字典服務的 Prometheus 計量連接埠")
+    args = parser.parse_args()
+    asyncio.run(serve(args.socket, args.db, args.snapshot, args.shards, args.metrics_port))
+
+
+if __name__ == "__main__":
+    main()
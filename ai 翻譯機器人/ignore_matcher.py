@@ -0,0 +1,166 @@
+import fnmatch
+import re
+import threading
+
+# 全域忽略模式 (所有伺服器共用) 的 guild_id
+GLOBAL_SCOPE = 0
+
+_WILDCARDS = set('*?[')
+_TOKEN = re.compile(r'\S+')
+_ESCAPED = re.compile(r'\[([*?[])\]')
+
+
+class _PrefixNode:
+    __slots__ = ('children', 'terminal')
+
+    def __init__(self):
+        self.children = {}
+        self.terminal = False
+
+
+class _Compiled:
+    """ 某一時間點的比對結構，建立後不再修改，讀取執行緒不需加鎖 """
+    __slots__ = ('exact', 'prefix_root', 'glob_regex')
+
+    def __init__(self, exact=frozenset(), prefix_root=None, glob_regex=None):
+        self.exact = exact
+        self.prefix_root = prefix_root
+        self.glob_regex = glob_regex
+
+    def __bool__(self):
+        return bool(self.exact) or self.prefix_root is not None or self.glob_regex is not None
+
+    def match(self, text):
+        if text in self.exact:
+            return True
+        node = self.prefix_root
+        if node is not None:
+            if node.terminal:
+                return True  # 單獨的 * (空前綴) 符合任何文字
+            for char in text:
+                node = node.children.get(char)
+                if node is None:
+                    break
+                if node.terminal:
+                    return True
+        return self.glob_regex is not None and self.glob_regex.match(text) is not None
+
+
+class _ScopePatterns:
+    """ 單一範圍 (伺服器) 的忽略模式：完整比對用集合、前綴用字典樹、其他萬用字元用合併的正規表示式
+
+    異動只在寫入端 (持有 IgnoreMatcher 的鎖) 進行，改完立即重建並整份替換 compiled，
+    讀取執行緒只看 compiled，不會碰到修改到一半的集合。
+    """
+
+    def __init__(self):
+        self.exact = set()
+        self.prefixes = set()
+        self.globs = set()
+        self.compiled = _Compiled()
+
+    def add(self, pattern):
+        kind = classify_pattern(pattern)
+        if kind == 'exact':
+            self.exact.add(pattern)
+        elif kind == 'prefix':
+            self.prefixes.add(pattern[:-1])
+        else:
+            self.globs.add(pattern)
+
+    def remove(self, pattern):
+        kind = classify_pattern(pattern)
+        if kind == 'exact':
+            self.exact.discard(pattern)
+        elif kind == 'prefix':
+            self.prefixes.discard(pattern[:-1])
+        else:
+            self.globs.discard(pattern)
+
+    def rebuild(self):
+        root = None
+        if self.prefixes:
+            root = _PrefixNode()
+            for prefix in self.prefixes:
+                node = root
+                for char in prefix:
+                    node = node.children.setdefault(char, _PrefixNode())
+                node.terminal = True
+        regex = re.compile('|'.join(fnmatch.translate(g) for g in self.globs)) if self.globs else None
+        self.compiled = _Compiled(frozenset(self.exact), root, regex)
+
+
+def unescape_pattern(pattern):
+    """ glob.escape 的反向 ([*] [?] [[] 還原成原字元)，顯示 🚫 按鈕加入的模式時使用 """
+    return _ESCAPED.sub(r'\1', pattern)
+
+
+def classify_pattern(pattern):
+    """ 判斷模式種類：exact (完整比對)、prefix (結尾為 * 的前綴) 或 glob (其他萬用字元) """
+    if not any(char in _WILDCARDS for char in pattern):
+        return 'exact'
+    if pattern.endswith('*') and not any(char in _WILDCARDS for char in pattern[:-1]):
+        return 'prefix'
+    return 'glob'
+
+
+class IgnoreMatcher:
+    """ 常駐記憶體的忽略模式比對器，支援全域與各伺服器範圍，比對整則訊息或找出其中被忽略的單字
+
+    add/remove 由寫入執行緒呼叫，match/spans 可在任意讀取執行緒同時呼叫。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._scopes = {}  # guild_id -> _ScopePatterns，只在持有鎖時修改
+        self._compiled = {}  # guild_id -> _Compiled，整份替換，讀取端不加鎖
+
+    def load(self, rows):
+        """ 從 (guild_id, pattern) 資料列載入 """
+        with self._lock:
+            for guild_id, pattern in rows:
+                self._scopes.setdefault(guild_id, _ScopePatterns()).add(pattern.lower())
+            self._publish(list(self._scopes))
+
+    def add(self, pattern, guild_id=GLOBAL_SCOPE):
+        with self._lock:
+            self._scopes.setdefault(guild_id, _ScopePatterns()).add(pattern.lower())
+            self._publish([guild_id])
+
+    def remove(self, pattern, guild_id=GLOBAL_SCOPE):
+        with self._lock:
+            scope = self._scopes.get(guild_id)
+            if scope is not None:
+                scope.remove(pattern.lower())
+                self._publish([guild_id])
+
+    def _publish(self, guild_ids):
+        """ 重建異動過的範圍，再整份替換 _compiled """
+        compiled = dict(self._compiled)
+        for guild_id in guild_ids:
+            scope = self._scopes[guild_id]
+            scope.rebuild()
+            compiled[guild_id] = scope.compiled
+        self._compiled = compiled
+
+    def _scopes_for(self, guild_id):
+        compiled = self._compiled
+        scopes = [compiled.get(GLOBAL_SCOPE)]
+        if guild_id != GLOBAL_SCOPE:
+            scopes.append(compiled.get(guild_id))
+        return [scope for scope in scopes if scope]
+
+    def match(self, content, guild_id=GLOBAL_SCOPE):
+        """ 整則訊息符合全域或該伺服器的忽略模式即回傳 True """
+        content = content.lower()
+        return any(scope.match(content) for scope in self._scopes_for(guild_id))
+
+    def spans(self, content, guild_id=GLOBAL_SCOPE):
+        """ 被忽略的範圍 [(start, end)]：整則訊息符合時為整則，否則為符合的單字，其餘部分仍可翻譯 """
+        scopes = self._scopes_for(guild_id)
+        if not scopes:
+            return []
+        if any(scope.match(content.lower()) for scope in scopes):
+            return [(0, len(content))]
+        return [token.span() for token in _TOKEN.finditer(content)
+                if any(scope.match(token.group().lower()) for scope in scopes)]
@@ -1,16 +1,70 @@
 import sqlite3
 import os
+import threading
+from bpmf_index import BpmfTrie
+from bpmf_decoder import decode_lattice, decode_incremental, MemoIndex
+from write_behind import WriteBehindQueue
+from translation_cache import LRUCache
+from bpmf_segmenter import segment_ascii
+from ignore_matcher import IgnoreMatcher, GLOBAL_SCOPE
+from dict_snapshot import SnapshotIndex, OverlayIndex, read_meta, write_meta, toneless_path
+from bpmf_toneless import TonelessIndex
+from metrics import metrics
+
+
+def _count_sql(statement):
+    metrics.inc('bpmf_sql_statements_total')
+
 
 class BpmfEngine:
-    def __init__(self, db_path='dictionary.db'):
+    def __init__(self, db_path='dictionary.db', flush_interval=2.0, flush_size=500, cache_size=4096,
+                 snapshot_path=None):
         self.db_path = db_path
+        self.snapshot_path = snapshot_path
         self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.conn.set_trace_callback(_count_sql)
         self.cursor = self.conn.cursor()
+        self._local = threading.local()  # 每個讀取執行緒各自的連線
+        self._readers = []  # 所有讀取連線，關閉時一併關閉
+        self._readers_lock = threading.Lock()
+        self._write_lock = threading.Lock()  # 保護寫入連線 self.conn
         self.init_db()
+        self.index = BpmfTrie()
+        self.load_index()
+        self.guild_indexes = {}  # guild_id -> 只含該伺服器異動的 OverlayIndex
+        self.guild_toneless = {}  # guild_id -> 疊在共用無聲調索引上的 TonelessIndex
+        self.load_guild_overlays()
+        self.ignores = IgnoreMatcher()
+        self.cursor.execute("SELECT guild_id, pattern FROM ignore_patterns")
+        self.ignores.load(self.cursor.fetchall())
+
+        # 常見亂碼的切字與翻譯結果快取；字典每次異動 generation 加一，舊翻譯自動失效
+        self.generation = 0
+        self.segment_cache = LRUCache(cache_size)
+        self.translation_cache = LRUCache(cache_size)
+        self.lattice_cache = LRUCache(cache_size)  # 訊息 -> 上次的詞圖，編輯後只重算變動的部分
+
+        # 權重與學習寫入先進佇列，每 flush_interval 秒或累積 flush_size 筆時一次提交
+        self.flush_interval = flush_interval
+        self.writes = WriteBehindQueue(flush_size)
+        self._closing = threading.Event()
+        self._flusher = threading.Thread(target=self._flush_loop, name='bpmf-flusher', daemon=True)
+        self._flusher.start()
 
     def init_db(self):
         """ 初始化 SQL 數據表與索引 """
-        self.cursor.execute('''
+        self.init_schema(self.conn)
+
+    @staticmethod
+    def init_schema(conn):
+        """ 建立 (或升級) 資料表，也供匯入工具與效能測試直接使用 """
+        cursor = conn.cursor()
+        # 刪除的頁面留在檔案內，由維護工作以 incremental_vacuum 分批歸還 (只對新建的資料庫生效)
+        cursor.execute('PRAGMA auto_vacuum=INCREMENTAL')
+        # WAL 模式下批次提交不必每次都完整 fsync，讀取也不會被寫入擋住
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+        cursor.execute('''
             CREATE TABLE IF NOT EXISTS dictionary (
                 bpmf TEXT,        -- 注音組合 (如: ㄐㄧㄚ)
                 word TEXT,        -- 對應漢字 (如: 家)
@@ -19,173 +73,571 @@ class BpmfEngine:
                 PRIMARY KEY (bpmf, word)
             )
         ''')
-        self.cursor.execute('CREATE INDEX IF NOT EXISTS idx_bpmf ON dictionary (bpmf)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_bpmf ON dictionary (bpmf)')
+
+        # 字典變更記錄 (freq 為 NULL 代表刪除)，啟動時用來把快照之後的寫入疊回去
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS dictionary_changes (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                bpmf TEXT,
+                word TEXT,
+                freq INTEGER
+            )
+        ''')
+        # 各伺服器自己的字典異動 (寫入時複製的絕對權重，NULL 代表該伺服器刪除了共用字典的詞)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS guild_dictionary (
+                guild_id INTEGER,
+                bpmf TEXT,
+                word TEXT,
+                freq INTEGER,
+                PRIMARY KEY (guild_id, bpmf, word)
+            )
+        ''')
+        # /backfill 每個頻道掃描到哪裡 (before_id 為已掃描過最舊的訊息)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS backfill_progress (
+                channel_id INTEGER PRIMARY KEY,
+                before_id INTEGER,
+                scanned INTEGER
+            )
+        ''')
+        # 已看到機器人回覆、但原訊息還沒掃描到的標記，續傳時沿用
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS backfill_replied (
+                channel_id INTEGER,
+                message_id INTEGER,  -- 被回覆的訊息 id；author_id 不為 0 時為該作者合併訊息範圍的下限
+                author_id INTEGER,
+                PRIMARY KEY (channel_id, message_id, author_id)
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value INTEGER
+            )
+        ''')
         
+        # 舊版忽略模式表沒有 guild_id，搬移成全域模式
+        columns = [row[1] for row in cursor.execute("PRAGMA table_info(ignore_patterns)").fetchall()]
+        if columns and 'guild_id' not in columns:
+            cursor.execute("ALTER TABLE ignore_patterns RENAME TO ignore_patterns_old")
+
         # 新增忽略模式表
-        self.cursor.execute('''
+        cursor.execute('''
             CREATE TABLE IF NOT EXISTS ignore_patterns (
-                pattern TEXT PRIMARY KEY  -- 需要忽略的亂碼模式
+                guild_id INTEGER NOT NULL DEFAULT 0,  -- 0 為全域，其他為伺服器 ID
+                pattern TEXT,                         -- 需要忽略的亂碼模式 (可用 * ? 萬用字元)
+                PRIMARY KEY (guild_id, pattern)
             )
         ''')
-        self.conn.commit()
+        if columns and 'guild_id' not in columns:
+            cursor.execute("INSERT OR IGNORE INTO ignore_patterns (guild_id, pattern) SELECT 0, pattern FROM ignore_patterns_old")
+            cursor.execute("DROP TABLE ignore_patterns_old")
+        # 比對不分大小寫，模式一律以小寫儲存 (舊資料照原樣輸入的一併轉換，重複的合併)
+        rows = cursor.execute("SELECT guild_id, pattern FROM ignore_patterns").fetchall()
+        mixed = [(guild_id, pattern) for guild_id, pattern in rows if pattern != pattern.lower()]
+        if mixed:
+            cursor.executemany("INSERT OR IGNORE INTO ignore_patterns (guild_id, pattern) VALUES (?, ?)",
+                               [(guild_id, pattern.lower()) for guild_id, pattern in mixed])
+            cursor.executemany("DELETE FROM ignore_patterns WHERE guild_id = ? AND pattern = ?", mixed)
+        conn.commit()
 
-    def add_word(self, word, bpmf_list):
-        """ 強化權重邏輯：完整詞高權重，單字權重隨學習次數累積 """
-        try:
-            # 1. 單字拆解分類 (權重累加制)
-            if len(word) == len(bpmf_list):
-                for i in range(len(word)):
-                    char = word[i]
-                    char_bpmf = bpmf_list[i].replace('ˉ', '').strip()
-                    
-                    # 檢查該字是否已存在於該注音分類
-                    self.cursor.execute(
-                        "SELECT freq FROM dictionary WHERE bpmf = ? AND word = ?", 
-                        (char_bpmf, char)
-                    )
-                    row = self.cursor.fetchone()
-                    
-                    if row:
-                        # 如果存在，分數增加 (代表這個字出現頻率更高)
-                        new_freq = row[0] + 1000 
-                        self.cursor.execute(
-                            "UPDATE dictionary SET freq = ? WHERE bpmf = ? AND word = ?",
-                            (new_freq, char_bpmf, char)
-                        )
-                    else:
-                        # 如果是新字，給予 5000 基礎分
-                        self.cursor.execute('''
-                            INSERT INTO dictionary (bpmf, word, freq, is_custom)
-                            VALUES (?, ?, ?, 1)
-                        ''', (char_bpmf, char, 5000))
-
-            # 2. 完整詞彙學習 (給予極高權重，但也隨教導次數增加)
-            full_bpmf = "".join([s.replace('ˉ', '').strip() for s in bpmf_list])
-            
+    def _read_cursor(self):
+        """ 取得目前執行緒專用的讀取 cursor，寫入仍集中在 self.conn """
+        if self.db_path == ':memory:':
+            return self.cursor
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # close() 會在其他執行緒關閉這些連線
+            conn = self._local.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            conn.set_trace_callback(_count_sql)
+            with self._readers_lock:
+                self._readers.append(conn)
+        return conn.cursor()
+
+    def _flush_loop(self):
+        while not self._closing.is_set():
+            self.writes.ready.wait(self.flush_interval)
+            self.flush()
+
+    def flush(self):
+        """ 立即將延遲佇列寫入資料庫 """
+        with self._write_lock, metrics.timer('bpmf_flush_seconds'):
+            return self.writes.flush(self.conn)
+
+    def close(self):
+        """ 停止背景寫入、寫完剩餘回饋後關閉連線 """
+        self._closing.set()
+        self.writes.ready.set()
+        self._flusher.join()
+        self.flush()
+        # 讀取連線都關閉後，最後關閉的寫入連線才能完整 checkpoint WAL
+        with self._readers_lock:
+            readers, self._readers = self._readers, []
+        for conn in readers:
+            conn.close()
+        self.conn.close()
+
+    def load_index(self):
+        """ 啟動時將整個字典 (與無聲調索引) 載入記憶體，之後查詢不再經過 SQL """
+        snapshot = self._open_snapshot(self.snapshot_path)
+        if snapshot is not None:
+            # 快照以 mmap 直接使用，只需重播快照之後的變更
+            self.index = OverlayIndex(snapshot)
+            toneless = self._open_snapshot(toneless_path(self.snapshot_path))
+            # 從資料庫重建的無聲調索引已含快照之後的變更，只有對應的無聲調快照才需要重播
+            replay_toneless = toneless is not None and toneless.mark == snapshot.mark
+            if replay_toneless:
+                self.toneless = TonelessIndex(OverlayIndex(toneless))
+            else:
+                self._load_toneless()
             self.cursor.execute(
-                "SELECT freq FROM dictionary WHERE bpmf = ? AND word = ?", 
-                (full_bpmf, word)
+                "SELECT bpmf, word, freq FROM dictionary_changes WHERE id > ? ORDER BY id",
+                (snapshot.mark,)
             )
-            row_word = self.cursor.fetchone()
-            
-            if row_word:
-                new_word_freq = row_word[0] + 5000
-                self.cursor.execute(
-                    "UPDATE dictionary SET freq = ? WHERE bpmf = ? AND word = ?",
-                    (new_word_freq, full_bpmf, word)
-                )
+            for bpmf, word, freq in self.cursor.fetchall():
+                old = self.index.get(bpmf, word)
+                if freq is None:
+                    self.index.remove(bpmf, word)
+                else:
+                    self.index.set(bpmf, word, freq)
+                if replay_toneless:
+                    self.toneless.change(bpmf, word, old, freq)
+            return
+
+        self.index = BpmfTrie()
+        self.cursor.execute("SELECT bpmf, word, freq FROM dictionary")
+        self.index.load(self.cursor)
+        self._load_toneless()
+
+    def _load_toneless(self):
+        self.toneless = TonelessIndex()
+        self.cursor.execute("SELECT bpmf, word, freq FROM dictionary")
+        self.toneless.load(self.cursor)
+
+    def load_guild_overlays(self):
+        """ 載入各伺服器的字典異動，每個伺服器一層疊在共用索引上的 OverlayIndex """
+        self.guild_indexes = {}
+        self.guild_toneless = {}
+        self.cursor.execute("SELECT guild_id, bpmf, word, freq FROM guild_dictionary ORDER BY guild_id")
+        for guild_id, bpmf, word, freq in self.cursor.fetchall():
+            self._guild_set(guild_id, bpmf, word, freq)
+
+    def _index_for(self, guild_id):
+        """ 查詢用索引：有異動的伺服器走自己的異動層，其他直接查共用索引 """
+        return self.guild_indexes.get(guild_id, self.index)
+
+    def _toneless_for(self, guild_id):
+        return self.guild_toneless.get(guild_id, self.toneless)
+
+    def _guild_set(self, guild_id, bpmf, word, freq):
+        """ 設定伺服器異動層的字詞權重 (None 為刪除)，該伺服器的無聲調異動層一併調整 """
+        overlay = self.guild_indexes.get(guild_id)
+        if overlay is None:
+            overlay = self.guild_indexes[guild_id] = OverlayIndex(self.index)
+            self.guild_toneless[guild_id] = TonelessIndex(OverlayIndex(self.toneless.index))
+        old = overlay.get(bpmf, word)
+        if freq is None:
+            overlay.remove(bpmf, word)
+        else:
+            overlay.set(bpmf, word, freq)
+        self.guild_toneless[guild_id].change(bpmf, word, old, freq)
+
+    def _open_snapshot(self, path):
+        """ 開啟字典快照；不存在或已過期 (大量匯入、變更記錄已被更新的快照清掉) 時回傳 None """
+        if not path or not os.path.exists(path):
+            return None
+        try:
+            snapshot = SnapshotIndex(path)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ 無法開啟字典快照，改從資料庫載入: {e}")
+            return None
+        if snapshot.epoch != read_meta(self.conn, 'epoch') or snapshot.mark < read_meta(self.conn, 'pruned_through'):
+            print("⚠️ 字典快照已過期，改從資料庫載入 (請重新執行 python dict_tool.py snapshot)")
+            return None
+        return snapshot
+
+    def add_word(self, word, bpmf_list, guild_id=GLOBAL_SCOPE):
+        """ 強化權重邏輯：完整詞高權重，單字權重隨學習次數累積 (guild_id 不為 0 時只寫入該伺服器) """
+        # 1. 單字拆解分類 (權重累加制)
+        if len(word) == len(bpmf_list):
+            for i in range(len(word)):
+                char = word[i]
+                char_bpmf = bpmf_list[i].replace('ˉ', '').strip()
+
+                # 如果存在，分數增加 (代表這個字出現頻率更高)；如果是新字，給予 5000 基礎分
+                if not self._adjust(char_bpmf, char, 1000, guild_id):
+                    self._insert(char_bpmf, char, 5000, guild_id)
+
+        # 2. 完整詞彙學習 (給予極高權重，但也隨教導次數增加)
+        full_bpmf = "".join([s.replace('ˉ', '').strip() for s in bpmf_list])
+        if not self._adjust(full_bpmf, word, 5000, guild_id):
+            self._insert(full_bpmf, word, 900000, guild_id)
+        return True
+
+    def _adjust(self, bpmf, word, delta, guild_id=GLOBAL_SCOPE):
+        """ 調整既有字詞的權重，回傳該字詞是否存在 """
+        if guild_id == GLOBAL_SCOPE:
+            old = self.index.get(bpmf, word)
+            if old is None:
+                return False
+            self.index.add(bpmf, word, delta)
+            self.toneless.change(bpmf, word, old, old + delta)
+            self.writes.add_delta(bpmf, word, delta)
+        else:
+            # 伺服器層第一次碰到共用字典的詞時複製一份，之後只改自己的副本
+            old = self._index_for(guild_id).get(bpmf, word)
+            if old is None:
+                return False
+            self._guild_set(guild_id, bpmf, word, old + delta)
+            self.writes.set_freq(bpmf, word, old + delta, guild_id)
+        self.generation += 1
+        return True
+
+    def _insert(self, bpmf, word, freq, guild_id=GLOBAL_SCOPE):
+        if guild_id == GLOBAL_SCOPE:
+            self.toneless.change(bpmf, word, self.index.get(bpmf, word), freq)
+            self.index.set(bpmf, word, freq)
+        else:
+            self._guild_set(guild_id, bpmf, word, freq)
+        self.generation += 1
+        self.writes.set_freq(bpmf, word, freq, guild_id)
+
+    def convert(self, bopomofo_segs, guild_id=GLOBAL_SCOPE):
+        """ 翻譯邏輯：整句詞圖取最佳路徑 """
+        return self.decode(bopomofo_segs, 1, guild_id)[0][0]
+
+    def decode(self, bopomofo_segs, k=3, guild_id=GLOBAL_SCOPE, session=None):
+        """ 回傳最佳翻譯與其他候選 [(text, score, path)]，供回饋介面使用
+
+        session 為同一則訊息 (或合併訊息) 的識別碼，訊息被編輯時沿用上次的詞圖。
+        """
+        # 沒有異動的伺服器共用同一份快取結果
+        scope = guild_id if guild_id in self.guild_indexes else GLOBAL_SCOPE
+        key = (tuple(bopomofo_segs), k, scope)
+        generation = self.generation
+        results = self.translation_cache.get(key, generation)
+        if results is None:
+            if session is None:
+                results = decode_lattice(self._index_for(scope), bopomofo_segs, k,
+                                         toneless=self._toneless_for(scope))
             else:
-                self.cursor.execute('''
-                    INSERT INTO dictionary (bpmf, word, freq, is_custom)
-                    VALUES (?, ?, ?, 1)
-                ''', (full_bpmf, word, 900000))
-            
-            self.conn.commit()
-            return True
-        except Exception as e:
-            print(f"❌ SQL 權重更新失敗: {e}")
-            self.conn.rollback()
-            return False
+                # 字典異動過或換了範圍的舊詞圖不能沿用
+                previous = self.lattice_cache.get(session, (generation, scope))
+                results, state = decode_incremental(self._index_for(scope), bopomofo_segs, previous, k,
+                                                    toneless=self._toneless_for(scope))
+                self.lattice_cache.put(session, state, (generation, scope))
+            self.translation_cache.put(key, results, generation)
+        return results
+
+    def convert_many(self, segs_list, guild_id=GLOBAL_SCOPE):
+        """ 批次翻譯：重複的輸入只算一次，同一批共用字典查詢結果，逐一產生 (輸入位置, 翻譯) """
+        scope = guild_id if guild_id in self.guild_indexes else GLOBAL_SCOPE
+        positions = {}
+        for i, segs in enumerate(segs_list):
+            positions.setdefault(tuple(segs), []).append(i)
+
+        generation = self.generation
+        index = toneless = None
+        for segs, where in positions.items():
+            key = (segs, 1, scope)
+            results = self.translation_cache.get(key, generation)
+            if results is None:
+                if index is None:
+                    index = MemoIndex(self._index_for(scope))
+                    toneless = MemoIndex(self._toneless_for(scope))
+                results = decode_lattice(index, segs, 1, toneless=toneless)
+                self.translation_cache.put(key, results, generation)
+            for i in where:
+                yield i, results[0][0]
 
-    def convert(self, bopomofo_segs):
-        """ 翻譯邏輯：SQL 查詢 """
-        clean_segs = [s.replace('ˉ', '').strip() for s in bopomofo_segs]
-        n, i, result = len(clean_segs), 0, []
-
-        while i < n:
-            match_found = False
-            # 長詞優先 (最大嘗試 8 個音)
-            for length in range(8, 0, -1):
-                if i + length <= n:
-                    combined = "".join(clean_segs[i:i+length])
-                    # 查詢該音對應的最長詞或最高頻詞
-                    self.cursor.execute('''
-                        SELECT word FROM dictionary 
-                        WHERE bpmf = ? 
-                        ORDER BY length(word) DESC, freq DESC 
-                        LIMIT 1
-                    ''', (combined,))
-                    row = self.cursor.fetchone()
-                    if row:
-                        result.append(row[0])
-                        i += length
-                        match_found = True
-                        break
-            if not match_found:
-                result.append(f"({bopomofo_segs[i]})")
-                i += 1
-        return "".join(result)
-    def get_candidates(self, bpmf):
-        """ 查詢某個注音底下的候選字與權重 """
+    def segment(self, text):
+        """ 帶快取的 segment_ascii，回傳 (ascii 切分, 注音切分) """
+        segments = self.segment_cache.get(text)
+        if segments is None:
+            ascii_segs, bopomofo_segs = segment_ascii(text)
+            segments = (tuple(ascii_segs), tuple(bopomofo_segs))
+            self.segment_cache.put(text, segments)
+        return segments
+
+    def cache_stats(self):
+        """ 快取命中與未命中統計 """
+        return {
+            'generation': self.generation,
+            'guild_overlays': len(self.guild_indexes),
+            'pending_writes': len(self.writes),
+            'segment': self.segment_cache.stats(),
+            'translation': self.translation_cache.stats(),
+            'lattice': self.lattice_cache.stats(),
+        }
+
+    def get_candidates(self, bpmf, guild_id=GLOBAL_SCOPE):
+        """ 查詢某個注音底下的候選字與權重 (先看該伺服器的異動，再看共用字典) """
         clean_bpmf = bpmf.replace('ˉ', '').strip()
-        self.cursor.execute(
-            "SELECT word, freq FROM dictionary WHERE bpmf = ? ORDER BY freq DESC LIMIT 10",
-            (clean_bpmf,)
-        )
-        return self.cursor.fetchall()
+        # 查記憶體索引，尚未寫入資料庫的回饋也看得到
+        return self._index_for(guild_id).candidates(clean_bpmf, 10)
 
-    def delete_word(self, word, bpmf):
-        """ 刪除特定的字詞對應 """
+    def complete(self, prefix, limit=25, guild_id=GLOBAL_SCOPE):
+        """ 指令自動完成：以 prefix (注音) 開頭、權重最高的 [(注音, word, freq)]，每個注音一筆 """
+        clean_prefix = prefix.replace('ˉ', '').replace(' ', '')
+        return self._index_for(guild_id).complete(clean_prefix, limit)
+
+    def delete_word(self, word, bpmf, guild_id=GLOBAL_SCOPE):
+        """ 刪除特定的字詞對應 (guild_id 不為 0 時只對該伺服器隱藏) """
         clean_bpmf = bpmf.replace('ˉ', '').strip()
-        self.cursor.execute(
-            "DELETE FROM dictionary WHERE bpmf = ? AND word = ?",
-            (clean_bpmf, word)
-        )
-        self.conn.commit()
-        return self.cursor.rowcount > 0  # 回傳是否有刪除成功
+        if guild_id == GLOBAL_SCOPE:
+            old = self.index.get(clean_bpmf, word)
+            if not self.index.remove(clean_bpmf, word):
+                return False  # 回傳是否有刪除成功
+            self.toneless.change(clean_bpmf, word, old, None)
+        elif self._index_for(guild_id).get(clean_bpmf, word) is not None:
+            self._guild_set(guild_id, clean_bpmf, word, None)
+        else:
+            return False
+        self.generation += 1
+        self.writes.delete(clean_bpmf, word, guild_id)
+        return True
 
-    def add_ignore_pattern(self, pattern):
-        """ 新增忽略模式，該模式將不會被翻譯 """
-        try:
+    def add_ignore_pattern(self, pattern, guild_id=GLOBAL_SCOPE):
+        """ 新增忽略模式，該模式將不會被翻譯 (guild_id 為 0 時全域生效，不分大小寫) """
+        pattern = pattern.lower()
+        with self._write_lock:
+            try:
+                self.cursor.execute(
+                    "INSERT OR IGNORE INTO ignore_patterns (guild_id, pattern) VALUES (?, ?)",
+                    (guild_id, pattern)
+                )
+                self.conn.commit()
+            except Exception as e:
+                print(f"❌ 新增忽略模式失敗: {e}")
+                self.conn.rollback()
+                return False
+        self.ignores.add(pattern, guild_id)
+        return True
+
+    def is_ignored(self, content, guild_id=GLOBAL_SCOPE):
+        """ 檢查整則訊息是否符合全域或該伺服器的忽略模式 """
+        return self.ignores.match(content, guild_id)
+
+    def ignored_spans(self, content, guild_id=GLOBAL_SCOPE):
+        """ 訊息中被忽略的範圍 [(start, end)]，整則被忽略時為 [(0, len(content))] """
+        return self.ignores.spans(content, guild_id)
+
+    def remove_ignore_pattern(self, pattern, guild_id=GLOBAL_SCOPE):
+        """ 移除忽略模式；與 /ignores 列出的範圍相同，伺服器內也能移除全域模式 (舊版搬移過來的都是全域) """
+        pattern = pattern.lower()
+        with self._write_lock:
             self.cursor.execute(
-                "INSERT OR IGNORE INTO ignore_patterns (pattern) VALUES (?)",
-                (pattern,)
+                "SELECT guild_id FROM ignore_patterns WHERE guild_id IN (0, ?) AND pattern = ?",
+                (guild_id, pattern)
+            )
+            scopes = [row[0] for row in self.cursor.fetchall()]
+            self.cursor.execute(
+                "DELETE FROM ignore_patterns WHERE guild_id IN (0, ?) AND pattern = ?",
+                (guild_id, pattern)
             )
             self.conn.commit()
-            return True
-        except Exception as e:
-            print(f"❌ 新增忽略模式失敗: {e}")
-            self.conn.rollback()
-            return False
+        for scope in scopes:
+            self.ignores.remove(pattern, scope)
+        return bool(scopes)
 
-    def is_ignored(self, pattern):
-        """ 檢查指定模式是否在忽略列表中 """
-        self.cursor.execute(
-            "SELECT pattern FROM ignore_patterns WHERE pattern = ?",
-            (pattern,)
+    def list_ignore_patterns(self, guild_id=GLOBAL_SCOPE):
+        """ 列出該伺服器可見的忽略模式 (含全域) """
+        cursor = self._read_cursor()
+        cursor.execute(
+            "SELECT DISTINCT pattern FROM ignore_patterns WHERE guild_id IN (0, ?) ORDER BY pattern",
+            (guild_id,)
         )
-        return self.cursor.fetchone() is not None
+        return [row[0] for row in cursor.fetchall()]
 
-    def remove_ignore_pattern(self, pattern):
-        """ 移除忽略模式 """
-        self.cursor.execute(
-            "DELETE FROM ignore_patterns WHERE pattern = ?",
-            (pattern,)
-        )
-        self.conn.commit()
-        return self.cursor.rowcount > 0
+    def get_backfill_progress(self, channel_id):
+        """ 回傳 (before_id, scanned, [(message_id, author_id)] 回覆標記)，沒有記錄時回傳 None """
+        cursor = self._read_cursor()
+        cursor.execute("SELECT before_id, scanned FROM backfill_progress WHERE channel_id = ?", (channel_id,))
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        cursor.execute("SELECT message_id, author_id FROM backfill_replied WHERE channel_id = ?", (channel_id,))
+        return row[0], row[1], cursor.fetchall()
+
+    def save_backfill_progress(self, channel_id, before_id, scanned, replied=()):
+        """ 記錄掃描進度與回覆標記，before_id 為 None 時清除記錄 (下次從最新的訊息開始) """
+        with self._write_lock:
+            self.cursor.execute("DELETE FROM backfill_replied WHERE channel_id = ?", (channel_id,))
+            if before_id is None:
+                self.cursor.execute("DELETE FROM backfill_progress WHERE channel_id = ?", (channel_id,))
+            else:
+                self.cursor.execute('''
+                    INSERT INTO backfill_progress (channel_id, before_id, scanned) VALUES (?, ?, ?)
+                    ON CONFLICT (channel_id) DO UPDATE SET before_id = excluded.before_id, scanned = excluded.scanned
+                ''', (channel_id, before_id, scanned))
+                self.cursor.executemany(
+                    "INSERT OR IGNORE INTO backfill_replied (channel_id, message_id, author_id) VALUES (?, ?, ?)",
+                    [(channel_id, message_id, author_id) for message_id, author_id in replied]
+                )
+            self.conn.commit()
+        return True
+
+    # --- 定期維護 (由 dict_maintenance 經寫入佇列分批呼叫) ---
+    def get_meta(self, key, default=0):
+        return read_meta(self._read_cursor(), key, default)
+
+    def set_meta(self, key, value):
+        with self._write_lock:
+            write_meta(self.conn, key, value)
+            self.conn.commit()
+        return True
 
-    def list_ignore_patterns(self):
-        """ 列出所有忽略模式 """
-        self.cursor.execute("SELECT pattern FROM ignore_patterns ORDER BY pattern")
-        return [row[0] for row in self.cursor.fetchall()]
+    def decay_batch(self, after_rowid, factor, threshold, batch_size=2000):
+        """ 處理 rowid 在 after_rowid 之後的 batch_size 筆手動學習 (is_custom = 1) 的詞：權重乘上 factor
+        (None 為不衰減)，低於 threshold 的刪除；匯入的詞庫 (如 tsi.src 權重 0 的詞) 不受影響。
+        記憶體索引一併更新並寫入變更記錄，字典快照重播時也會套用。
 
-    def increase_weight(self, word, bpmf):
+        回傳 (這批最後的 rowid, 衰減筆數, 刪除筆數)，已沒有資料時 rowid 為 None。
+        """
+        with self._write_lock:
+            cursor = self.conn.cursor()
+            cursor.execute(
+                "SELECT rowid, bpmf, word, freq FROM dictionary WHERE rowid > ? AND is_custom = 1 "
+                "ORDER BY rowid LIMIT ?",
+                (after_rowid, batch_size)
+            )
+            rows = cursor.fetchall()
+            if not rows:
+                return None, 0, 0
+
+            deltas, deletes = [], []
+            for _, bpmf, word, freq in rows:
+                # 記憶體的權重包含還在延遲佇列中的回饋，以它為準判斷
+                current = self.index.get(bpmf, word)
+                if current is None:
+                    continue
+                delta = 0
+                if factor is not None and freq > 0:
+                    delta = int(freq * factor) - freq
+                if current + delta < threshold:
+                    self.index.remove(bpmf, word)
+                    self.toneless.change(bpmf, word, current, None)
+                    deletes.append((bpmf, word))
+                elif delta:
+                    self.index.add(bpmf, word, delta)
+                    self.toneless.change(bpmf, word, current, current + delta)
+                    deltas.append((delta, bpmf, word))
+
+            cursor.executemany("DELETE FROM dictionary WHERE bpmf = ? AND word = ?", deletes)
+            cursor.executemany("UPDATE dictionary SET freq = freq + ? WHERE bpmf = ? AND word = ?", deltas)
+            # 變更記錄存寫入後的權重 (已刪除則為 NULL)，與延遲寫入佇列相同
+            cursor.executemany('''
+                INSERT INTO dictionary_changes (bpmf, word, freq)
+                VALUES (?, ?, (SELECT freq FROM dictionary WHERE bpmf = ? AND word = ?))
+            ''', [(bpmf, word, bpmf, word) for bpmf, word in deletes]
+                 + [(bpmf, word, bpmf, word) for _, bpmf, word in deltas])
+            self.conn.commit()
+        if deltas or deletes:
+            self.generation += 1
+        return rows[-1][0], len(deltas), len(deletes)
+
+    def decay_guild_batch(self, after_rowid, factor, threshold, batch_size=2000):
+        """ 與 decay_batch 相同，處理各伺服器的異動 guild_dictionary：
+
+        共用字典也有的詞只衰減伺服器與共用權重的差距，差距歸零時刪除該列，回到共用字典的權重；
+        低於 threshold 時改成刪除標記 (共用字典也沒有時直接刪除該列)，
+        共用字典已不存在的詞的刪除標記也一併清除。記憶體中的伺服器異動層一併更新。
+
+        回傳 (這批最後的 rowid, 衰減筆數, 刪除筆數)，已沒有資料時 rowid 為 None。
+        """
+        with self._write_lock:
+            # 伺服器層存的是絕對權重，先寫完佇列中的回饋，避免之後被舊的權重覆蓋
+            self.writes.flush(self.conn)
+            cursor = self.conn.cursor()
+            cursor.execute(
+                "SELECT rowid, guild_id, bpmf, word, freq FROM guild_dictionary WHERE rowid > ? "
+                "ORDER BY rowid LIMIT ?",
+                (after_rowid, batch_size)
+            )
+            rows = cursor.fetchall()
+            if not rows:
+                return None, 0, 0
+
+            updates, deletes, pruned = [], [], 0
+            for _, guild_id, bpmf, word, freq in rows:
+                base = self.index.get(bpmf, word)
+                if freq is None:
+                    if base is None:
+                        deletes.append((guild_id, bpmf, word))  # 共用字典已刪除，標記沒有作用
+                        pruned += 1
+                    continue
+                new = freq
+                if factor is not None:
+                    new = (base or 0) + int((freq - (base or 0)) * factor)
+                if new < threshold:
+                    if base is None:
+                        deletes.append((guild_id, bpmf, word))
+                    else:
+                        updates.append((None, guild_id, bpmf, word))
+                    self._guild_set(guild_id, bpmf, word, None)
+                    pruned += 1
+                elif base is not None and new == base:
+                    deletes.append((guild_id, bpmf, word))
+                    self._guild_set(guild_id, bpmf, word, base)
+                elif new != freq:
+                    updates.append((new, guild_id, bpmf, word))
+                    self._guild_set(guild_id, bpmf, word, new)
+
+            cursor.executemany("DELETE FROM guild_dictionary WHERE guild_id = ? AND bpmf = ? AND word = ?", deletes)
+            cursor.executemany(
+                "UPDATE guild_dictionary SET freq = ? WHERE guild_id = ? AND bpmf = ? AND word = ?", updates
+            )
+            self.conn.commit()
+        if updates or deletes:
+            self.generation += 1
+        return rows[-1][0], len(updates) + len(deletes) - pruned, pruned
+
+    def trim_journal(self, batch_size=5000):
+        """ 沒有使用快照時變更記錄已用不到，分批刪除並記下 pruned_through，讓舊快照自動失效 """
+        if isinstance(self.index, OverlayIndex):
+            return 0  # 快照之後的變更記錄在下次編譯快照時才會清除
+        with self._write_lock:
+            cursor = self.conn.cursor()
+            cursor.execute("SELECT id FROM dictionary_changes ORDER BY id LIMIT 1 OFFSET ?", (batch_size - 1,))
+            row = cursor.fetchone()
+            if row is None:
+                cursor.execute("SELECT max(id) FROM dictionary_changes")
+                row = cursor.fetchone()
+            if row[0] is None:
+                return 0
+            cursor.execute("DELETE FROM dictionary_changes WHERE id <= ?", (row[0],))
+            deleted = cursor.rowcount
+            write_meta(self.conn, 'pruned_through', max(row[0], read_meta(self.conn, 'pruned_through')))
+            self.conn.commit()
+        return deleted
+
+    def incremental_vacuum(self, pages=200):
+        """ 歸還最多 pages 個空白頁，回傳剩餘的空白頁數；資料庫不是 incremental 模式時回傳 None """
+        with self._write_lock:
+            cursor = self.conn.cursor()
+            if cursor.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+                return None
+            self.conn.commit()
+            cursor.execute(f"PRAGMA incremental_vacuum({int(pages)})").fetchall()
+            return cursor.execute("PRAGMA freelist_count").fetchone()[0]
+
+    def analyze(self, table, limit=1000):
+        """ 以抽樣 (每個索引最多看 limit 列) 更新單一資料表的查詢統計 """
+        with self._write_lock:
+            self.conn.commit()
+            self.conn.execute(f"PRAGMA analysis_limit={int(limit)}")
+            self.conn.execute(f"ANALYZE {table}")
+            self.conn.commit()
+        return True
+
+    def increase_weight(self, word, bpmf, guild_id=GLOBAL_SCOPE):
         """ 增加翻譯權重 """
         clean_bpmf = bpmf.replace('ˉ', '').strip()
-        self.cursor.execute(
-            "UPDATE dictionary SET freq = freq + 1000 WHERE bpmf = ? AND word = ?",
-            (clean_bpmf, word)
-        )
-        self.conn.commit()
-        return self.cursor.rowcount > 0
+        return self._adjust(clean_bpmf, word, 1000, guild_id)
 
-    def decrease_weight(self, word, bpmf):
+    def decrease_weight(self, word, bpmf, guild_id=GLOBAL_SCOPE):
         """ 降低翻譯權重 """
         clean_bpmf = bpmf.replace('ˉ', '').strip()
-        self.cursor.execute(
-            "UPDATE dictionary SET freq = freq - 1000 WHERE bpmf = ? AND word = ?",
-            (clean_bpmf, word)
-        )
-        self.conn.commit()
-        return self.cursor.rowcount > 0
\ No newline at end of file
+        return self._adjust(clean_bpmf, word, -1000, guild_id)
\ No newline at end of file
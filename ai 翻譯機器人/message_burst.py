@@ -0,0 +1,101 @@
+"""
+連續訊息合併與編輯追蹤 (不依賴 discord，訊息只需有 id 與 content)
+
+同一作者在同一頻道短時間內連續送出的亂碼，等到 window 秒內沒有新訊息才合併成一次翻譯、一則回覆；
+之後任何一則被編輯，都以同一個 Burst 重新翻譯並修改原本的回覆。
+"""
+import asyncio
+
+# 一組合併訊息從第一則算起最多等待的秒數
+MAX_DELAY = 3.0
+
+
+class Burst:
+    """ 合併成一次翻譯的一組訊息，以及機器人對它的回覆 """
+
+    def __init__(self, messages):
+        self.messages = list(messages)
+        self.reply = None           # 機器人的回覆訊息，尚未回覆或已刪除時為 None
+        self.lock = asyncio.Lock()  # 同一組訊息的翻譯與回覆依序處理
+
+    @property
+    def session(self):
+        """ 傳給引擎的詞圖識別碼 (第一則訊息的 id) """
+        return self.messages[0].id
+
+    @property
+    def content(self):
+        return " ".join(message.content.strip() for message in self.messages)
+
+    def replace(self, message):
+        """ 以編輯後的訊息取代同 id 的舊訊息 """
+        for i, old in enumerate(self.messages):
+            if old.id == message.id:
+                self.messages[i] = message
+                return True
+        return False
+
+
+class BurstCoalescer:
+    """ 以 (頻道, 作者) 為鍵的防抖動合併：window 秒內沒有新訊息才呼叫 handler(key, messages)
+
+    連續不斷的訊息最多等待 max_delay 秒就會先處理已收到的部分。
+    """
+
+    def __init__(self, handler, window=0.6, max_delay=MAX_DELAY):
+        self.handler = handler
+        self.window = window
+        self.max_delay = max_delay
+        self._pending = {}  # key -> (第一則訊息的時間, [messages])
+        self._timers = {}
+        self._tasks = set()
+
+    def __len__(self):
+        return len(self._pending)
+
+    def submit(self, key, message):
+        loop = asyncio.get_running_loop()
+        pending = self._pending.get(key)
+        if pending is None:
+            pending = self._pending[key] = (loop.time(), [])
+        pending[1].append(message)
+        self._schedule(key)
+
+    def replace(self, key, message):
+        """ 編輯仍在等待合併的訊息：換成新內容並重新計時，不在等待中時回傳 False """
+        pending = self._pending.get(key)
+        if pending is None:
+            return False
+        for i, old in enumerate(pending[1]):
+            if old.id == message.id:
+                pending[1][i] = message
+                self._schedule(key)
+                return True
+        return False
+
+    def flush(self, key):
+        """ 立刻處理 key 等待中的訊息 (例如同一作者送出了一般訊息) """
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        pending = self._pending.pop(key, None)
+        if pending is not None:
+            task = asyncio.create_task(self.handler(key, pending[1]))
+            self._tasks.add(task)
+            task.add_done_callback(self._done)
+
+    def _done(self, task):
+        # 背景任務沒有人 await，例外在這裡印出，不會無聲無息地消失
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            e = task.exception()
+            print(f"❌ 合併訊息處理失敗: {type(e).__name__}: {e}")
+
+    def _schedule(self, key):
+        loop = asyncio.get_running_loop()
+        timer = self._timers.get(key)
+        if timer is not None:
+            timer.cancel()
+        first = self._pending[key][0]
+        delay = max(0.0, min(self.window, first + self.max_delay - loop.time()))
+        self._timers[key] = loop.call_later(delay, self.flush, key)
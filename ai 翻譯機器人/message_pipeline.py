@@ -0,0 +1,165 @@
+import asyncio
+import contextlib
+import re
+import time
+from collections import namedtuple
+from bpmf_converter import is_bopomofo_scramble
+from bpmf_classifier import scramble_spans, is_untoned_scramble
+from metrics import metrics
+
+_PURE_ENGLISH = re.compile(r'[A-Za-z\s]+')
+
+# 前三項與舊版回傳的 (bopomofo_segs, 最佳翻譯, 其他候選) 相同；
+# scramble 為實際翻譯的原文，sentence 為中英混雜訊息把翻譯代回原句的結果 (整則都是亂碼時為 None)
+Translation = namedtuple('Translation', 'bopomofo_segs text alternatives scramble sentence')
+
+def has_chinese(text):
+    """ 是否包含中文字 """
+    return any('\u4e00' <= char <= '\u9fff' for char in text)
+
+def prefilter(content):
+    """ 不查字典的快速過濾：不可能是亂碼時回傳原因 ('english' 或 'not_scramble')，否則回傳 None """
+    # 智慧過濾：只有真正的純英文單詞（不含數字）才不翻；整則都能切成音節的是沒打聲調的亂碼
+    if _PURE_ENGLISH.fullmatch(content) and not any(char.isdigit() for char in content) \
+            and not is_untoned_scramble(content):
+        return 'english'
+    if not is_bopomofo_scramble(content):
+        return 'not_scramble'
+    return None
+
+async def translate_message(engine, classifier, content, guild_id=0, session=None):
+    """ on_message 的翻譯流程 (不依賴 discord，方便離線測量)
+
+    不需要回覆時回傳 None，否則回傳 Translation。整則不像亂碼時改找句中的亂碼片段，只翻譯那幾段；
+    符合忽略模式的單字 (例如人名) 跳過，其餘的亂碼照常翻譯。
+    engine 為 AsyncBpmfEngine (或相同介面的物件)。各階段耗時與結果記錄在 metrics。
+    session 為訊息識別碼，同一則訊息被編輯後再翻譯時可沿用上次的詞圖。
+    """
+    timer = time.perf_counter
+    t0 = timer()
+    reason = prefilter(content)
+    if reason is not None:
+        metrics.observe('bpmf_stage_seconds', timer() - t0, stage='filter')
+        return _record(reason, t0)
+
+    # 先用合法音節比例快速過濾網址、程式碼、數字等一般訊息，不做任何字典查詢
+    t1 = timer()
+    _, bopomofo_segs = engine.segment(content)
+    t2 = timer()
+    accepted = classifier.accept(content, bopomofo_segs)
+    t3 = timer()
+    metrics.observe('bpmf_stage_seconds', t2 - t1, stage='segment')
+    metrics.observe('bpmf_stage_seconds', (t1 - t0) + (t3 - t2), stage='filter')
+    reason, spans = await _select_spans(engine, content, accepted, guild_id, _stage_timer)
+    if reason is not None:
+        return _record(reason, t0)
+    if spans is not None:
+        return await _translate_spans(engine, content, spans, guild_id, session, t0)
+
+    with metrics.timer('bpmf_stage_seconds', stage='convert'):
+        results = await engine.decode(bopomofo_segs, 3, guild_id, session)
+    final_text = results[0][0]
+
+    # 只要結果包含中文字就回覆
+    if not has_chinese(final_text):
+        return _record('no_chinese', t0)
+    alternatives = [text for text, _, _ in results[1:] if has_chinese(text)]
+    _record('translated', t0)
+    return Translation(bopomofo_segs, final_text, alternatives, content, None)
+
+
+async def _select_spans(engine, content, accepted, guild_id, timer):
+    """ 分類之後 translate_message 與 detect_scramble 共用的流程，回傳 (不翻譯的原因, 要翻譯的片段)
+
+    整則不像亂碼時改找句中的亂碼片段；忽略模式整則符合就不翻譯，只有部分單字符合時跳過那幾個字。
+    整則翻譯時片段為 None。timer(stage) 回傳計時用的 context manager。
+    """
+    spans = None
+    if not accepted:
+        with timer('spans'):
+            spans = scramble_spans(content)
+        if not spans:
+            return 'rejected', None
+
+    with timer('is_ignored'):
+        ignored = await engine.ignored_spans(content, guild_id)
+    if ignored == [(0, len(content))]:
+        return 'ignored', None
+    if ignored:
+        with timer('spans'):
+            spans = scramble_spans(content, ignored=ignored)
+    if spans is None:
+        return None, None
+
+    # 由數個單字組成的片段也可能整段符合忽略模式 (同一輪送出，字典服務會合併成一批)
+    with timer('is_ignored'):
+        skip = await asyncio.gather(*(engine.is_ignored(content[start:end].strip().lower(), guild_id)
+                                      for start, end, _ in spans))
+    spans = [span for span, ignored_span in zip(spans, skip) if not ignored_span]
+    if not spans:
+        return 'ignored', None
+    return None, spans
+
+
+def _stage_timer(stage):
+    return metrics.timer('bpmf_stage_seconds', stage=stage)
+
+
+def _untimed(stage):
+    return contextlib.nullcontext()
+
+
+async def _translate_spans(engine, content, spans, guild_id, session, t0):
+    """ 中英混雜的訊息：各片段分別解碼 (同一輪送出，字典服務會合併成一批) """
+    # 只有一段時才列出其他候選，多段的組合沒有意義
+    k = 3 if len(spans) == 1 else 1
+    with metrics.timer('bpmf_stage_seconds', stage='convert'):
+        decoded = await asyncio.gather(*(
+            engine.decode(segs, k, guild_id, None if session is None else f"{session}:{i}")
+            for i, (_, _, segs) in enumerate(spans)
+        ))
+
+    pieces, scrambles, texts, all_segs, pos = [], [], [], [], 0
+    for (start, end, segs), results in zip(spans, decoded):
+        text = results[0][0]
+        if not has_chinese(text):
+            continue  # 翻不出中文的片段保留原文
+        end = start + len(content[start:end].rstrip())
+        pieces += [content[pos:start], text]
+        pos = end
+        scrambles.append(content[start:end])
+        texts.append(text)
+        all_segs += segs
+    if not texts:
+        return _record('no_chinese', t0)
+    pieces.append(content[pos:])
+
+    alternatives = []
+    if len(spans) == 1:
+        alternatives = [text for text, _, _ in decoded[0][1:] if has_chinese(text)]
+    _record('translated_spans', t0)
+    return Translation(tuple(all_segs), "".join(texts), alternatives, " ".join(scrambles), "".join(pieces))
+
+
+async def detect_scramble(engine, classifier, content, guild_id=0):
+    """ 與 translate_message 相同的過濾條件 (不翻譯、不計入效能統計)
+
+    是亂碼時回傳要翻譯的各段注音切分 [bopomofo_segs]，整則都是亂碼時只有一段，否則回傳 None。
+    """
+    if prefilter(content) is not None:
+        return None
+    _, bopomofo_segs = engine.segment(content)
+    accepted = classifier.accept(content, bopomofo_segs)
+    reason, spans = await _select_spans(engine, content, accepted, guild_id, _untimed)
+    if reason is not None:
+        return None
+    if spans is None:
+        return [bopomofo_segs]
+    return [segs for _, _, segs in spans]
+
+
+def _record(result, start):
+    """ 記錄訊息結果與流程總耗時，回傳 None 方便直接 return """
+    metrics.inc('bpmf_messages_total', result=result)
+    metrics.observe('bpmf_pipeline_seconds', time.perf_counter() - start)
+    return None
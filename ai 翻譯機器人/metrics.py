@@ -0,0 +1,247 @@
+"""
+熱路徑計量：計數器、延遲直方圖與即時量測值，可輸出 Prometheus 文字格式
+
+    from metrics import metrics
+    with metrics.timer('bpmf_stage_seconds', stage='segment'):
+        ...
+    metrics.inc('bpmf_messages_total', result='translated')
+
+每次記錄只有一次 perf_counter 與一次 bisect，可常駐開啟。
+"""
+import asyncio
+import bisect
+import collections
+import sys
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+
+# 延遲直方圖的上界 (秒)
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+                   0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+def _label_text(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{v}"' for k, v in labels) + '}'
+
+
+class Histogram:
+    """ 固定區間的延遲直方圖 """
+    __slots__ = ('buckets', 'counts', 'count', 'sum')
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # 最後一格為 +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        """ 以區間上界估計分位數 (秒)，沒有資料時回傳 0 """
+        if not self.count:
+            return 0.0
+        target, seen = q * self.count, 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= target:
+                return self.buckets[i] if i < len(self.buckets) else float('inf')
+        return float('inf')
+
+
+class Metrics:
+    """ 行程內的計量登錄表 """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = collections.defaultdict(int)   # (name, labels) -> 數值
+        self.histograms = {}                           # (name, labels) -> Histogram
+        self.gauges = {}                               # (name, labels) -> 無參數函式
+        self.help = {}
+
+    def describe(self, name, text):
+        self.help[name] = text
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] += value
+
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def gauge(self, name, func, **labels):
+        """ 登錄即時量測值，輸出時才呼叫 func() 取值 """
+        self.gauges[(name, tuple(sorted(labels.items())))] = func
+
+    def counter_value(self, name, **labels):
+        return self.counters.get((name, tuple(sorted(labels.items()))), 0)
+
+    def counter_values(self, name):
+        """ 某個計數器所有標籤組合的數值 {labels: value} """
+        with self._lock:
+            return {labels: value for (n, labels), value in self.counters.items() if n == name}
+
+    def histogram(self, name, **labels):
+        return self.histograms.get((name, tuple(sorted(labels.items()))))
+
+    def render_prometheus(self):
+        """ 輸出 Prometheus 文字格式 (text/plain; version=0.0.4) """
+        with self._lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted((key, (h.buckets, list(h.counts), h.count, h.sum))
+                                for key, h in self.histograms.items())
+        lines, typed = [], set()
+
+        def header(name, kind):
+            if name not in typed:
+                typed.add(name)
+                if name in self.help:
+                    lines.append(f"# HELP {name} {self.help[name]}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), value in counters:
+            header(name, 'counter')
+            lines.append(f"{name}{_label_text(labels)} {value}")
+
+        for (name, labels), func in sorted(self.gauges.items(), key=lambda item: item[0]):
+            try:
+                value = func()
+            except Exception:
+                continue
+            header(name, 'gauge')
+            lines.append(f"{name}{_label_text(labels)} {value}")
+
+        for (name, labels), (buckets, counts, count, total) in histograms:
+            header(name, 'histogram')
+            cumulative = 0
+            for bound, n in zip(buckets + (float('inf'),), counts):
+                cumulative += n
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f"{name}_bucket{_label_text(labels + (('le', le),))} {cumulative}")
+            lines.append(f"{name}_sum{_label_text(labels)} {total}")
+            lines.append(f"{name}_count{_label_text(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+metrics.describe('bpmf_stage_seconds', "on_message 各階段耗時")
+metrics.describe('bpmf_pipeline_seconds', "翻譯流程整體耗時 (不含 Discord 回覆)")
+metrics.describe('bpmf_message_seconds', "on_message 整體耗時 (含 Discord 回覆)")
+metrics.describe('bpmf_messages_total', "處理過的訊息數 (依結果分類)")
+metrics.describe('bpmf_sql_statements_total', "執行的 SQL 敘述數")
+metrics.describe('bpmf_flush_seconds', "延遲寫入佇列每次提交的耗時")
+metrics.describe('bpmf_burst_merged_total', "併入前一則一起翻譯、省下的訊息數")
+metrics.describe('bpmf_edit_retranslations_total', "因訊息編輯而重新翻譯的次數")
+
+
+async def serve_metrics(port, host='127.0.0.1', registry=metrics):
+    """ 在本機連接埠提供 Prometheus 抓取端點 (任何路徑都回傳全部計量) """
+
+    async def handle(reader, writer):
+        try:
+            # 只需讀完請求標頭，內容不重要
+            while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                pass
+            body = registry.render_prometheus().encode('utf-8')
+            writer.write(b"HTTP/1.1 200 OK\r\n"
+                         b"Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                         b"Content-Length: " + str(len(body)).encode() + b"\r\n"
+                         b"Connection: close\r\n\r\n" + body)
+            await writer.drain()
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, host, port)
+    print(f"📈 Prometheus 計量端點: http://{host}:{port}/metrics")
+    return server
+
+
+# 最內層落在這些檔案的堆疊視為閒置 (等待事件或工作)，不列入取樣
+_IDLE_FILES = ('threading.py', 'queue.py', 'selectors.py', 'thread.py', 'base_events.py')
+
+
+class SlowMessageSampler:
+    """ 慢訊息取樣分析：背景執行緒定時抓所有執行緒 (事件迴圈與讀取執行緒池) 的呼叫堆疊，
+    訊息耗時超過門檻時印出處理期間最常出現的堆疊 """
+
+    def __init__(self, threshold=0.25, interval=0.005, history=5000, top=5):
+        self.threshold = threshold
+        self.interval = interval
+        self.top = top
+        self._samples = collections.deque(maxlen=history)  # (時間, 堆疊)
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='bpmf-sampler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            now = time.perf_counter()
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own or frame.f_code.co_filename.endswith(_IDLE_FILES):
+                    continue
+                stack = tuple(f"{fs.filename.rsplit('/', 1)[-1]}:{fs.lineno} {fs.name}"
+                              for fs in traceback.extract_stack(frame, limit=8))
+                self._samples.append((now, stack))
+
+    def report(self, label, start, end):
+        """ 訊息處理完畢時呼叫；超過門檻才印出期間的取樣結果 """
+        if end - start < self.threshold:
+            return None
+        counter = collections.Counter(stack for t, stack in list(self._samples) if start <= t <= end)
+        lines = [f"🐢 慢訊息 {(end - start) * 1000:.0f}ms: {label!r} ({sum(counter.values())} 個取樣)"]
+        for stack, n in counter.most_common(self.top):
+            lines.append(f"   {n:>4}× " + " ← ".join(reversed(stack[-3:])))
+        text = "\n".join(lines)
+        print(text)
+        return text
+
+
+def register_engine_gauges(engine, registry=metrics):
+    """ 以 engine.cache_stats() 提供快取命中率與寫入佇列深度 (缺少的項目輸出時略過) """
+
+    def stat(*path):
+        def read():
+            value = engine.cache_stats()
+            for key in path:
+                value = value[key]
+            return value
+        return read
+
+    for cache in ('segment', 'translation'):
+        registry.gauge('bpmf_cache_hit_ratio', stat(cache, 'hit_rate'), cache=cache)
+        registry.gauge('bpmf_cache_entries', stat(cache, 'size'), cache=cache)
+    registry.gauge('bpmf_pending_writes', stat('pending_writes'))
+    registry.gauge('bpmf_writer_queue_depth', stat('writer_queue'))
+    registry.gauge('bpmf_guild_overlays', stat('guild_overlays'))
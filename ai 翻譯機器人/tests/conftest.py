@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 專案模組是平放在上一層目錄的獨立檔案 (bot.py 也是這樣匯入)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
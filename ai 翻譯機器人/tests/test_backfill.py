@@ -0,0 +1,85 @@
+import asyncio
+from types import SimpleNamespace
+
+from async_engine import AsyncBpmfEngine
+from backfill import backfill_channel
+from bpmf_classifier import ScrambleClassifier
+from local_engine import BpmfEngine
+
+BOT_ID, ALICE, BOB = 1, 2, 3
+
+
+def _id(ms):
+    """ 以毫秒時間產生 Discord 格式的訊息 id """
+    return ms << 22
+
+
+def _message(ms, author, content, reply_to=None):
+    return SimpleNamespace(
+        id=_id(ms), content=content, author=SimpleNamespace(id=author, bot=author == BOT_ID),
+        reference=SimpleNamespace(message_id=_id(reply_to)) if reply_to is not None else None,
+    )
+
+
+class _Channel:
+    """ 只實作 history(limit, before) 的頻道替身，訊息由新到舊回傳 """
+
+    id = 42
+
+    def __init__(self, messages):
+        self.messages = sorted(messages, key=lambda message: message.id, reverse=True)
+
+    async def history(self, limit, before=None):
+        count = 0
+        for message in self.messages:
+            if before is not None and message.id >= before.id:
+                continue
+            if count == limit:
+                return
+            count += 1
+            yield message
+
+
+def _backfill(tmp_path, channel, runs, patterns=(), texts=False):
+    async def run():
+        engine = AsyncBpmfEngine(BpmfEngine(str(tmp_path / 'dictionary.db')))
+        await engine.start()
+        await engine.add_word("你好", ["ㄋㄧˇ", "ㄏㄠˇ"])
+        for pattern in patterns:
+            await engine.add_ignore_pattern(pattern)
+        found = []
+        for limit in runs:
+            missed, _, _ = await backfill_channel(engine, ScrambleClassifier(), channel, BOT_ID,
+                                                  limit=limit, page_size=2, page_delay=0)
+            found += [(message.id >> 22, text) if texts else message.id >> 22 for message, text in missed]
+        await engine.close()
+        return found
+
+    return asyncio.run(run())
+
+
+def test_resumed_run_remembers_replies_and_bursts(tmp_path):
+    channel = _Channel([
+        _message(1000, BOB, "su3cl3"),                  # 真的漏翻
+        _message(50000, ALICE, "su3cl3"),               # 合併訊息的前兩則
+        _message(50500, ALICE, "su3cl3"),
+        _message(51000, ALICE, "su3cl3"),               # 機器人回覆的是最後一則
+        _message(60000, BOB, "hello there"),
+        _message(60500, BOB, "hi"),
+        _message(61000, BOT_ID, "翻譯", reply_to=51000),
+    ])
+    # 每次只掃兩則，回覆與被回覆的訊息分散在不同次執行
+    assert _backfill(tmp_path, channel, [2, 2, 2, 2]) == [1000]
+
+
+def test_mixed_and_partly_ignored_messages_are_found(tmp_path):
+    channel = _Channel([
+        _message(1000, BOB, "lol su3cl3 see you"),
+        _message(2000, BOB, "alice su3cl3"),
+        _message(3000, BOB, "su3cl3 alice"),
+        _message(4000, BOB, "su3cl3 see https://example.com su3cl3"),
+        _message(5000, BOB, "alice"),
+    ])
+    assert sorted(_backfill(tmp_path, channel, [10], ["alice"], texts=True)) == [
+        (1000, "你好"), (2000, "你好"), (3000, "你好"), (4000, "你好你好"),
+    ]
@@ -0,0 +1,44 @@
+from bpmf_classifier import ScrambleClassifier, scramble_spans
+from bpmf_segmenter import segment_ascii
+
+
+def _accept(classifier, text):
+    return classifier.accept(text, segment_ascii(text)[1])
+
+
+def test_threshold_on_valid_syllable_ratio():
+    classifier = ScrambleClassifier()
+    assert classifier.score("su3cl3", segment_ascii("su3cl3")[1]) == 1.0
+    assert classifier.score("su3cl3 xx", segment_ascii("su3cl3 xx")[1]) == 0.75
+    assert _accept(classifier, "su3cl3")
+    assert not _accept(classifier, "su3cl3 xx")     # 0.75 低於預設門檻 0.8
+    assert not _accept(classifier, "hello")
+    assert not _accept(classifier, "")
+    assert classifier.stats() == {'checked': 4, 'rejected': 3, 'rejection_rate': 0.75}
+
+    assert _accept(ScrambleClassifier(threshold=0.75), "su3cl3 xx")
+
+
+def _texts(text, **options):
+    return [text[start:end] for start, end, _ in scramble_spans(text, **options)]
+
+
+def test_spans_drop_surrounding_english_words():
+    assert _texts("lol su3cl3 see you") == ["su3cl3"]
+    assert _texts("su cl3 yes") == ["cl3"]            # 聲調鍵之前以空白隔開的純字母字剔除
+    assert _texts("su3cl3 and su3cl3") == ["su3cl3", "su3cl3"]
+    assert _texts("ok lol") == []                     # 沒有任何數字或標點按鍵
+
+
+def test_spans_break_at_masked_ranges():
+    assert _texts("see <@123> su3cl3") == ["su3cl3"]
+    assert _texts("`su3cl3` and vu,4") == ["vu,4"]
+    assert _texts("https://su3cl3.tw vu,4") == ["vu,4"]
+    assert _texts("alice su3cl3", ignored=[(0, 5)]) == ["su3cl3"]
+    assert _texts("su3cl3", ignored=[(0, 3)]) == ["cl3"]
+
+
+def test_single_syllable_and_digit_only_runs():
+    assert _texts("g4 ok") == ["g4"]                  # 單一音節要有聲調鍵
+    assert _texts("ok cl ok") == []
+    assert _texts("call me at 12345") == []           # 全是數字的片段不算
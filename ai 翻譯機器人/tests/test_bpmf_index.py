@@ -0,0 +1,28 @@
+from bpmf_index import BpmfTrie
+
+
+class _RacingWords(dict):
+    """ 讀取端複製 words 之後，立刻執行一次「其他執行緒」的寫入 """
+
+    def __init__(self, words, write):
+        super().__init__(words)
+        self.write = write
+
+    def items(self):
+        items = list(super().items())
+        write, self.write = self.write, None
+        if write is not None:
+            write()
+        return items
+
+
+def test_ranking_computed_during_a_write_is_not_cached():
+    trie = BpmfTrie()
+    trie.set("ㄇㄚ", "媽", 5000)
+    trie.set("ㄇㄚ", "麻", 3000)
+    node = trie.node("ㄇㄚ")
+    node.words = _RacingWords(node.words, lambda: trie.remove("ㄇㄚ", "媽"))
+
+    assert node.top(1) == [("媽", 5000)]  # 寫入前複製的舊排序
+    assert node.top(2) == [("麻", 3000)]
+    assert trie.candidates("ㄇㄚ") == [("麻", 3000)]
@@ -0,0 +1,35 @@
+from bpmf_segmenter import _scan, key_to_ascii, segment_ascii, segment_spans
+
+
+def test_s_initial_starts_a_new_syllable():
+    assert segment_spans("nj4") == [(0, 3, "ㄙㄨˋ")]
+    assert segment_ascii("sun") == (["su", "n"], ["ㄋㄧ", "ㄙ"])
+    assert segment_ascii("sunj4") == (["su", "nj4"], ["ㄋㄧ", "ㄙㄨˋ"])
+
+
+def test_neutral_tone_closes_the_syllable():
+    assert segment_ascii("ru7") == (["ru7"], ["ㄐㄧ˙"])
+    assert segment_ascii("a87su3") == (["a87", "su3"], ["ㄇㄚ˙", "ㄋㄧˇ"])
+
+
+def test_key_to_ascii_restores_first_tone_spaces():
+    assert key_to_ascii("ㄋㄧˇㄏㄠˇ") == "su3cl3"
+    assert key_to_ascii("ㄋㄧㄏㄠ") == "su cl"
+    assert key_to_ascii("ㄇㄚ˙") == "a87"
+    assert key_to_ascii("ㄙㄨˋ") == "nj4"
+
+
+def test_scan_state_machine_edges():
+    assert _scan("") == []
+    assert _scan("ˇ") == []                              # 沒有字時單獨的聲調略過
+    assert _scan("ㄋㄧˇˇㄏ") == [(0, 3), (4, 5)]          # 多出的聲調略過，結尾未完成的音節也算一個字
+    assert _scan("ㄋㄧ!ㄏㄠ") == [(0, 2), (3, 5)]         # 其他字元結束當前的字
+    assert _scan("ㄧㄚ") == [(0, 2)]                     # 零聲母由韻母開始
+    assert _scan("ㄅㄆ") == [(0, 1), (1, 2)]             # 連續的聲母各自成字
+
+
+def test_spans_index_the_original_text():
+    text = "SU3 cl"
+    spans = segment_spans(text)
+    assert spans == [(0, 3, "ㄋㄧˇ"), (4, 6, "ㄏㄠ")]
+    assert [text[start:end] for start, end, _ in spans] == ["SU3", "cl"]
@@ -0,0 +1,57 @@
+import random
+
+from bpmf_decoder import decode_incremental, decode_lattice
+from bpmf_index import BpmfTrie
+from bpmf_syllables import SYLLABLES
+from bpmf_toneless import TonelessIndex
+
+_SYLLABLES = sorted(SYLLABLES)[:40]
+_TONES = ("ˉ", "ˊ", "ˇ", "ˋ")
+
+
+def _random_segs(rng, n):
+    return [rng.choice(_SYLLABLES) + rng.choice(_TONES) for _ in range(n)]
+
+
+def _indexes(rng, size=400):
+    rows = []
+    for _ in range(size):
+        segs = _random_segs(rng, rng.randint(1, 4))
+        word = "".join(chr(0x4e00 + rng.randrange(2000)) for _ in segs)
+        rows.append(("".join(s.replace('ˉ', '') for s in segs), word, rng.randint(1, 1000)))
+    index = BpmfTrie()
+    index.load(rows)
+    toneless = TonelessIndex()
+    toneless.load(rows)
+    return index, toneless
+
+
+def _edit(rng, segs):
+    """ 隨機插入、刪除或替換一段音節 """
+    segs = list(segs)
+    start = rng.randint(0, len(segs))
+    end = min(len(segs), start + rng.randint(0, 3))
+    segs[start:end] = _random_segs(rng, rng.randint(0, 3))
+    return segs
+
+
+def test_incremental_matches_full_decode_over_edit_sequences():
+    rng = random.Random(42)
+    index, toneless = _indexes(rng)
+    for _ in range(200):
+        segs = _random_segs(rng, rng.randint(1, 20))
+        state = None
+        for _ in range(6):
+            results, state = decode_incremental(index, segs, state, 3, toneless=toneless)
+            assert results == decode_lattice(index, segs, 3, toneless=toneless)
+            segs = _edit(rng, segs)
+
+
+def test_repeated_edits_of_long_message():
+    rng = random.Random(1)
+    index, toneless = _indexes(rng)
+    base = _random_segs(rng, 12)
+    state = None
+    for segs in (base, base + _random_segs(rng, 1), base[:10] + _random_segs(rng, 3)):
+        results, state = decode_incremental(index, segs, state, 3, toneless=toneless)
+        assert results == decode_lattice(index, segs, 3, toneless=toneless)
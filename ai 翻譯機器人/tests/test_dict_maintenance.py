@@ -0,0 +1,84 @@
+import asyncio
+import sqlite3
+import time
+
+from async_engine import AsyncBpmfEngine
+from dict_maintenance import HALF_LIFE_DAYS, run_maintenance
+from local_engine import BpmfEngine
+
+
+def test_maintenance_decays_and_prunes_only_learned_words(tmp_path):
+    db_path = str(tmp_path / 'dictionary.db')
+    conn = sqlite3.connect(db_path)
+    BpmfEngine.init_schema(conn)
+    conn.executemany("INSERT INTO dictionary (bpmf, word, freq, is_custom) VALUES (?, ?, ?, ?)", [
+        ("ㄧㄉㄧㄥㄅㄨˋㄕˋ", "一丁不識", 0, 0),   # 匯入的詞庫，權重 0
+        ("ㄇㄚ", "媽", 5000, 0),
+        ("ㄋㄧˇ", "你", 8000, 1),
+        ("ㄏㄠˇ", "好", 0, 1),
+    ])
+    conn.execute("INSERT INTO meta (key, value) VALUES ('decayed_at', ?)",
+                 (int(time.time()) - HALF_LIFE_DAYS * 86400,))
+    conn.commit()
+    conn.close()
+
+    async def run():
+        engine = AsyncBpmfEngine(BpmfEngine(db_path))
+        await engine.start()
+        stats = await run_maintenance(engine, pause=0)
+        await engine.close()
+        return stats
+
+    stats = asyncio.run(run())
+    assert (stats['decayed'], stats['pruned']) == (1, 1)
+    conn = sqlite3.connect(db_path)
+    rows = dict(conn.execute("SELECT word, freq FROM dictionary").fetchall())
+    conn.close()
+    assert rows == {"一丁不識": 0, "媽": 5000, "你": 4000}
+
+
+def test_maintenance_decays_and_prunes_guild_overlays(tmp_path):
+    db_path = str(tmp_path / 'dictionary.db')
+    conn = sqlite3.connect(db_path)
+    BpmfEngine.init_schema(conn)
+    conn.executemany("INSERT INTO dictionary (bpmf, word, freq, is_custom) VALUES (?, ?, ?, ?)", [
+        ("ㄇㄚ", "媽", 5000, 0),
+        ("ㄇㄚ", "麻", 3000, 0),
+        ("ㄇㄚ", "嗎", 1000, 0),
+    ])
+    conn.executemany("INSERT INTO guild_dictionary (guild_id, bpmf, word, freq) VALUES (?, ?, ?, ?)", [
+        (7, "ㄇㄚ", "媽", 9000),      # 回饋加過分：差距減半
+        (7, "ㄇㄚ", "麻", 3001),      # 差距衰減後歸零：回到共用權重
+        (7, "ㄇㄚ", "嗎", -1000),     # 扣到 1 以下：改成刪除標記
+        (7, "ㄋㄧˇ", "你", 8000),     # 只有伺服器學過：整個權重減半
+        (7, "ㄏㄠˇ", "好", 1),        # 減半後低於 1：刪除
+        (7, "ㄇㄚˊ", "蟆", None),     # 共用字典沒有的詞的刪除標記：清除
+    ])
+    conn.execute("INSERT INTO meta (key, value) VALUES ('decayed_at', ?)",
+                 (int(time.time()) - HALF_LIFE_DAYS * 86400,))
+    conn.commit()
+    conn.close()
+
+    async def run():
+        engine = AsyncBpmfEngine(BpmfEngine(db_path))
+        await engine.start()
+        stats = await run_maintenance(engine, pause=0)
+        memory = [await engine.get_candidates(bpmf, 7) for bpmf in ("ㄇㄚ", "ㄋㄧˇ", "ㄏㄠˇ")]
+        await engine.close()
+        return stats, memory
+
+    stats, memory = asyncio.run(run())
+    assert (stats['decayed'], stats['pruned']) == (3, 3)
+    assert [list(map(tuple, candidates)) for candidates in memory] == [
+        [("媽", 7000), ("麻", 3000)], [("你", 4000)], []
+    ]
+    conn = sqlite3.connect(db_path)
+    rows = {(bpmf, word): freq for bpmf, word, freq in
+            conn.execute("SELECT bpmf, word, freq FROM guild_dictionary WHERE guild_id = 7").fetchall()}
+    conn.close()
+    assert rows == {("ㄇㄚ", "媽"): 7000, ("ㄇㄚ", "嗎"): None, ("ㄋㄧˇ", "你"): 4000}
+
+    # 重新啟動後從 guild_dictionary 重建的結果相同
+    engine = BpmfEngine(db_path)
+    assert engine.get_candidates("ㄇㄚ", 7) == [("媽", 7000), ("麻", 3000)]
+    engine.close()
@@ -0,0 +1,44 @@
+import sqlite3
+
+import pytest
+
+from dict_tool import READERS, export_rows, import_rows
+from local_engine import BpmfEngine
+
+ROWS = [
+    ("ㄋㄧˇㄏㄠˇ", "你好", 900000, 1),
+    ("ㄋㄧˇ", "你", 5000, 1),
+    ("ㄋㄧˇ", "妳", 3000, 0),
+    ("ㄇㄚ", "媽", 0, 0),
+    ("ㄇㄚ˙", "嗎", -1000, 0),
+]
+
+
+def _connect(path):
+    return sqlite3.connect(str(path), isolation_level=None)  # 與 dict_tool main 相同
+
+
+def _dictionary(conn):
+    return sorted(conn.execute("SELECT bpmf, word, freq, is_custom FROM dictionary").fetchall())
+
+
+@pytest.mark.parametrize('fmt', ['tsv', 'json', 'jsonl'])
+def test_export_then_import_round_trips(tmp_path, fmt):
+    source = _connect(tmp_path / 'source.db')
+    BpmfEngine.init_schema(source)
+    source.executemany("INSERT INTO dictionary (bpmf, word, freq, is_custom) VALUES (?, ?, ?, ?)", ROWS)
+    path = tmp_path / f'backup.{fmt}'
+    with open(path, 'w', encoding='utf-8') as f:
+        assert export_rows(source, f, fmt) == len(ROWS)
+    source.close()
+
+    target = _connect(tmp_path / 'target.db')
+    with open(path, encoding='utf-8') as f:
+        assert import_rows(target, READERS[fmt](f), chunk_size=2) == len(ROWS)
+    restored = _dictionary(target)
+    target.close()
+    if fmt == 'tsv':
+        # tsv 只有注音、詞與權重，匯入後都當成詞庫
+        assert restored == sorted((bpmf, word, freq, 0) for bpmf, word, freq, _ in ROWS)
+    else:
+        assert restored == sorted(ROWS)
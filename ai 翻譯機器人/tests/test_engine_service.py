@@ -0,0 +1,122 @@
+import asyncio
+
+import pytest
+
+from async_engine import AsyncBpmfEngine
+from engine_service import EngineClient, EngineServer
+from local_engine import BpmfEngine
+
+
+class _Service:
+    """ 在暫存的 Unix socket 上啟動字典服務，測試以 EngineClient 當作分片行程的客戶端 """
+
+    def __init__(self, tmp_path):
+        self.socket_path = str(tmp_path / 'engine.sock')
+        self.engine = AsyncBpmfEngine(BpmfEngine(str(tmp_path / 'dictionary.db')))
+        self.server = EngineServer(self.engine, self.socket_path)
+
+    async def __aenter__(self):
+        await self.engine.start()
+        await self.server.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.server.close()
+        await self.engine.close()
+
+
+def _run(coro):
+    return asyncio.run(coro)
+
+
+def test_decode_round_trip(tmp_path):
+    async def run():
+        async with _Service(tmp_path) as service:
+            client = EngineClient(service.socket_path, connect_timeout=2)
+            assert await client.add_word("你好", ["ㄋㄧˇ", "ㄏㄠˇ"])
+            _, segs = client.segment("su3cl3")
+            remote = await client.decode(segs, 3, 0, 'session')
+            local = await service.engine.decode(segs, 3)
+            await client.close()
+            return remote, local
+
+    remote, local = _run(run())
+    assert remote[0][0] == "你好"
+    # JSON 沒有 tuple，路徑以 list 傳回
+    assert remote == [[text, score, [list(step) for step in path]] for text, score, path in local]
+
+
+def test_calls_in_same_loop_iteration_share_one_frame(tmp_path):
+    async def run():
+        async with _Service(tmp_path) as service:
+            client = EngineClient(service.socket_path, connect_timeout=2)
+            await client.start()
+            writes = []
+            write = client._writer.write
+            client._writer.write = lambda data: (writes.append(data), write(data))
+            _, segs = client.segment("su3cl3")
+            results = await asyncio.gather(*(client.convert(segs) for _ in range(5)),
+                                           client.is_ignored("alice"))
+            await client.close()
+            return writes, results
+
+    writes, results = _run(run())
+    assert len(writes) == 1
+    assert len(results) == 6 and results[-1] is False
+
+
+def test_error_frames_raise_without_breaking_the_connection(tmp_path):
+    async def run():
+        async with _Service(tmp_path) as service:
+            client = EngineClient(service.socket_path, connect_timeout=2)
+            with pytest.raises(RuntimeError, match="不支援的方法"):
+                await client._call('close')
+            with pytest.raises(RuntimeError, match="TypeError"):
+                await client._call('decode')
+            result = await client.list_ignore_patterns()
+            await client.close()
+            return result
+
+    assert _run(run()) == []
+
+
+def test_client_reconnects_after_service_restart(tmp_path):
+    async def run():
+        async with _Service(tmp_path) as service:
+            client = EngineClient(service.socket_path, connect_timeout=2)
+            await client.add_ignore_pattern("alice")
+            await service.server.close()
+            await asyncio.sleep(0.05)
+            assert not client.connected
+            await service.server.start()
+            ignored = await client.is_ignored("alice")
+            await client.close()
+            return ignored
+
+    assert _run(run()) is True
+
+
+def test_ignored_spans_round_trip(tmp_path):
+    async def run():
+        async with _Service(tmp_path) as service:
+            client = EngineClient(service.socket_path, connect_timeout=2)
+            await client.add_ignore_pattern("alice")
+            spans = await client.ignored_spans("alice su3cl3")
+            await client.close()
+            return spans
+
+    assert _run(run()) == [(0, 5)]
+
+
+def test_backfill_progress_round_trip(tmp_path):
+    async def run():
+        async with _Service(tmp_path) as service:
+            client = EngineClient(service.socket_path, connect_timeout=2)
+            assert await client.get_backfill_progress(42) is None
+            await client.save_backfill_progress(42, 900, 100, [(800, 0), (700, 5)])
+            progress = await client.get_backfill_progress(42)
+            await client.close()
+            return progress
+
+    before_id, scanned, replied = _run(run())
+    assert (before_id, scanned, sorted(replied)) == (900, 100, [(700, 5), (800, 0)])
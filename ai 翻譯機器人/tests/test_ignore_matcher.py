@@ -0,0 +1,73 @@
+from ignore_matcher import IgnoreMatcher, unescape_pattern
+
+
+def test_spans_return_only_ignored_tokens():
+    matcher = IgnoreMatcher()
+    matcher.add("alice")
+    matcher.add("tom*", 7)
+    assert matcher.spans("Alice su3cl3") == [(0, 5)]
+    assert matcher.spans("su3cl3 tommy alice", 7) == [(7, 12), (13, 18)]
+    assert matcher.spans("su3cl3 tommy") == []
+    assert matcher.spans("alice") == [(0, 5)]
+    assert not matcher.match("alice su3cl3")
+    assert matcher.match("ALICE")
+
+
+def test_bare_star_matches_everything():
+    matcher = IgnoreMatcher()
+    matcher.add("*", 7)
+    assert matcher.match("su3cl3", 7)
+    assert matcher.spans("su3cl3 vu,4", 7) == [(0, 11)]
+    assert not matcher.match("su3cl3")
+    matcher.remove("*", 7)
+    assert not matcher.match("su3cl3", 7)
+
+
+def test_escaped_scramble_only_matches_itself():
+    import glob
+
+    matcher = IgnoreMatcher()
+    for scramble in ("su3*", "g4?", "a[b]"):
+        matcher.add(glob.escape(scramble))
+        assert matcher.match(scramble)
+    assert not matcher.match("su3cl3")
+    assert not matcher.match("g4x")
+    assert not matcher.match("ab")
+    for scramble in ("su3*", "g4?", "a[b]", "tom*", "su3cl3"):
+        assert unescape_pattern(glob.escape(scramble)) == scramble
+
+
+def test_concurrent_adds_are_never_lost_by_readers():
+    import sys
+    import threading
+
+    matcher = IgnoreMatcher()
+    stop = threading.Event()
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)  # 讓讀寫執行緒頻繁交錯
+
+    errors = []
+
+    def read():
+        while not stop.is_set():
+            try:
+                matcher.spans("tom1 j1hn a1ice su3cl3", 7)
+            except Exception as e:
+                errors.append(e)
+
+    readers = [threading.Thread(target=read) for _ in range(4)]
+    for reader in readers:
+        reader.start()
+    try:
+        for i in range(100):
+            matcher.add(f"p{i}*", 7)
+            matcher.add(f"g{i}?x", 7)
+            assert matcher.match(f"p{i}abc", 7)
+            assert matcher.match(f"g{i}zx", 7)
+    finally:
+        stop.set()
+        for reader in readers:
+            reader.join()
+        sys.setswitchinterval(interval)
+    assert errors == []
+    assert all(matcher.match(f"p{i}", 7) and matcher.match(f"g{i}.x", 7) for i in range(100))
@@ -0,0 +1,109 @@
+from local_engine import BpmfEngine
+
+
+def _engine(tmp_path, **options):
+    return BpmfEngine(str(tmp_path / 'dictionary.db'), **options)
+
+
+def _words(results):
+    return [word for _, _, word in results[0][2]]
+
+
+def test_guild_forget_hides_word_from_toneless_fallback(tmp_path):
+    engine = _engine(tmp_path)
+    engine.add_word("你好", ["ㄋㄧˇ", "ㄏㄠˇ"])
+    engine.delete_word("你好", "ㄋㄧˇㄏㄠˇ", guild_id=777)
+    toned = engine.segment("su3cl3")[1]
+    toneless = engine.segment("su cl ")[1]
+    for segs in (toned, toneless):
+        assert "你好" in _words(engine.decode(segs, 3))
+        assert "你好" not in _words(engine.decode(segs, 3, 777))
+    engine.close()
+
+    # 重新啟動後由 guild_dictionary 重建的異動層結果相同
+    engine = _engine(tmp_path)
+    assert "你好" not in _words(engine.decode(toneless, 3, 777))
+    assert "你好" in _words(engine.decode(toneless, 3))
+    engine.close()
+
+
+def test_snapshot_without_toneless_snapshot_counts_changes_once(tmp_path):
+    import os
+    import sqlite3
+
+    from dict_snapshot import build_snapshot, toneless_path
+    from bpmf_toneless import toneless_key
+
+    db_path = str(tmp_path / 'dictionary.db')
+    snapshot_path = str(tmp_path / 'dictionary.snap')
+    engine = BpmfEngine(db_path)
+    engine.add_word("你好", ["ㄋㄧˇ", "ㄏㄠˇ"])
+    engine.close()
+    conn = sqlite3.connect(db_path)
+    build_snapshot(conn, snapshot_path)
+    conn.close()
+
+    engine = BpmfEngine(db_path, snapshot_path=snapshot_path)
+    engine.increase_weight("你好", "ㄋㄧˇㄏㄠˇ")
+    engine.close()
+    os.unlink(toneless_path(snapshot_path))
+
+    engine = BpmfEngine(db_path, snapshot_path=snapshot_path)
+    assert engine.index.get("ㄋㄧˇㄏㄠˇ", "你好") == 901000
+    assert engine.toneless.index.get(toneless_key("ㄋㄧˇㄏㄠˇ"), "你好") == 901000
+    engine.close()
+
+
+def test_close_closes_reader_connections(tmp_path):
+    import os
+    import threading
+
+    engine = _engine(tmp_path)
+    engine.add_ignore_pattern("alice")
+    threads = [threading.Thread(target=engine.list_ignore_patterns) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(engine._readers) == 3
+    engine.close()
+    assert engine._readers == []
+    # 最後一個連線關閉時 SQLite 會 checkpoint 並刪除 WAL 檔
+    assert not os.path.exists(str(tmp_path / 'dictionary.db-wal'))
+
+
+def test_legacy_ignore_patterns_can_be_removed_from_a_guild(tmp_path):
+    import sqlite3
+
+    db_path = str(tmp_path / 'dictionary.db')
+    conn = sqlite3.connect(db_path)
+    conn.execute("CREATE TABLE ignore_patterns (pattern TEXT PRIMARY KEY)")
+    conn.executemany("INSERT INTO ignore_patterns (pattern) VALUES (?)", [('bob',), ('Carol',), ('carol',)])
+    conn.commit()
+    conn.close()
+
+    engine = BpmfEngine(db_path)
+    assert engine.list_ignore_patterns(123) == ['bob', 'carol']
+    assert engine.is_ignored('bob', 123)
+    assert engine.remove_ignore_pattern('bob', 123)
+    assert engine.remove_ignore_pattern('CAROL', 123)
+    assert engine.list_ignore_patterns(123) == []
+    assert not engine.is_ignored('bob', 123)
+    assert not engine.is_ignored('bob')
+    engine.close()
+
+    engine = BpmfEngine(db_path)
+    assert not engine.is_ignored('bob')
+    engine.close()
+
+
+def test_ignore_patterns_are_case_insensitive(tmp_path):
+    engine = _engine(tmp_path)
+    engine.add_ignore_pattern("Alice", 7)
+    engine.add_ignore_pattern("alice", 7)
+    assert engine.list_ignore_patterns(7) == ['alice']
+    assert engine.is_ignored('ALICE', 7)
+    assert engine.remove_ignore_pattern('alice', 7)
+    assert not engine.is_ignored('alice', 7)
+    assert engine.list_ignore_patterns(7) == []
+    engine.close()
@@ -0,0 +1,23 @@
+import asyncio
+from types import SimpleNamespace
+
+from message_burst import BurstCoalescer
+
+
+def test_handler_errors_are_logged(capsys):
+    handled = []
+
+    async def handler(key, messages):
+        handled.append([message.id for message in messages])
+        raise RuntimeError("boom")
+
+    async def run():
+        coalescer = BurstCoalescer(handler, window=0.01)
+        coalescer.submit('key', SimpleNamespace(id=1, content="su3"))
+        coalescer.submit('key', SimpleNamespace(id=2, content="cl3"))
+        await asyncio.sleep(0.05)
+        assert not coalescer._tasks
+
+    asyncio.run(run())
+    assert handled == [[1, 2]]
+    assert "RuntimeError: boom" in capsys.readouterr().out
@@ -0,0 +1,47 @@
+import asyncio
+
+from async_engine import AsyncBpmfEngine
+from bpmf_classifier import ScrambleClassifier
+from local_engine import BpmfEngine
+from message_pipeline import detect_scramble, translate_message
+
+
+def _translate(tmp_path, contents, patterns=()):
+    async def run():
+        engine = AsyncBpmfEngine(BpmfEngine(str(tmp_path / 'dictionary.db')))
+        await engine.start()
+        await engine.add_word("你好", ["ㄋㄧˇ", "ㄏㄠˇ"])
+        for pattern in patterns:
+            await engine.add_ignore_pattern(pattern)
+        classifier = ScrambleClassifier()
+        results = [(await translate_message(engine, classifier, content),
+                    await detect_scramble(engine, classifier, content)) for content in contents]
+        await engine.close()
+        return results
+
+    return asyncio.run(run())
+
+
+def test_ignored_word_is_skipped_not_the_whole_message(tmp_path):
+    mixed, middle, alone = _translate(tmp_path, ["alice su3cl3", "su3cl3 alice su3cl3", "alice"], ["alice"])
+    assert mixed[0].sentence == "alice 你好"
+    assert middle[0].sentence == "你好 alice 你好"
+    assert alone == (None, None)
+
+
+def test_whole_message_pattern_still_suppresses(tmp_path):
+    assert _translate(tmp_path, ["su3cl3"], ["su3*"]) == [(None, None)]
+
+
+def test_detect_scramble_finds_what_translate_message_translates(tmp_path):
+    nihao = ["ㄋㄧˇ", "ㄏㄠˇ"]
+    results = _translate(tmp_path, ["lol su3cl3 see you", "alice su3cl3", "su3cl3 alice", "su3cl3"], ["alice"])
+    for translation, parts in results:
+        assert translation.text == "你好"
+        assert [list(segs) for segs in parts] == [nihao]
+
+
+def test_untoned_letters_only_scrambles_pass_the_english_filter(tmp_path):
+    results = _translate(tmp_path, ["sucl", "su cl ", "su cl", "hello", "in", "cl"])
+    assert [translation.text for translation, _ in results[:3]] == ["你好"] * 3
+    assert results[3:] == [(None, None)] * 3
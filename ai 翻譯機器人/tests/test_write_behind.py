@@ -0,0 +1,76 @@
+import sqlite3
+
+from local_engine import BpmfEngine
+from write_behind import DELETE, DELTA, SET, WriteBehindQueue
+
+
+def _conn(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / 'dictionary.db'))
+    BpmfEngine.init_schema(conn)
+    conn.executemany("INSERT INTO dictionary (bpmf, word, freq, is_custom) VALUES (?, ?, ?, 0)", [
+        ("ㄋㄧˇ", "你", 5000), ("ㄏㄠˇ", "好", 5000), ("ㄇㄚ", "媽", 5000),
+    ])
+    conn.commit()
+    return conn
+
+
+def test_operations_on_the_same_word_are_coalesced(tmp_path):
+    queue = WriteBehindQueue()
+    queue.add_delta("ㄋㄧˇ", "你", 1000)
+    queue.add_delta("ㄋㄧˇ", "你", -300)
+    queue.set_freq("ㄋㄧˇㄏㄠˇ", "你好", 900000)
+    queue.add_delta("ㄋㄧˇㄏㄠˇ", "你好", 5000)
+    queue.delete("ㄇㄚ", "媽")
+    queue.add_delta("ㄇㄚ", "媽", 1000)        # 已刪除的詞不再調整
+    queue.delete("ㄏㄠˇ", "好")
+    queue.set_freq("ㄏㄠˇ", "好", 7000)        # 刪除後重新學習
+    queue.set_freq("ㄋㄧˇ", "你", 8000, 7)
+    queue.delete("ㄋㄧˇ", "你", 7)
+    assert len(queue) == 5
+    assert queue._pending == {
+        (0, "ㄋㄧˇ", "你"): (DELTA, 700),
+        (0, "ㄋㄧˇㄏㄠˇ", "你好"): (SET, 905000),
+        (0, "ㄇㄚ", "媽"): (DELETE,),
+        (0, "ㄏㄠˇ", "好"): (SET, 7000),
+        (7, "ㄋㄧˇ", "你"): (DELETE,),
+    }
+
+    conn = _conn(tmp_path)
+    assert queue.flush(conn) == 5
+    assert len(queue) == 0
+    assert dict(((bpmf, word), (freq, custom)) for bpmf, word, freq, custom in
+                conn.execute("SELECT bpmf, word, freq, is_custom FROM dictionary")) == {
+        ("ㄋㄧˇ", "你"): (5700, 0),
+        ("ㄋㄧˇㄏㄠˇ", "你好"): (905000, 1),
+        ("ㄏㄠˇ", "好"): (7000, 0),
+    }
+    # 變更記錄依佇列順序寫入，存的是寫入後的權重 (刪除為 NULL)
+    assert conn.execute("SELECT bpmf, word, freq FROM dictionary_changes ORDER BY id").fetchall() == [
+        ("ㄋㄧˇ", "你", 5700), ("ㄋㄧˇㄏㄠˇ", "你好", 905000), ("ㄇㄚ", "媽", None), ("ㄏㄠˇ", "好", 7000),
+    ]
+    assert conn.execute("SELECT guild_id, bpmf, word, freq FROM guild_dictionary").fetchall() == [
+        (7, "ㄋㄧˇ", "你", None),
+    ]
+    conn.close()
+
+
+def test_failed_flush_requeues_under_newer_operations(tmp_path):
+    queue = WriteBehindQueue()
+    queue.add_delta("ㄋㄧˇ", "你", 1000)
+    broken = sqlite3.connect(':memory:')  # 沒有資料表，寫入失敗
+    assert queue.flush(broken) == 0
+    queue.add_delta("ㄋㄧˇ", "你", 500)
+    assert queue._pending == {(0, "ㄋㄧˇ", "你"): (DELTA, 1500)}
+
+    conn = _conn(tmp_path)
+    assert queue.flush(conn) == 1
+    assert conn.execute("SELECT freq FROM dictionary WHERE word = '你'").fetchone() == (6500,)
+    conn.close()
+
+
+def test_flush_size_wakes_the_flusher():
+    queue = WriteBehindQueue(flush_size=2)
+    queue.add_delta("ㄋㄧˇ", "你", 1)
+    assert not queue.ready.is_set()
+    queue.add_delta("ㄏㄠˇ", "好", 1)
+    assert queue.ready.is_set()
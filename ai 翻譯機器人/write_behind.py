@@ -0,0 +1,102 @@
+import threading
+
+# 待寫入操作種類：delta 為權重增減、set 為新增 (或覆蓋) 權重、delete 為刪除
+DELTA, SET, DELETE = 'delta', 'set', 'delete'
+
+
+def _merge(old, new):
+    """ 合併同一個 (bpmf, word) 的兩個操作，new 發生在 old 之後 """
+    if old is None or new[0] != DELTA:
+        return new
+    if old[0] == DELTA:
+        return (DELTA, old[1] + new[1])
+    if old[0] == SET:
+        return (SET, old[1] + new[1])
+    return old  # 已刪除的詞不再調整權重
+
+
+class WriteBehindQueue:
+    """ 回饋與學習的延遲寫入佇列：同一詞的權重變化先在記憶體合併，再以單一交易批次寫入
+
+    guild_id 為 0 的操作寫入共用字典 dictionary；其他伺服器的操作寫入 guild_dictionary，
+    伺服器層一律存絕對權重 (SET)，刪除以 NULL 權重記錄。
+    """
+
+    def __init__(self, flush_size=500):
+        self.flush_size = flush_size
+        self._pending = {}
+        self._lock = threading.Lock()
+        self.ready = threading.Event()  # 累積到 flush_size 時通知背景執行緒提早寫入
+
+    def __len__(self):
+        return len(self._pending)
+
+    def _put(self, guild_id, bpmf, word, op):
+        with self._lock:
+            key = (guild_id, bpmf, word)
+            self._pending[key] = _merge(self._pending.get(key), op)
+            if len(self._pending) >= self.flush_size:
+                self.ready.set()
+
+    def add_delta(self, bpmf, word, delta, guild_id=0):
+        self._put(guild_id, bpmf, word, (DELTA, delta))
+
+    def set_freq(self, bpmf, word, freq, guild_id=0):
+        self._put(guild_id, bpmf, word, (SET, freq))
+
+    def delete(self, bpmf, word, guild_id=0):
+        self._put(guild_id, bpmf, word, (DELETE,))
+
+    def flush(self, conn):
+        """ 將目前累積的操作以一個交易寫入，失敗時放回佇列等待下次重試 """
+        with self._lock:
+            batch, self._pending = self._pending, {}
+            self.ready.clear()
+        if not batch:
+            return 0
+
+        deletes, sets, deltas, changed, guild_rows = [], [], [], [], []
+        for (guild_id, bpmf, word), op in batch.items():
+            if guild_id:
+                guild_rows.append((guild_id, bpmf, word, op[1] if op[0] == SET else None))
+                continue
+            changed.append((bpmf, word, bpmf, word))
+            if op[0] == DELETE:
+                deletes.append((bpmf, word))
+            elif op[0] == SET:
+                sets.append((bpmf, word, op[1]))
+            elif op[1]:
+                deltas.append((op[1], bpmf, word))
+
+        try:
+            cursor = conn.cursor()
+            cursor.executemany("DELETE FROM dictionary WHERE bpmf = ? AND word = ?", deletes)
+            cursor.executemany('''
+                INSERT INTO dictionary (bpmf, word, freq, is_custom)
+                VALUES (?, ?, ?, 1)
+                ON CONFLICT (bpmf, word) DO UPDATE SET freq = excluded.freq
+            ''', sets)
+            cursor.executemany(
+                "UPDATE dictionary SET freq = freq + ? WHERE bpmf = ? AND word = ?",
+                deltas
+            )
+            # 同一個交易寫入變更記錄 (寫入後的權重，已刪除則為 NULL)，供字典快照重播
+            cursor.executemany('''
+                INSERT INTO dictionary_changes (bpmf, word, freq)
+                VALUES (?, ?, (SELECT freq FROM dictionary WHERE bpmf = ? AND word = ?))
+            ''', changed)
+            cursor.executemany('''
+                INSERT INTO guild_dictionary (guild_id, bpmf, word, freq)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT (guild_id, bpmf, word) DO UPDATE SET freq = excluded.freq
+            ''', guild_rows)
+            conn.commit()
+        except Exception as e:
+            print(f"❌ 批次寫入失敗，稍後重試: {e}")
+            conn.rollback()
+            with self._lock:
+                for key, op in self._pending.items():
+                    batch[key] = _merge(batch.get(key), op)
+                self._pending = batch
+            return 0
+        return len(batch)